@@ -1,8 +1,11 @@
 import ctypes
+import hashlib
 import json
 import logging
+import os
 import threading
 import time
+from datetime import datetime
 from pathlib import Path
 from typing import Callable
 
@@ -11,6 +14,20 @@ from ctypes import wintypes
 import pyautogui
 from pynput import keyboard, mouse
 
+from key_taps import TAP_EVENT_TYPES, KeyEventCollapser, tap_press_events
+from metrics import increment, observe, timed
+from mouse_path import (
+    DEFAULT_PATH_EPSILON,
+    DEFAULT_PATH_MAX_POINTS,
+    MOUSE_PATH_SAMPLE_INTERVAL,
+    PATH_IDLE_SPLIT,
+    path_position,
+    simplify_path,
+)
+from recording_journal import EventBuffer
+from tracing import add_span, now as trace_now, span
+from workspace import composite_item_paths, format_unresolved, get_workspace, refresh_workspace, resolve_config_path
+
 
 _SCREEN_SIZE: tuple[int, int] = (2560, 1600)
 _SCREEN_OFFSET: tuple[int, int] = (0, 0)
@@ -45,10 +62,181 @@ def _coords_relative_to_absolute(x_rel: float, y_rel: float) -> tuple[int, int]:
     )
 
 
+def _region_relative_to_absolute(region: list | tuple | None) -> tuple[int, int, int, int] | None:
+    """Convert a relative [x1, y1, x2, y2] region to absolute screen pixels."""
+    if not region:
+        return None
+    x1, y1 = _coords_relative_to_absolute(float(region[0]), float(region[1]))
+    x2, y2 = _coords_relative_to_absolute(float(region[2]), float(region[3]))
+    return (x1, y1, x2, y2)
+
+
+INPUT_EVENT_TYPES = ("key_press", "key_release", "tap", "chord", "click", "hold", "drag", "mouse_path")
+# Input events that keep going for their "duration"
+TIMED_INPUT_TYPES = ("tap", "chord", "hold", "drag", "mouse_path")
+
+_SPEED_PROFILE: dict = {"scale": 1.0, "max_gap": None, "min_gap": 0.0}
+
+
+def set_speed_profile(scale: float = 1.0, max_gap: float | None = None, min_gap: float = 0.0) -> None:
+    """Set the default playback speed profile used by run_timeline."""
+    global _SPEED_PROFILE
+    _SPEED_PROFILE = {
+        "scale": max(0.0, float(scale)),
+        "max_gap": None if max_gap is None else max(0.0, float(max_gap)),
+        "min_gap": max(0.0, float(min_gap)),
+    }
+
+
+def get_speed_profile() -> dict:
+    return dict(_SPEED_PROFILE)
+
+
+def compute_schedule(timeline: list[dict], speed_profile: dict | None = None) -> list[tuple[float, dict]]:
+    """
+    Compute the effective (time, event) schedule of a timeline under a speed profile.
+
+    Only idle gaps between two input events are compressed: each such gap is
+    multiplied by ``scale``, capped at ``max_gap`` and never shortened below the
+    profile ``min_gap`` or the event's own ``min_gap`` field. Gaps touching a
+    processor/config event, and gaps while a key, tap, mouse hold or mouse path
+    is still active, keep their recorded length.
+    """
+    profile = speed_profile if speed_profile is not None else _SPEED_PROFILE
+    scale = float(profile.get("scale", 1.0))
+    max_gap = profile.get("max_gap")
+    profile_min_gap = float(profile.get("min_gap", 0.0))
+
+    events = sorted(timeline, key=lambda e: float(e.get("time", 0)))
+    schedule: list[tuple[float, dict]] = []
+    held_keys: dict[str, int] = {}
+    busy_until = 0.0  # Original time until which a hold/drag is in progress
+    prev_time = 0.0
+    prev_is_input = True
+    effective_time = 0.0
+
+    for event in events:
+        event_time = float(event.get("time", 0))
+        gap = max(0.0, event_time - prev_time)
+        is_input = event.get("type") in INPUT_EVENT_TYPES
+        compressible = (
+            is_input
+            and prev_is_input
+            and not any(count > 0 for count in held_keys.values())
+            and prev_time >= busy_until
+        )
+        if compressible:
+            new_gap = gap * scale
+            if max_gap is not None:
+                new_gap = min(new_gap, float(max_gap))
+            floor = min(gap, max(profile_min_gap, float(event.get("min_gap", 0))))
+            gap = max(new_gap, floor)
+
+        effective_time += gap
+        schedule.append((effective_time, event))
+
+        event_type = event.get("type")
+        key_name = event.get("key")
+        if event_type == "key_press":
+            held_keys[key_name] = held_keys.get(key_name, 0) + 1
+        elif event_type == "key_release" and held_keys.get(key_name, 0) > 0:
+            held_keys[key_name] -= 1
+        elif event_type in TIMED_INPUT_TYPES:
+            busy_until = max(busy_until, event_time + float(event.get("duration", 0)))
+        prev_time = event_time
+        prev_is_input = is_input
+
+    return schedule
+
+
+def _schedule_end(schedule: list[tuple[float, dict]]) -> float:
+    end = 0.0
+    for event_time, event in schedule:
+        duration = float(event.get("duration", 0)) if event.get("type") in TIMED_INPUT_TYPES else 0.0
+        end = max(end, event_time + duration)
+    return end
+
+
+def estimate_timeline_duration(data: dict, speed_profile: dict | None = None) -> tuple[float, float]:
+    """Return (recorded, effective) input playback duration of a timeline config."""
+    timeline = data.get("timeline", [])
+    recorded = _schedule_end(compute_schedule(timeline, {"scale": 1.0}))
+    effective = _schedule_end(compute_schedule(timeline, speed_profile))
+    return recorded, effective
+
+
+def estimate_config_duration(config_path: Path | str, speed_profile: dict | None = None) -> tuple[float, float]:
+    """
+    Return (recorded, effective) duration of a timeline or composite config.
+
+    Processor events count as zero since their runtime depends on the game.
+    """
+    data = load_steps(Path(config_path))
+    if isinstance(data, dict) and data.get("type") == "composite":
+        return _estimate_composite_items(data.get("configs", []), speed_profile)
+    if isinstance(data, dict) and "timeline" in data:
+        return estimate_timeline_duration(data, speed_profile)
+    return 0.0, 0.0
+
+
+def _estimate_composite_items(items: list, speed_profile: dict | None) -> tuple[float, float]:
+    """Sum the durations of composite steps (repeat_while counts one iteration, if the longer branch)."""
+    recorded = effective = 0.0
+    for item in items:
+        if isinstance(item, dict) and "repeat" in item:
+            sub_recorded, sub_effective = _estimate_composite_items(item.get("configs", []), speed_profile)
+            count = max(0, int(item["repeat"]))
+            recorded += sub_recorded * count
+            effective += sub_effective * count
+        elif isinstance(item, dict) and "repeat_while" in item:
+            sub_recorded, sub_effective = _estimate_composite_items(item.get("configs", []), speed_profile)
+            recorded += sub_recorded
+            effective += sub_effective
+        elif isinstance(item, dict) and "if" in item:
+            branches = [
+                _estimate_composite_items(item.get(key, []), speed_profile) for key in ("then", "else")
+            ]
+            recorded += max(branch[0] for branch in branches)
+            effective += max(branch[1] for branch in branches)
+        else:
+            sub_path = get_workspace().resolve(item.get("config") if isinstance(item, dict) else item)
+            if sub_path is None:
+                continue
+            sub_recorded, sub_effective = estimate_config_duration(sub_path, speed_profile)
+            recorded += sub_recorded
+            effective += sub_effective
+    return recorded, effective
+
+
+# Parsed configs by path, reused while the file's mtime and size are unchanged
+_config_cache: dict[str, tuple[tuple[int, int], dict]] = {}
+_config_cache_lock = threading.Lock()
+
+
 def load_steps(config_path: Path) -> dict:
-    """Load steps from config (timeline format)."""
+    """
+    Load steps from config (timeline format).
+
+    Parsed configs are cached until the file changes (mtime/size), so config_action
+    events, processor loops and repeated runs do not parse the same JSON again and
+    prefetch_config() parses upcoming configs off the critical path. The returned
+    data is shared between callers and must not be modified.
+    """
+    config_path = Path(config_path)
+    stat = config_path.stat()
+    key = str(config_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _config_cache_lock:
+        cached = _config_cache.get(key)
+    if cached is not None and cached[0] == signature:
+        increment("config_cache", "hit")
+        return cached[1]
+
     with config_path.open("r", encoding="utf-8") as handle:
         data = json.load(handle)
+    with _config_cache_lock:
+        _config_cache[key] = (signature, data)
+    increment("config_cache", "miss")
     return data
 
 
@@ -63,12 +251,189 @@ def save_steps(config_path: Path, steps: dict) -> None:
     
     with config_path.open("w", encoding="utf-8") as handle:
         json.dump(cleaned, handle, ensure_ascii=False, indent=2)
+    with _config_cache_lock:
+        _config_cache.pop(str(config_path), None)
+
+
+def _prefetch_config_now(config_path: Path) -> None:
+    from processors.registry import prefetch_timeline
+
+    data = load_steps(config_path)
+    if isinstance(data, dict) and data.get("type") == "composite":
+        # Only the first step runs soon; later steps are prefetched as the composite advances
+        for item in data.get("configs", [])[:1]:
+            sub_paths = composite_item_paths(item)
+            sub_path = get_workspace().resolve(sub_paths[0]) if sub_paths else None
+            if sub_path is not None:
+                _prefetch_config_now(sub_path)
+    elif isinstance(data, dict):
+        prefetch_timeline(data.get("timeline", []))
+
+
+def prefetch_config(config_path: Path | str) -> None:
+    """Warm templates/models of an upcoming config in the background prefetch worker."""
+    from processors.registry import submit_prefetch
+
+    submit_prefetch(_prefetch_config_now, Path(config_path))
 
 
 class StopExecution(Exception):
     pass
 
 
+class DesyncError(StopExecution):
+    """Playback lost sync with the game: a checkpoint event's expected screen did not show up."""
+
+    def __init__(self, report: dict) -> None:
+        super().__init__(report)
+        self.report = report
+
+    def __str__(self) -> str:
+        return format_desync_report(self.report)
+
+
+def format_desync_report(report: dict) -> str:
+    """One-line description of a checkpoint mismatch."""
+    location = f"event #{report.get('event_index')} ({report.get('event_type')} at {report.get('event_time', 0):.2f}s)"
+    if report.get("config"):
+        location = f"{Path(report['config']).name} {location}"
+    return (
+        f"Desync at {location}: expected {report.get('expected')}, "
+        f"observed {report.get('observed') or 'nothing'} after {report.get('attempts')} attempt(s)"
+    )
+
+
+class CancelToken:
+    """
+    Cooperative cancellation shared by the scheduler, event workers and processors.
+
+    A token is callable, so it can be passed anywhere a ``stop_check`` is expected;
+    sleeps built on wait() return as soon as the token is cancelled.
+
+    Args:
+        parent: Optional stop_check the token also follows (cancelling the token
+            does not affect the parent)
+    """
+
+    def __init__(self, parent: Callable[[], bool] | None = None) -> None:
+        self._event = threading.Event()
+        self.parent = parent
+        self.cancel_time: float | None = None
+
+    def __call__(self) -> bool:
+        return self.is_cancelled()
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set() or bool(self.parent and self.parent())
+
+    def cancel(self) -> None:
+        if not self._event.is_set():
+            self.cancel_time = time.monotonic()
+            self._event.set()
+
+    def reset(self) -> None:
+        self._event.clear()
+        self.cancel_time = None
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block for up to timeout seconds; returns True if cancelled."""
+        if self.parent is None:
+            return self._event.wait(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_cancelled():
+            remaining = 0.01 if deadline is None else min(0.01, deadline - time.monotonic())
+            if remaining <= 0:
+                return False
+            self._event.wait(remaining)
+        return True
+
+    def latency(self) -> float | None:
+        """Seconds elapsed since cancel() was requested, or None if not cancelled."""
+        if self.cancel_time is None:
+            return None
+        return time.monotonic() - self.cancel_time
+
+
+class SystemClock:
+    """Wall clock used for real playback."""
+
+    virtual = False
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, duration: float, stop_check: Callable[[], bool] | None = None) -> None:
+        deadline = time.monotonic() + max(0.0, float(duration))
+        wait = getattr(stop_check, "wait", None)
+        while True:
+            if stop_check and stop_check():
+                raise StopExecution("Stopped")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if wait is not None:
+                if wait(remaining):
+                    raise StopExecution("Stopped")
+            else:
+                time.sleep(min(0.01, remaining))
+
+
+class VirtualClock:
+    """
+    Simulated clock for dry runs.
+
+    Sleeps advance the clock instantly. run_timeline() runs event workers inline as
+    branches that start at their scheduled time; the clock is rewound after each
+    branch and joins advance it to the latest branch end.
+    """
+
+    virtual = True
+
+    def __init__(self, start: float = 0.0) -> None:
+        self.now = float(start)
+        self.branches: list[dict] = []  # {"events", "start", "end"} per worker
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, duration: float, stop_check: Callable[[], bool] | None = None) -> None:
+        if stop_check and stop_check():
+            raise StopExecution("Stopped")
+        self.now += max(0.0, float(duration))
+
+    def run_branch(self, func: Callable, arg, events: list[dict]) -> float:
+        """Run func(arg) as a concurrent worker starting now; returns its end time."""
+        start = self.now
+        try:
+            func(arg)
+        finally:
+            end = self.now
+            self.now = start
+            self.branches.append({"events": events, "start": start, "end": end})
+        return end
+
+    def advance_to(self, timestamp: float) -> None:
+        self.now = max(self.now, float(timestamp))
+
+
+_CLOCK: SystemClock | VirtualClock = SystemClock()
+
+
+def set_clock(clock: SystemClock | VirtualClock | None) -> None:
+    """Switch the playback clock (None restores the wall clock)."""
+    global _CLOCK
+    _CLOCK = clock if clock is not None else SystemClock()
+
+
+def get_clock() -> SystemClock | VirtualClock:
+    return _CLOCK
+
+
+def sleep_or_stop(duration: float, stop_check: Callable[[], bool] | None = None) -> None:
+    """Sleep for duration seconds, raising StopExecution as soon as stop_check fires."""
+    _CLOCK.sleep(duration, stop_check)
+
+
 COMPOSITE_BREAK_EVENT = threading.Event()
 
 
@@ -88,15 +453,43 @@ def clear_composite_break() -> None:
 
 
 class Recorder:
-    """Records keyboard and mouse operations (clicks, drags, holds, key presses/releases)."""
+    """
+    Records keyboard and mouse operations (clicks, drags, holds, key presses/releases).
+
+    With record_mouse_path, cursor movement is recorded too: movement between
+    clicks becomes mouse_path events and drags keep their path, both simplified
+    to at most path_max_points points within path_epsilon pixels (see mouse_path.py).
+
+    With collapse_taps, a key press followed by its release (with only modifiers
+    held around it) is recorded as one tap/chord event (see key_taps.py).
+    """
     
     def __init__(
         self,
         click_filter: Callable[[int, int], bool] | None = None,
         drag_threshold: int = 5,
         hold_threshold: float = 0.3,
+        record_keyframes: bool = False,
+        record_mouse_path: bool = False,
+        path_epsilon: float = DEFAULT_PATH_EPSILON,
+        path_max_points: int = DEFAULT_PATH_MAX_POINTS,
+        collapse_taps: bool = True,
     ) -> None:
-        self.timeline: list[dict] = []
+        # Events are kept column-wise and optionally journaled (see recording_journal.py)
+        self.buffer = EventBuffer()
+        # Screen keyframes at clicks and key presses (see keyframes.py)
+        self.record_keyframes = record_keyframes
+        self.keyframes: list[dict] = []
+        self._keyframe_capture = None
+        # Cursor samples (time, x, y) of the movement in progress
+        self.record_mouse_path = record_mouse_path
+        self.path_epsilon = path_epsilon
+        self.path_max_points = path_max_points
+        self._path_samples: list[tuple[float, int, int]] = []
+        # Key events are held back until they can be collapsed into taps/chords
+        self.collapse_taps = collapse_taps
+        self._key_collapser = KeyEventCollapser(self._emit_key_event)
+        self._key_lock = threading.Lock()
         self.recording = False
         self.start_time: float | None = None
         self.mouse_listener: mouse.Listener | None = None
@@ -121,15 +514,81 @@ class Recorder:
             return 0.0
         return time.monotonic() - self.start_time
     
-    def _add_event(self, event_type: str, **kwargs) -> None:
-        """Add timestamped event to timeline."""
+    @property
+    def timeline(self) -> list[dict]:
+        """Events recorded so far, in the timeline JSON format."""
+        return self.buffer.to_timeline()
+
+    def _add_event(self, event_type: str, event_time: float | None = None, **kwargs) -> None:
+        """Add timestamped event to timeline (at event_time, default now)."""
         event = {
-            "time": round(self._elapsed_time(), 3),
+            "time": round(self._elapsed_time() if event_time is None else event_time, 3),
             "type": event_type,
             **kwargs
         }
-        self.timeline.append(event)
+        self.buffer.append(event)
+
+    def _simplified_path(self, samples: list[tuple[float, int, int]]) -> list[list[float]]:
+        """Simplify cursor samples to [[t, x_rel, y_rel], ...] with t relative to the first sample."""
+        start = samples[0][0]
+        return [
+            [round(t - start, 3), *self._to_relative(x, y)]
+            for t, x, y in simplify_path(samples, self.path_epsilon, self.path_max_points)
+        ]
+
+    def _flush_mouse_path(self) -> None:
+        """Turn the movement collected so far into a mouse_path event."""
+        samples, self._path_samples = self._path_samples, []
+        if len(samples) < 2:
+            return
+        xs = [x for _, x, _ in samples]
+        ys = [y for _, _, y in samples]
+        if max(xs) - min(xs) <= self.path_epsilon and max(ys) - min(ys) <= self.path_epsilon:
+            return
+        self._add_event(
+            "mouse_path",
+            event_time=samples[0][0],
+            duration=round(samples[-1][0] - samples[0][0], 3),
+            points=self._simplified_path(samples),
+        )
+
+    def on_move(self, x: int, y: int) -> None:
+        """Handle mouse move events (only listened to with record_mouse_path)."""
+        if not self.recording or self._skip_recording:
+            return
+        now = self._elapsed_time()
+        if self.mouse_down is None and self._path_samples and now - self._path_samples[-1][0] > PATH_IDLE_SPLIT:
+            self._flush_mouse_path()
+        self._path_samples.append((now, x, y))
     
+    def _request_keyframe(self) -> dict | None:
+        """Queue a screen capture for the input happening now."""
+        if self._keyframe_capture is None:
+            return None
+        keyframe = {"time": round(self._elapsed_time(), 3), "event": None}
+        self.keyframes.append(keyframe)
+        self._keyframe_capture.request(keyframe)
+        return keyframe
+
+    def _attach_keyframe(self, keyframe: dict | None) -> None:
+        """Link a keyframe to the event just added to the timeline."""
+        if keyframe is not None:
+            keyframe["event"] = len(self.buffer) - 1
+
+    def _emit_key_event(self, event: dict, keyframes: list) -> None:
+        fields = {name: value for name, value in event.items() if name not in ("time", "type")}
+        self._add_event(event["type"], event_time=event["time"], **fields)
+        self._attach_keyframe(next((keyframe for keyframe in keyframes if keyframe is not None), None))
+
+    def _record_key(self, event_type: str, key_name: str, keyframe: dict | None = None) -> None:
+        """Record a key_press/key_release, collapsing press/release groups into taps/chords."""
+        event = {"time": round(self._elapsed_time(), 3), "type": event_type, "key": key_name}
+        with self._key_lock:
+            if self.collapse_taps:
+                self._key_collapser.add(event, keyframe)
+            else:
+                self._emit_key_event(event, [keyframe])
+
     def _normalize_key(self, key: keyboard.Key | keyboard.KeyCode) -> str:
         """Convert key to string representation."""
         if isinstance(key, keyboard.KeyCode) and key.char:
@@ -145,12 +604,20 @@ class Recorder:
         
         if pressed:
             if self.click_filter and self.click_filter(x, y):
+                self._path_samples = []
                 return
+            with self._key_lock:
+                # Keep key events around a click (e.g. ctrl+click) as they are
+                self._key_collapser.interrupt()
+            if self.record_mouse_path:
+                self._flush_mouse_path()
+                self._path_samples = [(self._elapsed_time(), x, y)]
             self.mouse_down = {
                 "x": x,
                 "y": y,
                 "button": button.name,
                 "time": self._elapsed_time(),
+                "keyframe": self._request_keyframe(),
             }
         else:
             if self.mouse_down is None:
@@ -160,6 +627,7 @@ class Recorder:
             dx = abs(x - self.mouse_down["x"])
             dy = abs(y - self.mouse_down["y"])
             duration = self._elapsed_time() - self.mouse_down["time"]
+            path_samples, self._path_samples = self._path_samples, []
             
             if dx > self.drag_threshold or dy > self.drag_threshold:
                 # It's a drag (moved significantly)
@@ -167,6 +635,9 @@ class Recorder:
                     self.mouse_down["x"], self.mouse_down["y"]
                 )
                 end_x_rel, end_y_rel = self._to_relative(x, y)
+                path = {}
+                if self.record_mouse_path and len(path_samples) > 2:
+                    path["path"] = self._simplified_path(path_samples + [(self._elapsed_time(), x, y)])
                 self._add_event(
                     "drag",
                     start_x=start_x_rel,
@@ -175,6 +646,7 @@ class Recorder:
                     end_y=end_y_rel,
                     button=self.mouse_down["button"],
                     duration=duration,
+                    **path,
                 )
             elif duration >= self.hold_threshold:
                 # It's a hold (stayed in place for a while)
@@ -196,6 +668,7 @@ class Recorder:
                     button=self.mouse_down["button"],
                 )
             
+            self._attach_keyframe(self.mouse_down["keyframe"])
             self.mouse_down = None
     
     def on_press(self, key: keyboard.Key | keyboard.KeyCode) -> None:
@@ -210,7 +683,7 @@ class Recorder:
             if key_name not in self.pressed_keys:
                 self.pressed_keys[key_name] = []
             self.pressed_keys[key_name].append(self._elapsed_time())
-            self._add_event("key_press", key=key_name)
+            self._record_key("key_press", key_name, self._request_keyframe())
     
     def on_release(self, key: keyboard.Key | keyboard.KeyCode) -> None:
         """Handle key release events."""
@@ -221,7 +694,7 @@ class Recorder:
         
         if key_name in self.pressed_keys and self.pressed_keys[key_name]:
             self.pressed_keys[key_name].pop()
-            self._add_event("key_release", key=key_name)
+            self._record_key("key_release", key_name)
     
     def record_arrow_key_press(self, key_name: str) -> None:
         """Record an arrow key press event (called from low-level keyboard hook)."""
@@ -232,7 +705,7 @@ class Recorder:
         if key_name not in self.pressed_keys:
             self.pressed_keys[key_name] = []
         self.pressed_keys[key_name].append(self._elapsed_time())
-        self._add_event("key_press", key=key_name)
+        self._record_key("key_press", key_name, self._request_keyframe())
     
     def record_arrow_key_release(self, key_name: str) -> None:
         """Record an arrow key release event (called from low-level keyboard hook)."""
@@ -242,39 +715,79 @@ class Recorder:
         # key_name should be 'up', 'down', 'left', 'right'
         if key_name in self.pressed_keys and self.pressed_keys[key_name]:
             self.pressed_keys[key_name].pop()
-            self._add_event("key_release", key=key_name)
+            self._record_key("key_release", key_name)
     
-    def start(self) -> None:
-        """Start recording operations."""
+    def start(self, journal: Path | str | None = None) -> None:
+        """
+        Start recording operations.
+
+        Args:
+            journal: Optional file to stream events to while recording (see journal_path())
+        """
         if self.recording:
             return
         
-        self.timeline = []
+        self.buffer = EventBuffer(journal)
+        self.keyframes = []
+        self._path_samples = []
         self.pressed_keys = {}
+        self._key_collapser = KeyEventCollapser(self._emit_key_event)
         self.mouse_down = None
+        if self.record_keyframes:
+            from keyframes import KeyframeCapture
+
+            width, height = get_screen_size()
+            offset_x, offset_y = get_screen_offset()
+            self._keyframe_capture = KeyframeCapture((offset_x, offset_y, offset_x + width, offset_y + height))
         self.start_time = time.monotonic()
         self.recording = True
         
         # Start listeners
-        self.mouse_listener = mouse.Listener(on_click=self.on_click)
+        if self.record_mouse_path:
+            self.mouse_listener = mouse.Listener(on_click=self.on_click, on_move=self.on_move)
+        else:
+            self.mouse_listener = mouse.Listener(on_click=self.on_click)
         self.key_listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
         
         self.mouse_listener.start()
         self.key_listener.start()
     
     def stop(self) -> dict:
-        """Stop recording and return recorded data."""
+        """
+        Stop recording and return recorded data (keyframes are left in self.keyframes).
+
+        The journal is kept until discard_journal() is called after saving.
+        """
         if not self.recording:
             return {"timeline": self.timeline}
         
         self.recording = False
         
-        if self.mouse_listener:
-            self.mouse_listener.stop()
         if self.key_listener:
             self.key_listener.stop()
+        with self._key_lock:
+            # Keys still held keep their plain key_press
+            self._key_collapser.flush()
+        if self.mouse_listener:
+            self.mouse_listener.stop()
+        if self.record_mouse_path and self.mouse_down is None:
+            self._flush_mouse_path()
+        if self._keyframe_capture is not None:
+            self._keyframe_capture.close()
+            self._keyframe_capture = None
+        self.buffer.close()
         
-        return {"timeline": self.timeline}
+        # Taps and mouse paths are added once complete, after events that started later
+        order = self.buffer.time_order()
+        new_index = {old: new for new, old in enumerate(order)}
+        for keyframe in self.keyframes:
+            if keyframe["event"] is not None:
+                keyframe["event"] = new_index[keyframe["event"]]
+        return {"timeline": self.buffer.to_timeline(order)}
+
+    def discard_journal(self) -> None:
+        """Delete the journal of the last recording once it has been saved."""
+        self.buffer.close(discard=True)
 
 
 def _get_pynput_key(key: str):
@@ -335,7 +848,25 @@ def _get_pynput_key(key: str):
 ARROW_KEY_MOVE_DISTANCE = 50
 
 INPUT_MOUSE = 0
+INPUT_KEYBOARD = 1
 MOUSEEVENTF_MOVE = 0x0001
+MOUSEEVENTF_LEFTDOWN = 0x0002
+MOUSEEVENTF_LEFTUP = 0x0004
+MOUSEEVENTF_RIGHTDOWN = 0x0008
+MOUSEEVENTF_RIGHTUP = 0x0010
+MOUSEEVENTF_MIDDLEDOWN = 0x0020
+MOUSEEVENTF_MIDDLEUP = 0x0040
+MOUSEEVENTF_VIRTUALDESK = 0x4000
+MOUSEEVENTF_ABSOLUTE = 0x8000
+KEYEVENTF_EXTENDEDKEY = 0x0001
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_UNICODE = 0x0004
+
+# GetSystemMetrics indexes of the virtual desktop (all monitors) bounds
+SM_XVIRTUALSCREEN = 76
+SM_YVIRTUALSCREEN = 77
+SM_CXVIRTUALSCREEN = 78
+SM_CYVIRTUALSCREEN = 79
 
 ULONG_PTR = getattr(wintypes, "ULONG_PTR", ctypes.c_size_t)
 
@@ -349,21 +880,31 @@ class MOUSEINPUT(ctypes.Structure):
         ("dwExtraInfo", ULONG_PTR),
     ]
 
+class KEYBDINPUT(ctypes.Structure):
+    _fields_ = [
+        ("wVk", wintypes.WORD),
+        ("wScan", wintypes.WORD),
+        ("dwFlags", wintypes.DWORD),
+        ("time", wintypes.DWORD),
+        ("dwExtraInfo", ULONG_PTR),
+    ]
+
+class _INPUTUNION(ctypes.Union):
+    _fields_ = [("mi", MOUSEINPUT), ("ki", KEYBDINPUT)]
+
 class INPUT(ctypes.Structure):
-    _fields_ = [("type", wintypes.DWORD), ("mi", MOUSEINPUT)]
+    _anonymous_ = ("u",)
+    _fields_ = [("type", wintypes.DWORD), ("u", _INPUTUNION)]
+
+def _mouse_input(dx: int, dy: int, flags: int) -> INPUT:
+    input_struct = INPUT(type=INPUT_MOUSE)
+    input_struct.mi = MOUSEINPUT(dx=dx, dy=dy, mouseData=0, dwFlags=flags, time=0, dwExtraInfo=0)
+    return input_struct
 
 def _mouse_move_relative(dx: int, dy: int) -> None:
     """Move mouse by relative amount (dx, dy)."""
     try:
-        mouse_input = MOUSEINPUT(
-            dx=dx,
-            dy=dy,
-            mouseData=0,
-            dwFlags=MOUSEEVENTF_MOVE,
-            time=0,
-            dwExtraInfo=0,
-        )
-        input_struct = INPUT(type=INPUT_MOUSE, mi=mouse_input)
+        input_struct = _mouse_input(dx, dy, MOUSEEVENTF_MOVE)
         sent = ctypes.windll.user32.SendInput(1, ctypes.byref(input_struct), ctypes.sizeof(INPUT))
         if sent == 0:
             raise OSError("SendInput failed")
@@ -414,12 +955,359 @@ def _mouse_drag(start_x: int, start_y: int, end_x: int, end_y: int, duration: fl
     pyautogui.dragTo(end_x, end_y, duration=duration, button=button)
 
 
-def _mouse_hold(x: int, y: int, duration: float, button: str = "left") -> None:
-    """Hold mouse button at position for specified duration."""
+def _mouse_hold(
+    x: int,
+    y: int,
+    duration: float,
+    button: str = "left",
+    stop_check: Callable[[], bool] | None = None,
+) -> None:
+    """Hold mouse button at position for specified duration (released early on stop)."""
     pyautogui.moveTo(x, y)
     _mouse_down(button)
-    time.sleep(duration)
-    _mouse_up(button)
+    try:
+        sleep_or_stop(duration, stop_check)
+    finally:
+        _mouse_up(button)
+
+
+# Maximum time run_timeline waits for event workers after a stop request
+STOP_JOIN_TIMEOUT = 1.0
+
+# Events within this window (seconds) of each other are injected as one batch
+INPUT_BATCH_WINDOW = 0.005
+BATCHABLE_EVENT_TYPES = ("key_press", "key_release", "click")
+
+_INPUT_BACKEND: Callable[[list[dict]], None] | None = None
+
+
+def set_input_backend(backend: Callable[[list[dict]], None] | None) -> None:
+    """Route batched input events to a custom backend (None restores native input)."""
+    global _INPUT_BACKEND
+    _INPUT_BACKEND = backend
+
+
+_VK_CODES = {
+    'shift': 0x10, 'shift_l': 0xA0, 'shift_r': 0xA1,
+    'ctrl': 0x11, 'ctrl_l': 0xA2, 'ctrl_r': 0xA3,
+    'alt': 0x12, 'alt_l': 0xA4, 'alt_r': 0xA5, 'alt_gr': 0xA5,
+    'space': 0x20, 'enter': 0x0D, 'return': 0x0D, 'tab': 0x09,
+    'backspace': 0x08, 'delete': 0x2E, 'esc': 0x1B, 'escape': 0x1B,
+    'up': 0x26, 'down': 0x28, 'left': 0x25, 'right': 0x27,
+    'home': 0x24, 'end': 0x23, 'pageup': 0x21, 'pagedown': 0x22,
+    'page_up': 0x21, 'page_down': 0x22, 'insert': 0x2D, 'pause': 0x13,
+    'print_screen': 0x2C, 'scroll_lock': 0x91, 'caps_lock': 0x14, 'num_lock': 0x90,
+    **{f'f{i}': 0x6F + i for i in range(1, 13)},
+}
+
+# Keys that need KEYEVENTF_EXTENDEDKEY to be distinguished from the numpad
+_EXTENDED_VK_CODES = {0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x2D, 0x2E, 0xA3, 0xA5}
+
+_MOUSE_BUTTON_FLAGS = {
+    "left": (MOUSEEVENTF_LEFTDOWN, MOUSEEVENTF_LEFTUP),
+    "right": (MOUSEEVENTF_RIGHTDOWN, MOUSEEVENTF_RIGHTUP),
+    "middle": (MOUSEEVENTF_MIDDLEDOWN, MOUSEEVENTF_MIDDLEUP),
+}
+
+
+def _virtual_key_code(key_name: str) -> tuple[int, int]:
+    """
+    Resolve a recorded key name to a Windows virtual-key code.
+
+    Returns:
+        (virtual-key code, VkKeyScanW shift state needed to type the character)
+    """
+    name = _normalize_arrow_key_name(key_name) or ""
+    if name in _VK_CODES:
+        return _VK_CODES[name], 0
+    if len(key_name) == 1:
+        vk = ctypes.windll.user32.VkKeyScanW(ord(key_name))
+        if vk != -1:
+            return vk & 0xFF, (vk >> 8) & 0xFF
+    raise ValueError(f"No virtual-key code for key: {key_name!r}")
+
+
+def _vk_input(vk: int, key_up: bool) -> INPUT:
+    flags = KEYEVENTF_KEYUP if key_up else 0
+    if vk in _EXTENDED_VK_CODES:
+        flags |= KEYEVENTF_EXTENDEDKEY
+    scan = ctypes.windll.user32.MapVirtualKeyW(vk, 0)
+    input_struct = INPUT(type=INPUT_KEYBOARD)
+    input_struct.ki = KEYBDINPUT(wVk=vk, wScan=scan, dwFlags=flags, time=0, dwExtraInfo=0)
+    return input_struct
+
+
+def _unicode_input(char: str, key_up: bool) -> INPUT:
+    flags = KEYEVENTF_UNICODE | (KEYEVENTF_KEYUP if key_up else 0)
+    input_struct = INPUT(type=INPUT_KEYBOARD)
+    input_struct.ki = KEYBDINPUT(wVk=0, wScan=ord(char), dwFlags=flags, time=0, dwExtraInfo=0)
+    return input_struct
+
+
+def _keyboard_inputs(key_name: str, key_up: bool) -> list[INPUT]:
+    """
+    SendInput records pressing or releasing a key.
+
+    Like pynput, characters that need shift/ctrl/alt (e.g. "A", "!") and control
+    characters (e.g. "\\x18" recorded for ctrl+x) are sent as KEYEVENTF_UNICODE
+    packets, so no modifier is pressed or released around them.
+    """
+    if len(key_name) == 1 and (ord(key_name) < 0x20 or ord(key_name) == 0x7F):
+        return [_unicode_input(key_name, key_up)]
+    try:
+        vk, shift_state = _virtual_key_code(key_name)
+    except ValueError:
+        if len(key_name) != 1:
+            raise
+        return [_unicode_input(key_name, key_up)]
+    if shift_state:
+        return [_unicode_input(key_name, key_up)]
+    return [_vk_input(vk, key_up)]
+
+
+def _absolute_move_input(x_rel: float, y_rel: float) -> INPUT:
+    """
+    SendInput record moving the cursor to a relative screen position.
+
+    Absolute coordinates are normalized over the virtual desktop, so positions on
+    secondary monitors (including negative offsets) are reached as well.
+    """
+    x, y = _coords_relative_to_absolute(x_rel, y_rel)
+    user32 = ctypes.windll.user32
+    desktop_x = user32.GetSystemMetrics(SM_XVIRTUALSCREEN)
+    desktop_y = user32.GetSystemMetrics(SM_YVIRTUALSCREEN)
+    desktop_w = max(2, user32.GetSystemMetrics(SM_CXVIRTUALSCREEN))
+    desktop_h = max(2, user32.GetSystemMetrics(SM_CYVIRTUALSCREEN))
+    abs_x = int(round((x - desktop_x) * 65535 / (desktop_w - 1)))
+    abs_y = int(round((y - desktop_y) * 65535 / (desktop_h - 1)))
+    return _mouse_input(abs_x, abs_y, MOUSEEVENTF_MOVE | MOUSEEVENTF_ABSOLUTE | MOUSEEVENTF_VIRTUALDESK)
+
+
+def _play_mouse_path(
+    points: list,
+    sample_interval: float = MOUSE_PATH_SAMPLE_INTERVAL,
+    stop_check: Callable[[], bool] | None = None,
+) -> None:
+    """
+    Move the cursor along a recorded [[t, x_rel, y_rel], ...] polyline.
+
+    Positions are injected every sample_interval seconds against absolute
+    deadlines, so the path keeps its recorded timing without tweening overhead.
+    """
+    start = _CLOCK.monotonic()
+    end_t = float(points[-1][0])
+    t = 0.0
+    segment = 0
+    while True:
+        x_rel, y_rel, segment = path_position(points, t, segment)
+        move = _absolute_move_input(x_rel, y_rel)
+        ctypes.windll.user32.SendInput(1, ctypes.byref(move), ctypes.sizeof(INPUT))
+        if t >= end_t:
+            return
+        t = min(end_t, t + sample_interval)
+        sleep_or_stop(start + t - _CLOCK.monotonic(), stop_check)
+
+
+def _inputs_for_event(event: dict) -> list[INPUT]:
+    """Translate a batchable timeline event into SendInput records."""
+    event_type = event.get("type")
+    key_name = event.get("key")
+    if event_type == "key_press":
+        inputs = _keyboard_inputs(key_name, key_up=False)
+        name = _normalize_arrow_key_name(key_name)
+        arrow_moves = {
+            "right": (ARROW_KEY_MOVE_DISTANCE, 0),
+            "left": (-ARROW_KEY_MOVE_DISTANCE, 0),
+            "down": (0, ARROW_KEY_MOVE_DISTANCE),
+            "up": (0, -ARROW_KEY_MOVE_DISTANCE),
+        }
+        if name in arrow_moves:
+            inputs.append(_mouse_input(*arrow_moves[name], MOUSEEVENTF_MOVE))
+        return inputs
+    if event_type == "key_release":
+        return _keyboard_inputs(key_name, key_up=True)
+    if event_type == "click":
+        down_flag, up_flag = _MOUSE_BUTTON_FLAGS[event.get("button", "left")]
+        inputs = [_absolute_move_input(float(event.get("x")), float(event.get("y")))]
+        for _ in range(int(event.get("clicks", 1))):
+            inputs.append(_mouse_input(0, 0, down_flag))
+            inputs.append(_mouse_input(0, 0, up_flag))
+        return inputs
+    raise ValueError(f"Event type cannot be batched: {event_type}")
+
+
+def _inject_input_event(event: dict) -> None:
+    """Inject a single key/click event through pynput/pyautogui."""
+    event_type = event.get("type")
+    if event_type == "key_press":
+        key_name = event.get("key")
+        keyboard.Controller().press(_get_pynput_key(key_name))
+        # For arrow keys, also execute mouse movement (direct execution during playback)
+        _move_for_arrow_key(key_name)
+    elif event_type == "key_release":
+        keyboard.Controller().release(_get_pynput_key(event.get("key")))
+    elif event_type == "click":
+        x, y = _coords_relative_to_absolute(float(event.get("x")), float(event.get("y")))
+        _mouse_click(x, y, clicks=event.get("clicks", 1), button=event.get("button", "left"))
+
+
+def _inject_input_batch(events: list[dict]) -> None:
+    """Inject key/click events in order with a single SendInput call where possible."""
+    if _INPUT_BACKEND is not None:
+        _INPUT_BACKEND(list(events))
+        return
+
+    sent = 0
+    boundaries: list[int] = []
+    try:
+        inputs: list[INPUT] = []
+        for event in events:
+            inputs.extend(_inputs_for_event(event))
+            boundaries.append(len(inputs))
+        input_array = (INPUT * len(inputs))(*inputs)
+        sent = ctypes.windll.user32.SendInput(len(inputs), input_array, ctypes.sizeof(INPUT))
+        if sent == len(inputs):
+            return
+        raise OSError(f"SendInput injected {sent}/{len(inputs)} inputs")
+    except Exception as e:
+        if sent:
+            logging.getLogger("app").warning("Batched input fell back after partial send: %s", e)
+
+    # Replay everything from the first event that was not completely injected
+    first_pending = sum(1 for boundary in boundaries if boundary <= sent)
+    for event in events[first_pending:]:
+        _inject_input_event(event)
+
+
+def run_visual_wait(event: dict, stop_check: Callable[[], bool] | None = None) -> bool:
+    """
+    Block until the screen reaches the state described by a visual_wait event.
+
+    Event fields:
+        until: "appear" / "disappear" (template in region), "stable" (region stops
+            changing) or "keyframe" (region looks like a recorded keyframe)
+        template: Template name under templates/ (appear/disappear)
+        hash / max_distance: Keyframe dHash (hex) and the Hamming distance accepted as a match (keyframe)
+        region: Optional relative [x1, y1, x2, y2] search region (defaults to full screen,
+            or the game area for keyframe)
+        timeout: Maximum seconds to wait (default 10)
+        poll_interval: Seconds between captures (default 0.1)
+        min_matches / confidence_threshold: SIFT acceptance for appear/disappear
+        stable_threshold / stable_duration: Max mean pixel difference and how long it must hold
+
+    Returns True when the condition was met, False on timeout.
+    """
+    from ocr import TEMPLATE_DIR, capture_screen, find_template_sift, wait_until_stable
+
+    until = event.get("until", "appear")
+    region = _region_relative_to_absolute(event.get("region"))
+    timeout = float(event.get("timeout", 10.0))
+    poll_interval = float(event.get("poll_interval", 0.1))
+
+    if until == "stable":
+        result = wait_until_stable(
+            region=region,
+            threshold=float(event.get("stable_threshold", 2.0)),
+            max_wait=timeout,
+            poll_interval=poll_interval,
+            settle_time=float(event.get("stable_duration", 0.3)),
+            stop_check=stop_check,
+        )
+        if result["stopped"]:
+            raise StopExecution("Stopped")
+        return result["stable"]
+
+    if until == "keyframe":
+        from keyframes import DEFAULT_HASH_THRESHOLD, dhash, hash_distance
+
+        if not event.get("hash"):
+            raise ValueError("visual_wait requires a hash for keyframe")
+        target_hash = int(str(event["hash"]), 16)
+        max_distance = int(event.get("max_distance", DEFAULT_HASH_THRESHOLD))
+        if region is None:
+            region = _region_relative_to_absolute([0.0, 0.0, 1.0, 1.0])
+
+        def condition_met(frame) -> bool:
+            return hash_distance(dhash(frame), target_hash) <= max_distance
+    elif until in ("appear", "disappear"):
+        template_name = event.get("template")
+        if not template_name:
+            raise ValueError("visual_wait requires a template for appear/disappear")
+        template_path = TEMPLATE_DIR / template_name
+        min_matches = int(event.get("min_matches", 10))
+        confidence_threshold = float(event.get("confidence_threshold", 0.5))
+
+        def condition_met(frame) -> bool:
+            result = find_template_sift(frame, template_path, min_matches=min_matches)
+            present = result is not None and result["confidence"] >= confidence_threshold
+            return present == (until == "appear")
+    else:
+        raise ValueError(f"Unknown visual_wait condition: {until}")
+
+    deadline = _CLOCK.monotonic() + timeout
+    while True:
+        if stop_check and stop_check():
+            raise StopExecution("Stopped")
+
+        if condition_met(capture_screen(region)):
+            return True
+
+        now = _CLOCK.monotonic()
+        if now >= deadline:
+            return False
+        sleep_or_stop(min(poll_interval, deadline - now), stop_check)
+
+
+_VERIFY_CHECKPOINTS = True
+
+
+def set_checkpoint_verification(enabled: bool) -> None:
+    """Enable or disable checking "expect" conditions of checkpoint events during playback."""
+    global _VERIFY_CHECKPOINTS
+    _VERIFY_CHECKPOINTS = bool(enabled)
+
+
+def verify_checkpoint(event: dict, stop_check: Callable[[], bool] | None = None, index: int | None = None) -> bool:
+    """
+    Check the screen against a checkpoint event's "expect" condition before it runs.
+
+    expect holds a condition as accepted by evaluate_condition() (template or
+    keyframe hash) plus:
+        retries: Extra captures before giving up (default 2)
+        retry_interval: Seconds between captures (default 0.5)
+        on_mismatch: "abort" (default) raises DesyncError, "continue" logs a warning
+
+    Returns True if the screen matched, False on a tolerated mismatch.
+    """
+    from ocr import FrameAnalysis
+
+    expect = event["expect"]
+    retries = max(0, int(expect.get("retries", 2)))
+    retry_interval = float(expect.get("retry_interval", 0.5))
+    details: list[str] = []
+    for attempt in range(retries + 1):
+        if stop_check and stop_check():
+            raise StopExecution("Stopped")
+        details = []
+        if evaluate_condition(expect, FrameAnalysis(), details):
+            increment("checkpoint_checks", "match")
+            return True
+        if attempt < retries:
+            sleep_or_stop(retry_interval, stop_check)
+
+    increment("checkpoint_checks", "mismatch")
+    report = {
+        "event_index": index,
+        "event_type": event.get("type"),
+        "event_time": float(event.get("time", 0)),
+        "expected": _describe_condition(expect),
+        "observed": "; ".join(details),
+        "attempts": retries + 1,
+    }
+    if expect.get("on_mismatch", "abort") == "continue":
+        logging.getLogger("app").warning(format_desync_report(report))
+        return False
+    raise DesyncError(report)
 
 
 def run_timeline(
@@ -427,383 +1315,748 @@ def run_timeline(
     stop_check: Callable[[], bool] | None = None,
     event_callback: Callable[[dict], None] | None = None,
     wait_for_events: bool = False,
+    batch_window: float = INPUT_BATCH_WINDOW,
+    speed_profile: dict | None = None,
 ) -> None:
-    """Execute timeline using main thread scheduling + spawned worker threads for each event."""
+    """Execute timeline using main thread scheduling + spawned worker threads for each event.
+
+    Events are scheduled by compute_schedule() under ``speed_profile`` (the
+    profile set with set_speed_profile() when None). Consecutive key/click events
+    scheduled within ``batch_window`` seconds of each other share one worker
+    thread and are injected as a single ordered batch.
+
+    Timing goes through the clock set with set_clock(); under a VirtualClock the
+    workers run inline and nothing waits on the wall clock.
+
+    Workers follow a token derived from ``stop_check`` that is cancelled whenever
+    the run aborts, so they stop injecting input before they are joined. A
+    DesyncError raised in a worker (a nested timeline or a processor) aborts the
+    run and is re-raised here.
+    """
+    from processors.registry import EventContext, get_event_handler, get_handler_override, prefetch_timeline
+
     timeline = data.get("timeline", [])
-    goods_template = data.get("goods_template")  # Get template from config
     
     if not timeline:
         raise ValueError("Timeline is empty")
     
-    events: list[dict] = list(timeline)
-    events.sort(key=lambda e: float(e.get("time", 0)))
+    schedule = compute_schedule(timeline, speed_profile)
     
-    start_time = time.monotonic()
+    clock = _CLOCK
+    start_time = clock.monotonic()
+    trace_start = trace_now()
     
     # Track all pressed keys to clean up afterwards
     pressed_keys: dict[str, int] = {}  # key_name -> press_count
     pressed_keys_lock = threading.Lock()
+    held_buttons: dict[str, int] = {}  # button -> active hold/drag count
     event_threads: list[threading.Thread] = []
+    branch_ends: list[float] = []  # worker end times under a virtual clock
+    worker_errors: list[DesyncError] = []
+    stopped = False
+    # Cancelled on every abort; also fires when the caller's stop_check does
+    run_token = CancelToken(stop_check)
     
+    context = EventContext(
+        data,
+        stop_check=run_token,
+        event_callback=event_callback,
+        wait_for_events=wait_for_events,
+    )
+    if not clock.virtual:
+        prefetch_timeline(timeline)
+
+    def track_pressed_keys(batch: list[dict]) -> None:
+        with pressed_keys_lock:
+            for event in batch:
+                key_name = event.get("key")
+                if event.get("type") == "key_press":
+                    pressed_keys[key_name] = pressed_keys.get(key_name, 0) + 1
+                elif event.get("type") == "key_release":
+                    if key_name in pressed_keys and pressed_keys[key_name] > 0:
+                        pressed_keys[key_name] -= 1
+
+    def run_batch(batch: list[dict]) -> None:
+        """Inject a group of simultaneous key/click events in a worker thread."""
+        if event_callback:
+            for event in batch:
+                event_callback(event)
+        _inject_input_batch(batch)
+        track_pressed_keys(batch)
+
     def run_event(event: dict) -> None:
         """Execute a single event in a worker thread."""
         event_type = event.get("type")
         
+        if event_type in BATCHABLE_EVENT_TYPES:
+            run_batch([event])
+            return
+
         if event_callback:
             event_callback(event)
         
-        if event_type == "key_press":
-            key_name = event.get("key")
-            key_obj = _get_pynput_key(key_name)
-            keyboard.Controller().press(key_obj)
-            with pressed_keys_lock:
-                pressed_keys[key_name] = pressed_keys.get(key_name, 0) + 1
-            
-            # For arrow keys, also execute mouse movement (direct execution during playback)
-            _move_for_arrow_key(key_name)
-        elif event_type == "key_release":
-            key_name = event.get("key")
-            key_obj = _get_pynput_key(key_name)
-            keyboard.Controller().release(key_obj)
-            with pressed_keys_lock:
-                if key_name in pressed_keys and pressed_keys[key_name] > 0:
-                    pressed_keys[key_name] -= 1
-        elif event_type == "click":
-            x_rel = event.get("x")
-            y_rel = event.get("y")
-            clicks = event.get("clicks", 1)
-            button = event.get("button", "left")
-            x, y = _coords_relative_to_absolute(float(x_rel), float(y_rel))
-            _mouse_click(x, y, clicks=clicks, button=button)
-        elif event_type == "hold":
-            x_rel = event.get("x")
-            y_rel = event.get("y")
-            duration = event.get("duration", 0.3)
-            button = event.get("button", "left")
-            x, y = _coords_relative_to_absolute(float(x_rel), float(y_rel))
-            _mouse_hold(x, y, duration=duration, button=button)
-        elif event_type == "drag":
-            start_x_rel = event.get("start_x")
-            start_y_rel = event.get("start_y")
-            end_x_rel = event.get("end_x")
-            end_y_rel = event.get("end_y")
-            duration = event.get("duration", 0)
+        if event_type in TAP_EVENT_TYPES:
+            # Press, hold and release in one worker; the release also runs on stop
+            presses, releases = tap_press_events(event)
+            duration = float(event.get("duration", 0))
+            if duration <= 0:
+                _inject_input_batch(presses + releases)
+                return
+            _inject_input_batch(presses)
+            track_pressed_keys(presses)
+            try:
+                sleep_or_stop(duration, run_token)
+            except StopExecution:
+                pass
+            finally:
+                _inject_input_batch(releases)
+                track_pressed_keys(releases)
+        elif event_type == "mouse_path":
+            try:
+                if _INPUT_BACKEND is not None:
+                    _INPUT_BACKEND([event])
+                    sleep_or_stop(event.get("duration", 0), run_token)
+                else:
+                    _play_mouse_path(
+                        event.get("points", []),
+                        float(event.get("sample_interval", MOUSE_PATH_SAMPLE_INTERVAL)),
+                        run_token,
+                    )
+            except StopExecution:
+                pass
+        elif event_type in ("hold", "drag"):
             button = event.get("button", "left")
-            start_x, start_y = _coords_relative_to_absolute(float(start_x_rel), float(start_y_rel))
-            end_x, end_y = _coords_relative_to_absolute(float(end_x_rel), float(end_y_rel))
-            _mouse_drag(start_x, start_y, end_x, end_y, duration=duration, button=button)
-            _mouse_up(button)
+            with pressed_keys_lock:
+                held_buttons[button] = held_buttons.get(button, 0) + 1
+            try:
+                if _INPUT_BACKEND is not None:
+                    _INPUT_BACKEND([event])
+                    sleep_or_stop(event.get("duration", 0.3 if event_type == "hold" else 0), run_token)
+                elif event_type == "hold":
+                    x_rel = event.get("x")
+                    y_rel = event.get("y")
+                    duration = event.get("duration", 0.3)
+                    x, y = _coords_relative_to_absolute(float(x_rel), float(y_rel))
+                    _mouse_hold(x, y, duration=duration, button=button, stop_check=run_token)
+                elif event.get("path"):
+                    # Drag recorded with its mouse path: press, follow the path, release
+                    start_x, start_y = _coords_relative_to_absolute(float(event.get("start_x")), float(event.get("start_y")))
+                    pyautogui.moveTo(start_x, start_y)
+                    _mouse_down(button)
+                    try:
+                        _play_mouse_path(
+                            event["path"],
+                            float(event.get("sample_interval", MOUSE_PATH_SAMPLE_INTERVAL)),
+                            run_token,
+                        )
+                    finally:
+                        _mouse_up(button)
+                else:
+                    start_x_rel = event.get("start_x")
+                    start_y_rel = event.get("start_y")
+                    end_x_rel = event.get("end_x")
+                    end_y_rel = event.get("end_y")
+                    duration = event.get("duration", 0)
+                    start_x, start_y = _coords_relative_to_absolute(float(start_x_rel), float(start_y_rel))
+                    end_x, end_y = _coords_relative_to_absolute(float(end_x_rel), float(end_y_rel))
+                    _mouse_drag(start_x, start_y, end_x, end_y, duration=duration, button=button)
+                    _mouse_up(button)
+            except StopExecution:
+                pass
+            finally:
+                with pressed_keys_lock:
+                    held_buttons[button] -= 1
         elif event_type == "config_action":
             # Execute a complete config file as atomic operation
             config_path_str = event.get("config")
             if config_path_str:
                 try:
-                    config_path = Path(config_path_str)
-                    if not config_path.exists():
-                        config_path = Path(__file__).parent / config_path_str
-                    
-                    if config_path.exists():
+                    config_path = get_workspace().resolve(config_path_str)
+                    if config_path is not None:
                         data = load_steps(config_path)
                         # Execute the entire config file
                         run_timeline(
                             data,
-                            stop_check=stop_check,
+                            stop_check=run_token,
                             event_callback=None,
                             wait_for_events=True,
                         )
+                except DesyncError:
+                    raise
+                except StopExecution:
+                    pass
                 except Exception as e:
                     print(f"Error executing config_action: {e}")
-        elif event_type == "goods_ocr":
-            # Process goods image and auto-click the cheapest item
-            from processors.goods_processor import (
-                process_goods_image,
-                analyze_goods_data,
-                format_goods_ocr_items,
-            )
-            
-            try:
-                # Prioritize event-level template over global template
-                template_path = None
-                event_template = event.get("template")
-                template_key = event_template or goods_template
-                if template_key:
-                    if template_key in {"gudi", "wuling"}:
-                        template_path = template_key
-                    else:
-                        template_path = Path("templates") / template_key
-                result = process_goods_image(template_path=template_path)
-                logger = logging.getLogger("app")
-                logger.info(
-                    "goods_ocr result: template=%s",
-                    result.get("template"),
-                )
-                for item_line in format_goods_ocr_items(result):
-                    logger.info("goods_ocr item: %s", item_line)
-                analysis = analyze_goods_data(result)
-                if analysis:
-                    time.sleep(0.3)
-                    # Auto-click the cheapest item
-                    pyautogui.click(analysis["center_x"], analysis["center_y"])
-            except Exception as e:
-                print(f"Error executing goods_ocr: {e}")
-        elif event_type == "home_assist_ocr":
-            # Home Assistant OCR - recognize template and click if confidence > 90%
-            from processors.home_assistance_processor import process_home_assistance
-            
+        else:
+            handler = get_event_handler(event_type)
+            if handler is None:
+                print(f"Unknown event type: {event_type}")
+                return
             try:
-                result = process_home_assistance()
-                
-                if result["success"]:
-                    print(f"home_assist_ocr: {result['message']}")
-                else:
-                    print(f"home_assist_ocr: {result['message']}")
+                with timed("processor_seconds", event_type):
+                    handler(event, context)
+            except DesyncError:
+                raise
+            except StopExecution:
+                pass
             except Exception as e:
-                print(f"Error executing home_assist_ocr: {e}")
-        elif event_type == "item_drag":
+                print(f"Error executing {event_type}: {e}")
+
+    def run_worker(func: Callable, arg, name: str) -> None:
+        with span(name, "event"):
             try:
-                from processors.backpack_processor import process_item_drag
-                
-                item_id = event.get("item_id")
-                if not item_id:
-                    print("item_drag: Missing item_id")
-                else:
-                    result = process_item_drag(item_id)
-                    
-                    if result.get("success"):
-                        start = result["start"]
-                        end = result["end"]
-                        confidence = result.get("confidence", 0)
-                        print(f"item_drag: {item_id} dragged from {start} to {end}, confidence={confidence:.2%}")
+                func(arg)
+            except DesyncError as e:
+                # Hand the desync to the scheduling loop and stop the other workers
+                worker_errors.append(e)
+                run_token.cancel()
+
+    # Main thread scheduling loop
+    try:
+        index = 0
+        while index < len(schedule):
+            event_time, event = schedule[index]
+            if worker_errors:
+                raise worker_errors[0]
+            if run_token():
+                raise StopExecution("Stopped")
+            
+            target_time = start_time + event_time
+            
+            # Wait until the event's scheduled time (returns immediately on stop)
+            sleep_or_stop(target_time - clock.monotonic(), run_token)
+            if not clock.virtual:
+                observe("scheduler_lateness_seconds", max(0.0, clock.monotonic() - target_time))
+            
+            if "expect" in event and _VERIFY_CHECKPOINTS and not clock.virtual:
+                # Block the scheduler while checking, then shift later events like visual_wait
+                with span("checkpoint", "event", type=event.get("type")):
+                    verify_checkpoint(event, run_token, index=index)
+                shift = clock.monotonic() - target_time
+                start_time += shift
+                target_time += shift
+
+            if event.get("type") == "visual_wait":
+                # Block the scheduler, then shift later events to start from completion
+                if event_callback:
+                    event_callback(event)
+                override = get_handler_override()
+                with span("visual_wait", "event", until=event.get("until", "appear")):
+                    if override is not None:
+                        override(event, context)
+                        met = True
                     else:
-                        error = result.get("error", "Unknown error")
-                        print(f"item_drag: Failed - {error}")
-            except Exception as e:
-                print(f"Error executing item_drag: {e}")
-        elif event_type == "qingbao_loop":
-            from processors.qingbao_processor import run_qingbao_loop
+                        met = run_visual_wait(event, stop_check=run_token)
+                if not met:
+                    message = f"visual_wait timed out after {float(event.get('timeout', 10.0)):.1f}s"
+                    if event.get("on_timeout", "continue") == "abort":
+                        raise StopExecution(message)
+                    logging.getLogger("app").warning(message)
+                start_time += clock.monotonic() - target_time
+                index += 1
+                continue
+
+            # Coalesce following key/click events that fall inside the batch window
+            batch = [event]
+            index += 1
+            if event.get("type") in BATCHABLE_EVENT_TYPES:
+                while (
+                    index < len(schedule)
+                    and schedule[index][1].get("type") in BATCHABLE_EVENT_TYPES
+                    and "expect" not in schedule[index][1]
+                    and schedule[index][0] - event_time <= batch_window
+                ):
+                    batch.append(schedule[index][1])
+                    index += 1
+
+            if clock.virtual:
+                # Simulated workers run inline and only move the virtual clock
+                if len(batch) > 1:
+                    branch_ends.append(clock.run_branch(run_batch, batch, batch))
+                else:
+                    branch_ends.append(clock.run_branch(run_event, event, batch))
+                continue
 
-            try:
-                config_found = event.get("config_found")
-                config_not_found = event.get("config_not_found")
-                max_clicks = int(event.get("max_clicks", 5))
-                max_recognitions = int(event.get("max_recognitions", 20))
-                match_threshold = float(event.get("match_threshold", 0.7))
-
-                if not config_found or not config_not_found:
-                    raise ValueError("qingbao_loop requires config_found and config_not_found")
-
-                run_qingbao_loop(
-                    config_found=config_found,
-                    config_not_found=config_not_found,
-                    max_clicks=max_clicks,
-                    max_recognitions=max_recognitions,
-                    match_threshold=match_threshold,
-                    stop_check=stop_check,
+            # Spawn worker thread to execute this event (non-blocking)
+            if len(batch) > 1:
+                event_thread = threading.Thread(
+                    target=run_worker, args=(run_batch, batch, f"input batch x{len(batch)}"), daemon=True
                 )
-            except Exception as e:
-                print(f"Error executing qingbao_loop: {e}")
-        elif event_type == "plants_loop":
-            from processors.plants_processor import run_plants_harvest_loop
-
-            try:
-                max_iterations = int(event.get("max_iterations", 8))
-                result = run_plants_harvest_loop(
-                    stop_check=stop_check,
-                    max_iterations=max_iterations,
+            else:
+                event_thread = threading.Thread(
+                    target=run_worker, args=(run_event, event, event.get("type")), daemon=True
                 )
-                print(f"plants_loop result: {result['message']}")
-            except Exception as e:
-                print(f"Error executing plants_loop: {e}")
-        elif event_type == "clues_ocr":
-            from processors.clues_processor import process_clues_placement
+            event_thread.start()
+            event_threads.append(event_thread)
+    except StopExecution as e:
+        stopped = True
+        run_token.cancel()
+        if worker_errors and not isinstance(e, DesyncError):
+            raise worker_errors[0] from None
+        raise
+    except Exception:
+        stopped = True
+        run_token.cancel()
+        raise
+    finally:
+        if clock.virtual:
+            if wait_for_events and branch_ends:
+                clock.advance_to(max(branch_ends))
+        elif stopped:
+            # Workers observe the cancelled token; give them a bounded grace period
+            deadline = time.monotonic() + STOP_JOIN_TIMEOUT
+            for event_thread in event_threads:
+                event_thread.join(max(0.0, deadline - time.monotonic()))
+        elif wait_for_events:
+            # Wait for all event threads to finish before returning
+            for event_thread in event_threads:
+                event_thread.join()
+        if _INPUT_BACKEND is not None:
+            # Custom backends receive the cleanup releases as events
+            with pressed_keys_lock:
+                releases = [
+                    {"type": "key_release", "key": key_name}
+                    for key_name, count in pressed_keys.items()
+                    for _ in range(count)
+                ]
+            if releases:
+                _INPUT_BACKEND(releases)
+        else:
+            # Release any mouse buttons still held by hold/drag workers
+            with pressed_keys_lock:
+                for button, count in held_buttons.items():
+                    if count > 0:
+                        try:
+                            _mouse_up(button)
+                        except Exception:
+                            pass
+            # Release all pressed keys to ensure no keys are stuck
+            with pressed_keys_lock:
+                for key_name, count in pressed_keys.items():
+                    if count > 0:
+                        try:
+                            key_obj = _get_pynput_key(key_name)
+                            kb_ctrl = keyboard.Controller()
+                            for _ in range(count):
+                                kb_ctrl.release(key_obj)
+                        except Exception:
+                            pass
+        add_span("timeline", "timeline", trace_start, events=len(timeline), stopped=stopped)
+    if worker_errors:
+        # A worker desynced after the last event was scheduled
+        raise worker_errors[0]
+
+
+CHECKPOINT_DIR = Path("checkpoints")
+
+
+def checkpoint_path(config_path: Path | str) -> Path:
+    """Checkpoint file of a top-level composite config."""
+    path = Path(config_path)
+    digest = hashlib.sha1(str(path.resolve()).encode("utf-8")).hexdigest()[:8]
+    return CHECKPOINT_DIR / f"{path.stem}_{digest}.json"
+
+
+def load_checkpoint(config_path: Path | str) -> dict | None:
+    """Return the unfinished-run checkpoint of a composite config, or None."""
+    path = checkpoint_path(config_path)
+    if not path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.getLogger("app").warning(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if not isinstance(data, dict) or data.get("config") != str(config_path):
+        return None
+    return data
 
-            try:
-                confidence_threshold = float(event.get("confidence_threshold", 0.5))
-                min_matches = int(event.get("min_matches", 10))
-                
-                result = process_clues_placement(
-                    confidence_threshold=confidence_threshold,
-                    min_matches=min_matches,
-                    stop_check=stop_check,
-                )
-                
-                print(f"clues_ocr result: {result['message']}")
-            except Exception as e:
-                print(f"Error executing clues_ocr: {e}")
-        elif event_type == "receive_clue_ocr":
-            from ocr import recognize_compare_two_templates
 
-            try:
-                template1 = event.get("template1", "clues/receive_all.png")
-                template2 = event.get("template2", "clues/invite.png")
-                min_matches = int(event.get("min_matches", 10))
-                
-                screenshot = pyautogui.screenshot()
-                result = recognize_compare_two_templates(
-                    screenshot,
-                    template1,
-                    template2,
-                    min_matches=min_matches,
-                )
-                
-                if result and result["success"] and result["winner"] == "template1":
-                    # Click at the recognized position
-                    center_x = result["center_x"]
-                    center_y = result["center_y"]
-                    print(f"receive_clue_ocr: Clicking at ({center_x}, {center_y})")
-                    pyautogui.click(center_x, center_y)
-                else:
-                    print(f"receive_clue_ocr: {result['message'] if result else 'No match found'}")
-            except Exception as e:
-                print(f"Error executing receive_clue_ocr: {e}")
-        elif event_type == "gift_choice_ocr":
-            from ocr import recognize_compare_two_templates
+def _write_checkpoint(config_path: Path | str, data: dict) -> None:
+    """Atomically replace the checkpoint file (a crash leaves the old or new version)."""
+    path = checkpoint_path(config_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".json.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(config_path: Path | str) -> None:
+    try:
+        checkpoint_path(config_path).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _composite_step_key(item) -> str:
+    """Checkpoint identity of a composite step: its config path, or the block's JSON."""
+    if isinstance(item, dict) and item.get("config"):
+        return item["config"]
+    if isinstance(item, str):
+        return item
+    return json.dumps(item, sort_keys=True, ensure_ascii=False)
+
+
+def _config_end_state(config_path: Path | str | None) -> str:
+    if config_path is None:
+        return ""
+    try:
+        comment = load_steps(Path(config_path)).get("comment", {})
+    except (OSError, ValueError):
+        return ""
+    return comment.get("end_state", "") if isinstance(comment, dict) else ""
+
+
+def _describe_condition(condition: dict) -> str:
+    if "any" in condition:
+        return " or ".join(_describe_condition(sub) for sub in condition["any"])
+    if "all" in condition:
+        return " and ".join(_describe_condition(sub) for sub in condition["all"])
+    if "not" in condition:
+        return f"not {_describe_condition(condition['not'])}"
+    if condition.get("hash"):
+        name = f"keyframe {str(condition['hash'])[:8]}"
+    else:
+        name = Path(str(condition.get("template", "?"))).name
+    return name if condition.get("present", True) else f"no {name}"
+
+
+def describe_composite_item(item) -> str:
+    """Short display name of a composite step."""
+    if isinstance(item, dict) and "repeat" in item:
+        return f"repeat x{item['repeat']} ({len(item.get('configs', []))} steps)"
+    if isinstance(item, dict) and "repeat_while" in item:
+        return f"repeat while {_describe_condition(item['repeat_while'])} ({len(item.get('configs', []))} steps)"
+    if isinstance(item, dict) and "if" in item:
+        return (
+            f"if {_describe_condition(item['if'])}: "
+            f"{len(item.get('then', []))} then / {len(item.get('else', []))} else steps"
+        )
+    paths = composite_item_paths(item)
+    return Path(paths[0].replace("\\", "/")).name if paths else ""
+
+
+class CompositeState:
+    """
+    State shared by the steps of one composite run.
+
+    Configs are loaded once per run. One FrameAnalysis serves every block condition
+    evaluated until the next config step runs and changes the screen.
+    last_timeline is the timeline config that ran last, so a step's checkpoint
+    records the end state of the branch that actually ran.
+    """
+
+    def __init__(self) -> None:
+        self._configs: dict[str, dict] = {}
+        self._analysis = None
+        self.last_timeline: Path | None = None
+
+    def load(self, config_path: Path | str) -> dict:
+        key = str(config_path)
+        data = self._configs.get(key)
+        if data is None:
+            data = self._configs[key] = load_steps(Path(config_path))
+        return data
+
+    def frame_analysis(self):
+        from ocr import FrameAnalysis
+
+        if self._analysis is None:
+            self._analysis = FrameAnalysis()
+        return self._analysis
+
+    def invalidate_frame(self) -> None:
+        self._analysis = None
+
+
+def evaluate_condition(condition: dict, analysis, details: list[str] | None = None) -> bool:
+    """
+    Evaluate a composite block condition against a FrameAnalysis.
+
+    Condition fields:
+        template: Template name under templates/
+        hash / max_distance: Keyframe dHash (hex) and accepted Hamming distance, instead of a template
+        region: Optional relative [x1, y1, x2, y2] search region (keyframes default to the game area)
+        present: Expect the template/keyframe present (default true) or absent
+        min_matches / confidence_threshold: SIFT acceptance (default 10 / 0.5)
+    Conditions combine with {"any": [...]}, {"all": [...]} and {"not": {...}}.
+    If details is given, what was observed for each template/keyframe is appended to it.
+    """
+    from ocr import TEMPLATE_DIR
+
+    if "any" in condition:
+        return any(evaluate_condition(sub, analysis, details) for sub in condition["any"])
+    if "all" in condition:
+        return all(evaluate_condition(sub, analysis, details) for sub in condition["all"])
+    if "not" in condition:
+        return not evaluate_condition(condition["not"], analysis, details)
+
+    if condition.get("hash"):
+        from keyframes import DEFAULT_HASH_THRESHOLD, dhash, hash_distance
+
+        region = _region_relative_to_absolute(condition.get("region") or [0.0, 0.0, 1.0, 1.0])
+        distance = hash_distance(dhash(analysis.region_image(region)), int(str(condition["hash"]), 16))
+        max_distance = int(condition.get("max_distance", DEFAULT_HASH_THRESHOLD))
+        if details is not None:
+            details.append(f"keyframe distance {distance} (max {max_distance})")
+        return (distance <= max_distance) == bool(condition.get("present", True))
+
+    template_name = condition.get("template")
+    if not template_name:
+        raise ValueError(f"Composite condition requires a template or keyframe hash: {condition}")
+    result = analysis.find_template(
+        TEMPLATE_DIR / template_name,
+        region=_region_relative_to_absolute(condition.get("region")),
+        min_matches=int(condition.get("min_matches", 10)),
+    )
+    if details is not None:
+        observed = "not found" if result is None else f"confidence {result['confidence']:.2f}"
+        details.append(f"{Path(template_name).name} {observed}")
+    present = result is not None and result["confidence"] >= float(condition.get("confidence_threshold", 0.5))
+    return present == bool(condition.get("present", True))
+
+
+def _check_block_condition(condition: dict, state: CompositeState, iteration: int, simulated_iterations: int) -> bool:
+    if _CLOCK.virtual:
+        # Dry runs cannot look at the screen; take the simulated outcome instead
+        return iteration <= simulated_iterations
+    return evaluate_condition(condition, state.frame_analysis())
+
+
+def run_composite_item(
+    item,
+    stop_check: Callable[[], bool] | None = None,
+    event_callback: Callable[[dict], None] | None = None,
+    log_callback: Callable[[str], None] | None = None,
+    depth: int = 1,
+    state: CompositeState | None = None,
+) -> None:
+    """
+    Run one composite step: a {"config": path} entry or a block.
+
+    Blocks:
+        {"repeat": N, "configs": [...]}
+        {"repeat_while": condition, "configs": [...], "max_iterations": 20}
+        {"if": condition, "then": [...], "else": [...]}
+    See evaluate_condition() for the condition format. In dry runs conditions are
+    not evaluated: "if" takes its "then" branch unless it sets "simulated": false,
+    and "repeat_while" runs "simulated_iterations" times (default 1).
+
+    A composite break requested inside a block ends the block; the enclosing
+    composite then consumes it and stops.
+    """
+    if log_callback is None:
+        log_callback = logging.getLogger("app").info
+    if state is None:
+        state = CompositeState()
+    indent = "  " * depth
+
+    def run_items(items: list) -> bool:
+        """Run block steps in order; returns False when a composite break is pending."""
+        for sub_item in items:
+            if stop_check and stop_check():
+                raise StopExecution()
+            log_callback(f"{indent}  - {describe_composite_item(sub_item)}")
+            run_composite_item(sub_item, stop_check, event_callback, log_callback, depth + 1, state)
+            if COMPOSITE_BREAK_EVENT.is_set():
+                return False
+        return True
+
+    if isinstance(item, dict) and "repeat" in item:
+        count = max(0, int(item["repeat"]))
+        for iteration in range(1, count + 1):
+            log_callback(f"{indent}repeat {iteration}/{count}")
+            if not run_items(item.get("configs", [])):
+                break
+    elif isinstance(item, dict) and "repeat_while" in item:
+        max_iterations = int(item.get("max_iterations", 20))
+        simulated_iterations = int(item.get("simulated_iterations", 1))
+        for iteration in range(1, max_iterations + 1):
+            if stop_check and stop_check():
+                raise StopExecution()
+            if not _check_block_condition(item["repeat_while"], state, iteration, simulated_iterations):
+                log_callback(f"{indent}repeat_while: condition false after {iteration - 1} iteration(s)")
+                break
+            log_callback(f"{indent}repeat_while {iteration}/{max_iterations}")
+            if not run_items(item.get("configs", [])):
+                break
+        else:
+            log_callback(f"{indent}repeat_while: reached max_iterations={max_iterations}")
+    elif isinstance(item, dict) and "if" in item:
+        simulated = 1 if item.get("simulated", True) else 0
+        branch = "then" if _check_block_condition(item["if"], state, 1, simulated) else "else"
+        log_callback(f"{indent}if {_describe_condition(item['if'])}: {branch}")
+        run_items(item.get(branch) or [])
+    else:
+        sub_paths = composite_item_paths(item)
+        if not sub_paths:
+            return
+        sub_path = resolve_config_path(sub_paths[0])
+        if sub_path is None:
+            raise FileNotFoundError(f"Config not found: {sub_paths[0]}")
+        run_config(
+            sub_path,
+            stop_check=stop_check,
+            event_callback=event_callback,
+            log_callback=log_callback,
+            depth=depth,
+            wait_for_timeline=True,
+            state=state,
+        )
+        sub_data = state.load(sub_path)
+        if not (isinstance(sub_data, dict) and sub_data.get("type") == "composite"):
+            state.last_timeline = sub_path
+        # The step changed the screen; later conditions need a fresh frame
+        state.invalidate_frame()
+
+
+def run_config(
+    config_path: Path | str,
+    stop_check: Callable[[], bool] | None = None,
+    event_callback: Callable[[dict], None] | None = None,
+    log_callback: Callable[[str], None] | None = None,
+    depth: int = 0,
+    wait_for_timeline: bool = True,
+    resume: bool = False,
+    state: CompositeState | None = None,
+) -> None:
+    """
+    Run a timeline or (nested) composite config.
+
+    Composite steps run one after another, each waiting for its timeline events to
+    finish; steps may be repeat/repeat_while/if blocks (see run_composite_item). A
+    composite stops early when a step requests a break (see
+    request_composite_break). The top-level run pauses 0.5s before starting.
+
+    A top-level composite writes a checkpoint after each completed step (see
+    load_checkpoint); it is removed once the composite finishes. With resume=True the
+    steps recorded in an existing checkpoint are skipped.
+
+    Args:
+        config_path: Timeline or composite config file
+        stop_check: Stop callback or CancelToken, checked between steps and events
+        event_callback: Called with every timeline event as it fires
+        log_callback: Receives progress lines (defaults to the "app" logger)
+        depth: Nesting depth (0 for the top-level config)
+        wait_for_timeline: Wait for timeline event workers before returning
+        resume: Skip the steps completed in the checkpoint of an earlier run
+        state: Composite run state shared with nested steps (created when None)
+    """
+    if log_callback is None:
+        log_callback = logging.getLogger("app").info
+    if depth == 0:
+        clear_composite_break()
+        # Index configs once per run and report broken references before starting
+        unresolved = refresh_workspace().unresolved_references(config_path)
+        if unresolved:
+            log_callback(f"Warning: {len(unresolved)} unresolved config reference(s):\n{format_unresolved(unresolved)}")
+
+    if state is None:
+        state = CompositeState()
+    indent = "  " * depth
+    data = state.load(config_path)
+
+    with span(Path(config_path).name, "config", depth=depth, path=str(config_path)):
+        if isinstance(data, dict) and "timeline" in data:
+            timeline = data.get("timeline", [])
+            log_callback(f"{indent}Running timeline with {len(timeline)} events")
+
+            # Wait 0.5s at the start of top-level timeline
+            if depth == 0:
+                sleep_or_stop(0.5, stop_check)
 
             try:
-                template1 = event.get("template1", "gifts/receive_gift.png")
-                template2 = event.get("template2", "gifts/send_gift.png")
-                min_matches = int(event.get("min_matches", 10))
-                config_if_template1 = event.get("config_if_template1")
-                config_if_template2 = event.get("config_if_template2")
-                
-                screenshot = pyautogui.screenshot()
-                result = recognize_compare_two_templates(
-                    screenshot,
-                    template1,
-                    template2,
-                    min_matches=min_matches,
+                run_timeline(
+                    data,
+                    stop_check=stop_check,
+                    event_callback=event_callback,
+                    wait_for_events=wait_for_timeline,
                 )
-                
-                if result and result["winner"] == "template1":
-                    # Template1 (receive_gift) wins, execute config_if_template1
-                    print(f"gift_choice_ocr: {result['message']}, executing {config_if_template1}")
-                    if config_if_template1:
-                        config_path = Path(config_if_template1)
-                        if config_path.exists():
-                            steps = load_steps(config_path)
-                            run_timeline(
-                                steps,
-                                stop_check=stop_check,
-                                event_callback=event_callback,
-                                wait_for_events=wait_for_events,
-                            )
-                        else:
-                            print(f"gift_choice_ocr: Config not found: {config_path}")
-                elif result and result["winner"] == "template2":
-                    # Template2 (send_gift) wins, execute config_if_template2
-                    print(f"gift_choice_ocr: {result['message']}, executing {config_if_template2}")
-                    if config_if_template2:
-                        config_path = Path(config_if_template2)
-                        if config_path.exists():
-                            steps = load_steps(config_path)
-                            run_timeline(
-                                steps,
-                                stop_check=stop_check,
-                                event_callback=event_callback,
-                                wait_for_events=wait_for_events,
-                            )
-                        else:
-                            print(f"gift_choice_ocr: Config not found: {config_path}")
+            except DesyncError as e:
+                e.report.setdefault("config", str(config_path))
+                raise
+        elif isinstance(data, dict) and data.get("type") == "composite":
+            composite_list = data.get("configs", [])
+            log_callback(f"{indent}Running composite format with {len(composite_list)} nested configs")
+
+            # Wait 0.5s at the start of top-level composite
+            if depth == 0:
+                sleep_or_stop(0.5, stop_check)
+
+            step_keys = [_composite_step_key(item) for item in composite_list]
+
+            checkpoint = None
+            completed_steps: set[int] = set()
+            if depth == 0 and not _CLOCK.virtual:
+                previous = load_checkpoint(config_path) if resume else None
+                if previous is not None:
+                    checkpoint = previous
+                    # Only skip steps that are unchanged since the checkpoint
+                    completed_steps = {
+                        step["index"] for step in checkpoint.get("completed", [])
+                        if 0 < step.get("index", 0) <= len(step_keys)
+                        and step_keys[step["index"] - 1] == step.get("path")
+                    }
+                    log_callback(f"{indent}Resuming from checkpoint: {len(completed_steps)} step(s) already completed")
                 else:
-                    print(f"gift_choice_ocr: No match found or comparison failed")
-            except Exception as e:
-                print(f"Error executing gift_choice_ocr: {e}")
-        elif event_type == "collection_max_ocr":
-            from ocr import recognize_compare_two_templates
+                    checkpoint = {
+                        "config": str(config_path),
+                        "started": datetime.now().isoformat(timespec="seconds"),
+                        "completed": [],
+                    }
+                    _write_checkpoint(config_path, checkpoint)
+
+            for sub_idx, item in enumerate(composite_list, 1):
+                if stop_check and stop_check():
+                    raise StopExecution()
 
-            try:
-                template_full = event.get("template_full", "collection_max.png")
-                template_not_full = event.get("template_not_full", "collection_notmax.png")
-                min_matches = int(event.get("min_matches", 10))
-
-                screenshot = pyautogui.screenshot()
-                result = recognize_compare_two_templates(
-                    screenshot,
-                    template_full,
-                    template_not_full,
-                    min_matches=min_matches,
-                )
+                item_paths = composite_item_paths(item)
+                if not item_paths:
+                    continue
 
-                is_full = False
-                if result is not None:
-                    full_conf = float(result.get("confidence1", 0.0))
-                    not_full_conf = float(result.get("confidence2", 0.0))
-                    is_full = full_conf > not_full_conf
-                    print(
-                        f"collection_max_ocr: full={full_conf:.1f}%, "
-                        f"not_full={not_full_conf:.1f}%"
-                    )
-                else:
-                    print("collection_max_ocr: Comparison failed")
-
-                pyautogui.keyDown("esc")
-                time.sleep(0.05)
-                pyautogui.keyUp("esc")
-
-                if not is_full:
-                    pyautogui.keyDown("esc")
-                    time.sleep(0.05)
-                    pyautogui.keyUp("esc")
-                    request_composite_break()
-                    print("collection_max_ocr: Not full, requested composite stop")
-                else:
-                    print("collection_max_ocr: Full, continuing")
-            except Exception as e:
-                print(f"Error executing collection_max_ocr: {e}")
-        elif event_type == "find_npc_ocr":
-            from processors.npc_finder import find_npc_by_walking
+                step_label = f"{indent}  [{sub_idx}/{len(composite_list)}] {describe_composite_item(item)}"
+                if sub_idx in completed_steps:
+                    log_callback(f"{step_label} (completed, skipped)")
+                    continue
 
-            try:
-                confidence_threshold = float(event.get("confidence_threshold", 0.5))
-                min_matches = int(event.get("min_matches", 10))
-                
-                result = find_npc_by_walking(
-                    confidence_threshold=confidence_threshold,
-                    min_matches=min_matches,
-                    max_steps=9,
+                # Warm the next step's resources while this one plays
+                next_config_path = next(
+                    (paths[0] for paths in map(composite_item_paths, composite_list[sub_idx:]) if paths),
+                    None,
+                )
+                if next_config_path and not _CLOCK.virtual:
+                    next_resolved = get_workspace().resolve(next_config_path)
+                    if next_resolved is not None:
+                        prefetch_config(next_resolved)
+
+                log_callback(step_label)
+                state.last_timeline = None
+                run_composite_item(
+                    item,
                     stop_check=stop_check,
+                    event_callback=event_callback,
+                    log_callback=log_callback,
+                    depth=depth + 1,
+                    state=state,
                 )
-                
-                print(f"find_npc_ocr result: {result['message']}")
-            except Exception as e:
-                print(f"Error executing find_npc_ocr: {e}")
-
-    
-    # Main thread scheduling loop
-    try:
-        for event in events:
-            if stop_check and stop_check():                raise StopExecution("Stopped")
-            
-            event_time = float(event.get("time", 0))
-            target_time = start_time + event_time
-            
-            # Wait until the event's scheduled time
-            while True:
-                if stop_check and stop_check():
-                    raise StopExecution("Stopped")
-                now = time.monotonic()
-                remaining = target_time - now
-                if remaining <= 0:
+                if checkpoint is not None:
+                    checkpoint["completed"].append({
+                        "index": sub_idx,
+                        "path": step_keys[sub_idx - 1],
+                        "completed_at": datetime.now().isoformat(timespec="seconds"),
+                        "end_state": _config_end_state(state.last_timeline),
+                    })
+                    checkpoint["updated"] = datetime.now().isoformat(timespec="seconds")
+                    _write_checkpoint(config_path, checkpoint)
+                if consume_composite_break():
+                    log_callback(f"{indent}Composite stopped by collection check")
                     break
-                time.sleep(min(0.01, remaining))
-            
-            # Spawn worker thread to execute this event (non-blocking)
-            event_thread = threading.Thread(target=run_event, args=(event,), daemon=True)
-            event_thread.start()
-            event_threads.append(event_thread)
-    finally:
-        if wait_for_events:
-            # Wait for all event threads to finish before returning
-            for event_thread in event_threads:
-                event_thread.join()
-        # Release all pressed keys to ensure no keys are stuck
-        with pressed_keys_lock:
-            for key_name, count in pressed_keys.items():
-                if count > 0:
-                    try:
-                        key_obj = _get_pynput_key(key_name)
-                        kb_ctrl = keyboard.Controller()
-                        for _ in range(count):
-                            kb_ctrl.release(key_obj)
-                    except Exception:
-                        pass
+
+            if checkpoint is not None:
+                clear_checkpoint(config_path)
+        else:
+            raise ValueError(f"Unsupported config format: {config_path}")
@@ -0,0 +1,209 @@
+"""
+Command-line runner - plays a timeline or composite config without the GUI.
+
+Usage:
+    python cli.py configs/情报访问.json
+    python cli.py configs/一条龙comp.json --width 1920 --height 1080
+    python cli.py configs/一条龙comp.json --dry-run --speed-scale 0.6
+
+Press Ctrl+X (or Ctrl+C in the console) to stop.
+
+The GUI module is not loaded, but this is not tkinter-free: pyautogui imports
+tkinter through pymsgbox when it is installed, so a display may still be needed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import signal
+import sys
+from pathlib import Path
+
+from pynput import keyboard
+
+from automation import (
+    CancelToken,
+    DesyncError,
+    StopExecution,
+    run_config,
+    set_checkpoint_verification,
+    set_screen_transform,
+    set_speed_profile,
+)
+import metrics
+from key_taps import TAP_EVENT_TYPES, describe_tap
+from tracing import start_trace, stop_trace
+from workspace import format_unresolved, refresh_workspace
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout),
+        logging.FileHandler('endfield_helper.log', encoding='utf-8'),
+    ],
+)
+app_logger = logging.getLogger('app')
+
+DEFAULT_SETTINGS_PATH = Path("configs") / "user_settings.json"
+
+
+def load_user_settings(settings_path: Path) -> dict:
+    """Read user_settings.json written by the GUI; returns {} when unavailable."""
+    if not settings_path.exists():
+        return {}
+    try:
+        data = json.loads(settings_path.read_text(encoding="utf-8"))
+    except Exception as exc:
+        app_logger.error(f"Failed to read user settings: {exc}")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _format_event(event: dict) -> str:
+    event_time = float(event.get("time", 0))
+    event_type = event.get("type")
+    if event_type in ("key_press", "key_release"):
+        return f"T{event_time:.3f}: {event_type} {event.get('key', '?')}"
+    if event_type in TAP_EVENT_TYPES:
+        return f"T{event_time:.3f}: {event_type} {describe_tap(event)}"
+    if event_type in ("click", "hold", "drag"):
+        return f"T{event_time:.3f}: {event_type} {event.get('button', 'left')}"
+    return f"T{event_time:.3f}: {event_type}"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run an Endfield Helper config without the GUI.")
+    parser.add_argument("config", help="Timeline or composite config file")
+    parser.add_argument("--settings", default=str(DEFAULT_SETTINGS_PATH), help="User settings file")
+    parser.add_argument("--width", type=int, help="Screen width (overrides settings)")
+    parser.add_argument("--height", type=int, help="Screen height (overrides settings)")
+    parser.add_argument("--offset-x", type=int, help="Screen X offset (overrides settings)")
+    parser.add_argument("--offset-y", type=int, help="Screen Y offset (overrides settings)")
+    parser.add_argument("--speed-scale", type=float, help="Idle gap scale (overrides settings)")
+    parser.add_argument("--max-idle-gap", type=float, help="Maximum idle gap in seconds (overrides settings)")
+    parser.add_argument("--allow-missing", action="store_true", help="Run even if referenced configs are missing")
+    parser.add_argument("--resume", action="store_true", help="Skip composite steps completed by an unfinished earlier run")
+    parser.add_argument("--no-verify", action="store_true", help="Do not check the expected screen at checkpoint events")
+    parser.add_argument("--no-hotkey", action="store_true", help="Disable the Ctrl+X stop hotkey")
+    parser.add_argument("--quiet", action="store_true", help="Do not log individual events")
+    parser.add_argument(
+        "--trace",
+        nargs="?",
+        const="",
+        help="Write a Chrome trace of the run (default: traces/run_<timestamp>.json)",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Simulate the run on a virtual clock and print a report")
+    parser.add_argument("--sim-durations", help="JSON file of simulated seconds per processor event type")
+    return parser
+
+
+def _pick(value, settings: dict, key: str, default):
+    if value is not None:
+        return value
+    setting = settings.get(key)
+    return default if setting is None else setting
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Run a config from the command line.
+
+    Returns:
+        0 when the config completed, 1 when it was stopped, 2 on error or playback desync
+    """
+    args = build_parser().parse_args(argv)
+
+    config_path = Path(args.config)
+    if not config_path.exists():
+        app_logger.error(f"Config not found: {config_path}")
+        return 2
+
+    unresolved = refresh_workspace().unresolved_references(config_path)
+    if unresolved:
+        app_logger.warning(
+            f"{len(unresolved)} unresolved config reference(s):\n{format_unresolved(unresolved, limit=100)}"
+        )
+        if not args.allow_missing and not args.dry_run:
+            app_logger.error("Aborting; fix the references or pass --allow-missing")
+            return 2
+
+    settings = load_user_settings(Path(args.settings))
+    set_screen_transform(
+        int(_pick(args.width, settings, "screen_width", 2560)),
+        int(_pick(args.height, settings, "screen_height", 1600)),
+        int(_pick(args.offset_x, settings, "screen_offset_x", 0)),
+        int(_pick(args.offset_y, settings, "screen_offset_y", 0)),
+    )
+    max_gap = _pick(args.max_idle_gap, settings, "max_idle_gap", None)
+    set_speed_profile(
+        scale=float(_pick(args.speed_scale, settings, "speed_scale", 1.0)),
+        max_gap=None if max_gap is None else float(max_gap),
+    )
+    set_checkpoint_verification(not args.no_verify)
+
+    if args.dry_run:
+        from simulation import format_report, load_processor_durations, simulate_config
+
+        durations = load_processor_durations(args.sim_durations) if args.sim_durations else None
+        result = simulate_config(config_path, processor_durations=durations)
+        print(format_report(result))
+        return 0
+
+    stop_token = CancelToken()
+    hotkey_listener = None
+    if not args.no_hotkey:
+        hotkey_listener = keyboard.GlobalHotKeys({"<ctrl>+x": stop_token.cancel})
+        hotkey_listener.start()
+
+    # Ctrl+C cancels the token so workers stop and held inputs are released
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_token.cancel())
+
+    event_callback = None if args.quiet else (lambda event: app_logger.info(_format_event(event)))
+
+    if args.trace is not None:
+        start_trace(args.trace or None)
+
+    app_logger.info(f"Running config: {config_path}")
+    metrics.start_run()
+    run_status = "failed"
+    try:
+        run_config(
+            config_path,
+            stop_check=stop_token,
+            event_callback=event_callback,
+            log_callback=app_logger.info,
+            resume=args.resume,
+        )
+        run_status = "completed"
+    except DesyncError as exc:
+        run_status = "desync"
+        app_logger.error(f"Aborted: {exc}")
+        return 2
+    except (StopExecution, KeyboardInterrupt):
+        run_status = "stopped"
+        stop_token.cancel()
+        latency = stop_token.latency()
+        if latency is not None:
+            app_logger.info(f"Stopped ({latency * 1000:.0f} ms)")
+        else:
+            app_logger.info("Stopped")
+        return 1
+    except Exception as exc:
+        app_logger.error(f"Config run failed: {exc}")
+        return 2
+    finally:
+        if hotkey_listener:
+            hotkey_listener.stop()
+        metrics.finish_run(config_path, run_status)
+        stop_trace()
+
+    app_logger.info("Config completed")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -18,18 +18,29 @@ from PIL import Image, ImageTk
 
 from automation import (
     Recorder,
+    DesyncError,
     StopExecution,
+    CancelToken,
     load_steps,
     save_steps,
-    consume_composite_break,
-    clear_composite_break,
+    set_speed_profile,
+    estimate_config_duration,
+    run_config,
+    load_checkpoint,
+    describe_composite_item,
     get_screen_size,
     get_screen_offset,
     set_screen_transform,
 )
 from processors.goods_processor import process_goods_image, analyze_goods_data
+from tracing import start_trace, stop_trace
+from workspace import format_unresolved, refresh_workspace
+import metrics
 from processors.home_assistance_processor import process_home_assistance
 from i18n import I18n
+from key_taps import TAP_EVENT_TYPES, describe_tap, parse_tap_keys
+from keyframes import save_keyframes
+from recording_journal import journal_path, recover_journal
 
 # ===== Directional Mouse Control via Arrow Keys =====
 user32 = ctypes.windll.user32
@@ -240,6 +251,11 @@ def start_gui() -> int:
     screen_height_var = tk.StringVar(value="1600")
     screen_offset_x_var = tk.StringVar(value="0")
     screen_offset_y_var = tk.StringVar(value="0")
+    speed_scale_var = tk.StringVar(value="1.0")
+    max_idle_gap_var = tk.StringVar(value="")
+    trace_runs_var = tk.BooleanVar(value=False)
+    record_keyframes_var = tk.BooleanVar(value=False)
+    record_mouse_path_var = tk.BooleanVar(value=False)
     user_settings_path = Path("configs") / "user_settings.json"
     config_folder = None  # Store the selected config folder
     config_files = []  # Store the list of config files
@@ -250,7 +266,7 @@ def start_gui() -> int:
     re_recording_mode = None  # Track re-recording mode: 're-record', 'insert-above', 'insert-below'
     
     running = False
-    stop_event = threading.Event()
+    stop_token = CancelToken()
     idle_listener = None
     hotkey_listener = None
     should_close = False
@@ -515,7 +531,7 @@ def start_gui() -> int:
         
         composite_data = {
             "type": "composite",
-            "configs": [{"config": str(cfg)} for cfg in composite_configs],
+            "configs": [cfg if isinstance(cfg, dict) else {"config": str(cfg)} for cfg in composite_configs],
             "comment": {
                 "start_state": comment_start_state.get("1.0", tk.END).rstrip(),
                 "logic": comment_logic.get("1.0", tk.END).rstrip(),
@@ -543,7 +559,11 @@ def start_gui() -> int:
                 data = json.load(f)
             
             if isinstance(data, dict) and data.get("type") == "composite":
-                composite_configs = [item["config"] for item in data.get("configs", [])]
+                # Plain steps are kept as paths; repeat/if blocks are kept as-is
+                composite_configs = [
+                    item["config"] if isinstance(item, dict) and "config" in item else item
+                    for item in data.get("configs", [])
+                ]
                 # Load and display comment
                 comment = data.get("comment", {})
                 if isinstance(comment, str):
@@ -553,7 +573,7 @@ def start_gui() -> int:
                 config_comment_var.set(json.dumps(comment, ensure_ascii=False))
                 composite_listbox.delete(0, tk.END)
                 for cfg in composite_configs:
-                    composite_listbox.insert(tk.END, Path(cfg).name)
+                    composite_listbox.insert(tk.END, describe_composite_item(cfg))
                 app_logger.info(f"Loaded composite config from {config_path} with {len(composite_configs)} items")
                 return True
             return False
@@ -579,98 +599,81 @@ def start_gui() -> int:
         if not config_path.exists():
             messagebox.showerror(i18n.t("error"), i18n.t("config_not_found"))
             return
-        
-        # Define recursive config executor (shared by both modes)
-        def execute_config_recursive(
-            config_path: Path | str,
-            depth: int = 0,
-            wait_for_timeline: bool = False,
-        ) -> None:
-            """Recursively execute a config that may contain nested composites."""
-            indent = "  " * depth
-            data = load_steps(config_path)
-            
-            if isinstance(data, dict) and "timeline" in data:
-                # Timeline format
-                from automation import run_timeline
-                timeline = data.get("timeline", [])
-                ui_call(append_log_line, f"{indent}Running timeline with {len(timeline)} events")
-                
-                # Wait 0.5s at the start of top-level timeline
-                if depth == 0:
-                    time.sleep(0.5)
-                
-                def log_event(event: dict) -> None:
-                    event_time = float(event.get("time", 0))
-                    event_type = event.get("type")
-                    if event_type == "key_press":
-                        key_name = event.get("key", "?")
-                        line = f"T{event_time:.3f}: key_press {key_name}"
-                    elif event_type == "key_release":
-                        key_name = event.get("key", "?")
-                        line = f"T{event_time:.3f}: key_release {key_name}"
-                    elif event_type == "click":
-                        x = _format_coord(event.get("x"), "x")
-                        y = _format_coord(event.get("y"), "y")
-                        button = event.get("button", "left")
-                        line = f"T{event_time:.3f}: click {button} ({x}, {y})"
-                    elif event_type == "hold":
-                        x = _format_coord(event.get("x"), "x")
-                        y = _format_coord(event.get("y"), "y")
-                        button = event.get("button", "left")
-                        duration = event.get("duration", 0)
-                        line = f"T{event_time:.3f}: hold {button} ({x}, {y}) {duration:.3f}s"
-                    elif event_type == "drag":
-                        start_x = _format_coord(event.get("start_x"), "x")
-                        start_y = _format_coord(event.get("start_y"), "y")
-                        end_x = _format_coord(event.get("end_x"), "x")
-                        end_y = _format_coord(event.get("end_y"), "y")
-                        duration = event.get("duration", 0)
-                        button = event.get("button", "left")
-                        line = f"T{event_time:.3f}: drag {button} ({start_x}, {start_y}) -> ({end_x}, {end_y}) {duration:.3f}s"
 
-                    else:
-                        line = f"T{event_time:.3f}: {event_type}"
-                    ui_call(append_log_line, line)
-                
-                run_timeline(
-                    data,
-                    stop_check=stop_event.is_set,
-                    event_callback=log_event,
-                    wait_for_events=wait_for_timeline,
-                )
-            elif isinstance(data, dict) and data.get("type") == "composite":
-                # Nested composite format
-                composite_list = data.get("configs", [])
-                ui_call(append_log_line, f"{indent}Running composite format with {len(composite_list)} nested configs")
-                
-                # Wait 0.5s at the start of top-level composite
-                if depth == 0:
-                    time.sleep(0.5)
-                
-                for sub_idx, item in enumerate(composite_list, 1):
-                    if stop_event.is_set():
-                        raise StopExecution()
-                    
-                    sub_config_path = item.get("config") if isinstance(item, dict) else item
-                    if not sub_config_path:
-                        continue
-                    
-                    ui_call(append_log_line, f"{indent}  [{sub_idx}/{len(composite_list)}] {Path(sub_config_path).name}")
-                    execute_config_recursive(
-                        Path(sub_config_path),
-                        depth + 1,
-                        wait_for_timeline=True,
-                    )
-                    if consume_composite_break():
-                        ui_call(append_log_line, f"{indent}Composite stopped by collection check")
-                        break
+        # Report broken config references before a long run starts
+        unresolved = refresh_workspace().unresolved_references(config_path)
+        if unresolved:
+            app_logger.warning(f"Unresolved config references:\n{format_unresolved(unresolved, limit=100)}")
+            if not messagebox.askyesno(
+                i18n.t("unresolved_title"),
+                i18n.t("unresolved_message", count=len(unresolved), details=format_unresolved(unresolved)),
+                icon='warning',
+            ):
+                return
+
+        # Offer to resume an unfinished composite run
+        resume = False
+        checkpoint = load_checkpoint(config_path)
+        if checkpoint and checkpoint.get("completed"):
+            try:
+                total = len(load_steps(config_path).get("configs", []))
+            except (OSError, ValueError):
+                total = 0
+            answer = messagebox.askyesnocancel(
+                i18n.t("resume_title"),
+                i18n.t(
+                    "resume_message",
+                    filename=config_path.name,
+                    done=len(checkpoint["completed"]),
+                    total=total,
+                    last=Path(checkpoint["completed"][-1]["path"]).name,
+                ),
+            )
+            if answer is None:
+                return
+            resume = answer
+        
+        def log_event(event: dict) -> None:
+            event_time = float(event.get("time", 0))
+            event_type = event.get("type")
+            if event_type == "key_press":
+                key_name = event.get("key", "?")
+                line = f"T{event_time:.3f}: key_press {key_name}"
+            elif event_type == "key_release":
+                key_name = event.get("key", "?")
+                line = f"T{event_time:.3f}: key_release {key_name}"
+            elif event_type in TAP_EVENT_TYPES:
+                duration = float(event.get("duration", 0))
+                line = f"T{event_time:.3f}: {event_type} {describe_tap(event)} {duration:.3f}s"
+            elif event_type == "click":
+                x = _format_coord(event.get("x"), "x")
+                y = _format_coord(event.get("y"), "y")
+                button = event.get("button", "left")
+                line = f"T{event_time:.3f}: click {button} ({x}, {y})"
+            elif event_type == "hold":
+                x = _format_coord(event.get("x"), "x")
+                y = _format_coord(event.get("y"), "y")
+                button = event.get("button", "left")
+                duration = event.get("duration", 0)
+                line = f"T{event_time:.3f}: hold {button} ({x}, {y}) {duration:.3f}s"
+            elif event_type == "drag":
+                start_x = _format_coord(event.get("start_x"), "x")
+                start_y = _format_coord(event.get("start_y"), "y")
+                end_x = _format_coord(event.get("end_x"), "x")
+                end_y = _format_coord(event.get("end_y"), "y")
+                duration = event.get("duration", 0)
+                button = event.get("button", "left")
+                line = f"T{event_time:.3f}: drag {button} ({start_x}, {start_y}) -> ({end_x}, {end_y}) {duration:.3f}s"
+
+            else:
+                line = f"T{event_time:.3f}: {event_type}"
+            ui_call(append_log_line, line)
 
         log_text.config(state=tk.NORMAL)
         log_text.delete("1.0", tk.END)
         log_text.config(state=tk.DISABLED)
 
-        stop_event.clear()
+        stop_token.reset()
         running = True
         set_controls(recorder.recording, running)
         status_var.set("Loading config...")
@@ -687,27 +690,54 @@ def start_gui() -> int:
         def finalize_run() -> None:
             nonlocal running
             running = False
-            stop_event.clear()
+            stop_token.reset()
             set_controls(recorder.recording, running)
             time.sleep(0.5)
             show_gui()
 
+        trace_enabled = trace_runs_var.get()
+
         def execute() -> None:
+            if trace_enabled:
+                start_trace()
+            metrics.start_run()
+            run_status = "failed"
             try:
                 pyautogui.FAILSAFE = True
-                clear_composite_break()
                 ui_call(status_var.set, "Running config...")
-                execute_config_recursive(config_path, wait_for_timeline=True)
+                run_config(
+                    config_path,
+                    stop_check=stop_token,
+                    event_callback=log_event,
+                    log_callback=lambda line: ui_call(append_log_line, line),
+                    resume=resume,
+                )
                 ui_call(status_var.set, "Run complete.")
                 app_logger.info("Config execution completed successfully")
+                run_status = "completed"
+            except DesyncError as exc:
+                run_status = "desync"
+                ui_call(status_var.set, "Run aborted: playback out of sync.")
+                ui_call(append_log_line, str(exc))
+                app_logger.error(f"Config execution aborted: {exc}")
             except StopExecution:
-                ui_call(status_var.set, "Run stopped.")
-                app_logger.info("Config execution stopped by user")
+                run_status = "stopped"
+                latency = stop_token.latency()
+                if latency is not None:
+                    ui_call(status_var.set, f"Run stopped ({latency * 1000:.0f} ms after request).")
+                    app_logger.info(f"Config execution stopped by user, stop latency {latency * 1000:.0f} ms")
+                else:
+                    ui_call(status_var.set, "Run stopped.")
+                    app_logger.info("Config execution stopped by user")
             except (OSError, ValueError) as exc:
                 ui_call(messagebox.showerror, "Error", f"Failed to run config: {exc}")
                 ui_call(status_var.set, "Idle")
                 app_logger.error(f"Failed to run config: {exc}", exc_info=True)
             finally:
+                metrics.finish_run(config_path, run_status)
+                trace_path = stop_trace()
+                if trace_path is not None:
+                    ui_call(append_log_line, f"Trace written: {trace_path}")
                 ui_call(finalize_run)
 
         threading.Thread(target=execute, daemon=True).start()
@@ -806,6 +836,25 @@ def start_gui() -> int:
         except Exception:
             return {"start_state": "", "logic": "", "end_state": "", "other_info": ""}
 
+    def show_projected_runtime(config_path: Path) -> None:
+        """Show recorded vs. speed-profile runtime of a config in the status bar."""
+        try:
+            recorded, effective = estimate_config_duration(config_path)
+        except Exception as e:
+            app_logger.warning(f"Failed to estimate runtime of {config_path}: {e}")
+            return
+        if recorded <= 0:
+            return
+        status_var.set(
+            i18n.t(
+                "projected_runtime",
+                name=config_path.name,
+                recorded=recorded,
+                effective=effective,
+                saved=recorded - effective,
+            )
+        )
+
     def on_config_select(event) -> None:
         """Handle config selection from tree."""
         selection = config_tree.selection()
@@ -821,6 +870,7 @@ def start_gui() -> int:
                 update_comment_text_from_var(comment)
                 config_comment_var.set(json.dumps(comment, ensure_ascii=False))
                 app_logger.info(f"Config selected from list: {config_path}")
+                show_projected_runtime(config_path)
                 
                 # Refresh edit view to show the selected config
                 refresh_edit_view()
@@ -1071,7 +1121,7 @@ def start_gui() -> int:
             composite_configs[idx], composite_configs[idx-1] = composite_configs[idx-1], composite_configs[idx]
             # Update listbox
             composite_listbox.delete(idx)
-            composite_listbox.insert(idx-1, Path(composite_configs[idx-1]).name)
+            composite_listbox.insert(idx-1, describe_composite_item(composite_configs[idx-1]))
             composite_listbox.selection_set(idx-1)
             app_logger.info(f"Moved up: {composite_configs[idx-1]}")
     
@@ -1084,7 +1134,7 @@ def start_gui() -> int:
             composite_configs[idx], composite_configs[idx+1] = composite_configs[idx+1], composite_configs[idx]
             # Update listbox
             composite_listbox.delete(idx)
-            composite_listbox.insert(idx+1, Path(composite_configs[idx+1]).name)
+            composite_listbox.insert(idx+1, describe_composite_item(composite_configs[idx+1]))
             composite_listbox.selection_set(idx+1)
             app_logger.info(f"Moved down: {composite_configs[idx+1]}")
 
@@ -1132,6 +1182,8 @@ def start_gui() -> int:
         "drag_right",
         "key_press",
         "key_release",
+        "tap",
+        "chord",
     ]
 
     legacy_type_options = [
@@ -1174,7 +1226,7 @@ def start_gui() -> int:
         if event_type in ("click", "hold", "drag"):
             button = event.get("button", "left")
             return f"{event_type}_{button}"
-        if event_type in ("key_press", "key_release"):
+        if event_type in ("key_press", "key_release", "tap", "chord"):
             return event_type
         return event_type
 
@@ -1195,6 +1247,17 @@ def start_gui() -> int:
                 event["key"] = ""
             return
 
+        if display_type in TAP_EVENT_TYPES:
+            event["type"] = display_type
+            event.pop("button", None)
+            event.setdefault("key", "")
+            event.setdefault("duration", 0.05)
+            if display_type == "chord":
+                event.setdefault("modifiers", ["ctrl"])
+            else:
+                event.pop("modifiers", None)
+            return
+
         if "_" in display_type:
             base, button = display_type.split("_", 1)
         else:
@@ -1271,6 +1334,9 @@ def start_gui() -> int:
             duration = f"{float(event.get('duration', 0)):.3f}"
         elif event.get("type") in ("key_press", "key_release"):
             key = str(event.get("key", ""))
+        elif event.get("type") in TAP_EVENT_TYPES:
+            duration = f"{float(event.get('duration', 0)):.3f}"
+            key = describe_tap(event)
 
         return (time_str, display_type, x1, y1, x2, y2, duration, key)
 
@@ -1314,8 +1380,10 @@ def start_gui() -> int:
             # Display composite configs
             configs = edit_data.get("configs", [])
             for idx, item in enumerate(configs):
-                config_name = Path(item.get("config", "")).name
-                edit_tree.insert("", "end", values=(str(idx), "Config", config_name), tags=("composite",))
+                item_kind = "Config" if isinstance(item, str) or "config" in item else "Block"
+                edit_tree.insert(
+                    "", "end", values=(str(idx), item_kind, describe_composite_item(item)), tags=("composite",)
+                )
             app_logger.info(f"Displayed composite config with {len(configs)} items")
             
         elif isinstance(edit_data, dict) and "timeline" in edit_data:
@@ -1503,6 +1571,8 @@ def start_gui() -> int:
         
         def begin() -> None:
             minimize_gui()
+            # Steps of a config being edited have no keyframe sidecar of their own
+            recorder.record_keyframes = False
             recorder.start()
             app_logger.info(f"Started {mode} for step {item_index}")
             if mode == "re-record":
@@ -1683,6 +1753,11 @@ def start_gui() -> int:
                 "action": "key",
                 "key": event.get("key", "")
             }
+        elif event_type in TAP_EVENT_TYPES:
+            return {
+                "action": "key",
+                "key": describe_tap(event)
+            }
         else:
             # Return the event as-is
             return {k: v for k, v in event.items() if k != "time"}
@@ -1844,10 +1919,24 @@ def start_gui() -> int:
                 place_entry(current_key, save_key)
                 return
 
+            if column_key == "key" and current_type in TAP_EVENT_TYPES:
+
+                def save_tap_keys(value: str) -> None:
+                    modifiers, key_name = parse_tap_keys(value.strip())
+                    current_event["key"] = key_name
+                    if current_type == "chord":
+                        current_event["modifiers"] = modifiers
+                    refresh_edit_tree()
+
+                place_entry(describe_tap(current_event), save_tap_keys)
+                return
+
             if column_key in ("x1", "y1", "x2", "y2", "duration"):
                 allowed = False
                 if current_type in ("click", "hold"):
                     allowed = column_key in ("x1", "y1", "duration")
+                elif current_type in TAP_EVENT_TYPES:
+                    allowed = column_key == "duration"
                 elif current_type == "drag":
                     allowed = column_key in ("x1", "y1", "x2", "y2", "duration")
                 if not allowed:
@@ -2089,6 +2178,7 @@ def start_gui() -> int:
             return
 
         set_screen_transform(width, height, offset_x, offset_y)
+        _apply_speed_profile_from_vars()
         status_var.set(
             i18n.t(
                 "screen_applied",
@@ -2099,6 +2189,16 @@ def start_gui() -> int:
             )
         )
 
+    def _apply_speed_profile_from_vars() -> None:
+        try:
+            scale = float(speed_scale_var.get().strip() or 1.0)
+            max_gap_text = max_idle_gap_var.get().strip()
+            max_gap = float(max_gap_text) if max_gap_text else None
+        except ValueError:
+            app_logger.warning("Invalid speed profile settings, using recorded timing")
+            scale, max_gap = 1.0, None
+        set_speed_profile(scale=scale, max_gap=max_gap)
+
     def _load_user_settings() -> None:
         if not user_settings_path.exists():
             return
@@ -2112,6 +2212,12 @@ def start_gui() -> int:
             screen_height_var.set(str(data.get("screen_height", screen_height_var.get())))
             screen_offset_x_var.set(str(data.get("screen_offset_x", screen_offset_x_var.get())))
             screen_offset_y_var.set(str(data.get("screen_offset_y", screen_offset_y_var.get())))
+            speed_scale_var.set(str(data.get("speed_scale", speed_scale_var.get())))
+            max_idle_gap = data.get("max_idle_gap")
+            max_idle_gap_var.set("" if max_idle_gap is None else str(max_idle_gap))
+            trace_runs_var.set(bool(data.get("trace_runs", trace_runs_var.get())))
+            record_keyframes_var.set(bool(data.get("record_keyframes", record_keyframes_var.get())))
+            record_mouse_path_var.set(bool(data.get("record_mouse_path", record_mouse_path_var.get())))
 
     def _save_user_settings() -> None:
         try:
@@ -2120,6 +2226,11 @@ def start_gui() -> int:
                 "screen_height": int(float(screen_height_var.get().strip())),
                 "screen_offset_x": int(float(screen_offset_x_var.get().strip())),
                 "screen_offset_y": int(float(screen_offset_y_var.get().strip())),
+                "speed_scale": float(speed_scale_var.get().strip() or 1.0),
+                "max_idle_gap": float(max_idle_gap_var.get()) if max_idle_gap_var.get().strip() else None,
+                "trace_runs": bool(trace_runs_var.get()),
+                "record_keyframes": bool(record_keyframes_var.get()),
+                "record_mouse_path": bool(record_mouse_path_var.get()),
             }
         except ValueError:
             return
@@ -2153,6 +2264,11 @@ def start_gui() -> int:
         add_row(body, i18n.t("screen_height"), screen_height_var)
         add_row(body, i18n.t("screen_offset_x"), screen_offset_x_var)
         add_row(body, i18n.t("screen_offset_y"), screen_offset_y_var)
+        add_row(body, i18n.t("speed_scale"), speed_scale_var)
+        add_row(body, i18n.t("max_idle_gap"), max_idle_gap_var)
+        tk.Checkbutton(body, text=i18n.t("trace_runs"), variable=trace_runs_var, anchor=tk.W).pack(fill=tk.X, pady=2)
+        tk.Checkbutton(body, text=i18n.t("record_keyframes"), variable=record_keyframes_var, anchor=tk.W).pack(fill=tk.X, pady=2)
+        tk.Checkbutton(body, text=i18n.t("record_mouse_path"), variable=record_mouse_path_var, anchor=tk.W).pack(fill=tk.X, pady=2)
 
         button_row = tk.Frame(dialog, padx=10, pady=8)
         button_row.pack(fill=tk.X)
@@ -2183,6 +2299,36 @@ def start_gui() -> int:
             messagebox.showerror(i18n.t("error"), i18n.t("error_choose_config"))
             return
         app_logger.info(f"Starting recording to: {config_path}")
+        journal = journal_path(config_path)
+        if journal.exists():
+            try:
+                recovered = recover_journal(config_path)
+            except (OSError, ValueError) as exc:
+                app_logger.error(f"Failed to read recording journal {journal}: {exc}")
+                recovered = None
+            if recovered is not None and recovered["timeline"]:
+                answer = messagebox.askyesnocancel(
+                    i18n.t("recover_recording_title"),
+                    i18n.t(
+                        "recover_recording_message",
+                        filename=config_path.name,
+                        count=len(recovered["timeline"]),
+                    ),
+                )
+                if answer is None:
+                    return
+                if answer:
+                    try:
+                        save_steps(config_path, recovered)
+                    except OSError as exc:
+                        messagebox.showerror(i18n.t("error"), i18n.t("error_save", error=str(exc)))
+                        return
+                    journal.unlink()
+                    count = len(recovered["timeline"])
+                    status_var.set(i18n.t("recording_saved", count=count, path=config_path))
+                    app_logger.info(f"Recovered {count} events into {config_path}")
+                    return
+            journal.unlink()
         if config_path.exists():
             overwrite = messagebox.askyesno(
                 i18n.t("overwrite_warning_title"),
@@ -2203,7 +2349,9 @@ def start_gui() -> int:
 
         def begin() -> None:
             minimize_gui()
-            recorder.start()
+            recorder.record_keyframes = record_keyframes_var.get()
+            recorder.record_mouse_path = record_mouse_path_var.get()
+            recorder.start(journal=journal)
             app_logger.info("Recording started")
             status_var.set(i18n.t("recording_status"))
 
@@ -2240,10 +2388,14 @@ def start_gui() -> int:
         
         try:
             save_steps(config_path, data)
+            keyframes_file = save_keyframes(config_path, recorder.keyframes, data["timeline"])
         except OSError as exc:
             messagebox.showerror(i18n.t("error"), i18n.t("error_save", error=str(exc)))
             app_logger.error(f"Failed to save recording: {exc}")
         else:
+            recorder.discard_journal()
+            if keyframes_file is not None:
+                app_logger.info(f"Saved {len(recorder.keyframes)} keyframes to {keyframes_file}")
             # Count items for status message
             step_count = len(data.get("timeline", []))
             status_var.set(i18n.t("recording_saved", count=step_count, path=config_path))
@@ -2642,7 +2794,7 @@ def start_gui() -> int:
 
     def on_hotkey_stop() -> None:
         if running:
-            stop_event.set()
+            stop_token.cancel()
             status_var.set("Stopping...")
             return
         if recorder.recording:
@@ -16,6 +16,11 @@ TRANSLATIONS = {
         "screen_height": "Height",
         "screen_offset_x": "Offset X",
         "screen_offset_y": "Offset Y",
+        "speed_scale": "Speed Scale",
+        "max_idle_gap": "Max Idle Gap",
+        "trace_runs": "Write execution trace",
+        "record_keyframes": "Capture keyframes while recording",
+        "record_mouse_path": "Record mouse movement",
         
         # Buttons - Main
         "start_recording": "Start Recording",
@@ -89,6 +94,7 @@ TRANSLATIONS = {
         "comment_saved": "Comment saved",
         "screen_invalid": "Please enter valid integers for width, height, and offsets.",
         "screen_applied": "Applied: {width}x{height} offset=({offset_x}, {offset_y})",
+        "projected_runtime": "{name}: recorded {recorded:.1f}s, projected {effective:.1f}s (saves {saved:.1f}s)",
         
         # Instructions
         "composite_instructions": "Double-click configs from right panel to add • Double-click/Del to remove • ↑↓ to reorder",
@@ -118,7 +124,7 @@ TRANSLATIONS = {
             "\n"
             "These arrow key operations support:\n"
             "1. Real-time control: Works in any window while the script is running\n"
-            "2. Recording: Arrow key presses/releases are recorded as key_press/key_release events\n"
+            "2. Recording: Arrow key presses/releases are recorded as tap events (key_press/key_release if other input happens while the key is held)\n"
             "3. Playback: Playback executes key events at the recorded timing and simultaneously moves the mouse (since the hook remains active)\n"
             "\n"
             "This allows you to use arrow keys instead of the mouse for precise camera control and reliable route automation.\n"
@@ -178,6 +184,12 @@ TRANSLATIONS = {
         
         # Warning messages
         "overwrite_warning_title": "⚠️ WARNING: Overwrite Existing Config?",
+        "unresolved_title": "Missing Configs",
+        "unresolved_message": "{count} referenced config(s) could not be found:\n\n{details}\n\nRun anyway?",
+        "resume_title": "Resume Run",
+        "resume_message": "An unfinished run of {filename} was found ({done}/{total} steps completed, last: {last}).\n\nYes: resume from the next step\nNo: start over",
+        "recover_recording_title": "Recover Recording",
+        "recover_recording_message": "A recording into {filename} was interrupted ({count} events).\n\nYes: save the recovered events to {filename}\nNo: discard them and record again",
         "overwrite_warning_message": "The config file already exists!\n\nFile: {filename}\n\nOverwriting will permanently delete the existing config.\n\nDo you want to continue?",
         "overwrite_composite_title": "⚠️ WARNING: Overwrite Existing Config?",
         "overwrite_composite_message": "The config file already exists!\n\nFile: {filename}\n\nOverwriting will permanently replace it with the new composite config.\n\nDo you want to continue?",
@@ -200,6 +212,11 @@ TRANSLATIONS = {
         "screen_height": "高度",
         "screen_offset_x": "偏移X",
         "screen_offset_y": "偏移Y",
+        "speed_scale": "速度倍率",
+        "max_idle_gap": "最大空闲间隔",
+        "trace_runs": "记录执行追踪",
+        "record_keyframes": "录制时保存关键帧截图",
+        "record_mouse_path": "录制鼠标移动轨迹",
         
         # Buttons - Main
         "start_recording": "开始录制",
@@ -273,6 +290,7 @@ TRANSLATIONS = {
         "comment_saved": "备注已保存",
         "screen_invalid": "请输入有效的宽度、高度和偏移整数。",
         "screen_applied": "已应用：{width}x{height} 偏移=({offset_x}, {offset_y})",
+        "projected_runtime": "{name}：录制时长 {recorded:.1f}秒，预计 {effective:.1f}秒（节省 {saved:.1f}秒）",
         
         # Instructions
         "composite_instructions": "从右边面板双击配置添加 • 双击/删除键移除 • ↑↓重新排序",
@@ -300,7 +318,7 @@ TRANSLATIONS = {
             "\n"
             "这些方向键操作同时支持：\n"
             "1. 实时控制：脚本运行时在任何窗口中都能使用\n"
-            "2. 录制：按下/抬起方向键时会被记录为 key_press/key_release 事件\n"
+            "2. 录制：按下/抬起方向键时会被记录为 tap 事件（按住期间有其他操作时记录为 key_press/key_release 事件）\n"
             "3. 回放：回放时会按相同时机执行按键和鼠标移动，由于钩子仍然生效，回放的鼠标控制也能生效\n"
             "\n"
             "这样可以用方向键代替鼠标来精确控制视角，实现更可靠的跑图自动化。\n"
@@ -349,6 +367,12 @@ TRANSLATIONS = {
         
         # Warning messages
         "overwrite_warning_title": "⚠️ 警告：将覆盖现有配置",
+        "unresolved_title": "配置缺失",
+        "unresolved_message": "有 {count} 个引用的配置找不到：\n\n{details}\n\n仍要运行吗？",
+        "resume_title": "继续运行",
+        "resume_message": "发现 {filename} 的未完成运行（已完成 {done}/{total} 步，最后：{last}）。\n\n是：从下一步继续\n否：重新开始",
+        "recover_recording_title": "恢复录制",
+        "recover_recording_message": "{filename} 的录制意外中断（{count} 个事件）。\n\n是：将恢复的事件保存到 {filename}\n否：丢弃并重新录制",
         "overwrite_warning_message": "配置文件已存在！\n\n文件：{filename}\n\n覆盖将永久删除现有配置。\n\n是否继续？",
         "overwrite_composite_title": "⚠️ 警告：将覆盖现有配置",
         "overwrite_composite_message": "配置文件已存在！\n\n文件：{filename}\n\n覆盖将永久替换为新的组合配置。\n\n是否继续？",
@@ -0,0 +1,192 @@
+"""
+Key taps - tap and chord events in place of key press/release pairs.
+
+Most recorded key input is a press immediately followed by the release of the
+same key, sometimes with modifiers held around it. Such groups are stored as a
+single event that playback runs as one atomic operation:
+
+    {"type": "tap", "key": "esc", "duration": 0.08}
+    {"type": "chord", "modifiers": ["ctrl"], "key": "s", "duration": 0.08}
+
+``duration`` is how long the key is held. A chord presses its modifiers in order,
+then the key, and releases them in reverse order.
+"""
+
+from __future__ import annotations
+
+from typing import Callable
+
+TAP_EVENT_TYPES = ("tap", "chord")
+
+MODIFIER_KEYS = (
+    "shift", "shift_l", "shift_r",
+    "ctrl", "ctrl_l", "ctrl_r",
+    "alt", "alt_l", "alt_r", "alt_gr",
+    "cmd", "cmd_l", "cmd_r",
+)
+
+
+def tap_keys(event: dict) -> list[str]:
+    """Keys of a tap/chord event in press order (modifiers first)."""
+    if event.get("type") == "chord":
+        return [*event.get("modifiers", []), event.get("key")]
+    return [event.get("key")]
+
+
+def tap_press_events(event: dict) -> tuple[list[dict], list[dict]]:
+    """The (presses, releases) key_press/key_release events a tap/chord stands for."""
+    keys = tap_keys(event)
+    presses = [{"type": "key_press", "key": key_name} for key_name in keys]
+    releases = [{"type": "key_release", "key": key_name} for key_name in reversed(keys)]
+    return presses, releases
+
+
+def describe_tap(event: dict) -> str:
+    """Name of a tap/chord event like "ctrl+s"."""
+    return "+".join(str(key_name) for key_name in tap_keys(event))
+
+
+def parse_tap_keys(text: str) -> tuple[list[str], str]:
+    """Split a describe_tap() style name into (modifiers, key); "ctrl++" is ctrl and "+"."""
+    parts = text.split("+")
+    modifiers = []
+    while len(parts) > 1 and parts[0] in MODIFIER_KEYS:
+        modifiers.append(parts.pop(0))
+    return modifiers, "+".join(parts)
+
+
+def _collapse_group(group: list[dict]) -> dict | None:
+    """
+    Collapse the key events from the first press until all keys are released.
+
+    Returns a tap for [press K, release K], a chord for modifier presses, press K,
+    release K, modifier releases, or None if the group has any other shape. Extra
+    fields of the first press (expect, min_gap, ...) move to the collapsed event;
+    extra fields on any other event keep the group as it is.
+    """
+    if any(set(event) - {"time", "type", "key"} for event in group[1:]):
+        return None
+    presses = [event for event in group if event["type"] == "key_press"]
+    releases = [event for event in group if event["type"] == "key_release"]
+    if len(presses) != len(releases) or group[0]["type"] != "key_press":
+        return None
+    modifiers = [event["key"] for event in presses[:-1]]
+    key_event = presses[-1]
+    key_name = key_event["key"]
+    key_index = group.index(key_event)
+    if (
+        key_index != len(presses) - 1
+        or group[key_index + 1]["type"] != "key_release"
+        or group[key_index + 1]["key"] != key_name
+        or (modifiers and key_name in MODIFIER_KEYS)
+        or any(name not in MODIFIER_KEYS for name in modifiers)
+        or len(set(modifiers)) != len(modifiers)
+        or sorted(event["key"] for event in group[key_index + 2:]) != sorted(modifiers)
+    ):
+        return None
+
+    extras = {name: value for name, value in group[0].items() if name not in ("time", "type", "key")}
+    duration = round(float(group[key_index + 1]["time"]) - float(key_event["time"]), 3)
+    if modifiers:
+        return {
+            **extras,
+            "time": group[0]["time"],
+            "type": "chord",
+            "modifiers": modifiers,
+            "key": key_name,
+            "duration": duration,
+        }
+    return {**extras, "time": group[0]["time"], "type": "tap", "key": key_name, "duration": duration}
+
+
+class KeyEventCollapser:
+    """
+    Groups key events as they arrive and emits tap/chord events where possible.
+
+    Key events are held back while any key is down. When the last key is released
+    the group is emitted as one tap/chord, or unchanged if it has another shape.
+    Any other input arriving while keys are down (see interrupt()) emits the group
+    unchanged, and the rest of its events pass straight through.
+
+    Args:
+        emit: Called as emit(event, tags) for every output event, where tags are
+            the tags passed to add() for the key events it was made from
+    """
+
+    def __init__(self, emit: Callable[[dict, list], None]) -> None:
+        self.emit = emit
+        self._held: dict[str, int] = {}
+        self._group: list[tuple[dict, object]] = []
+        self._passthrough = False
+
+    def add(self, event: dict, tag: object = None) -> None:
+        """Feed a key_press/key_release event (in time order)."""
+        key_name = event.get("key")
+        if event["type"] == "key_press":
+            self._held[key_name] = self._held.get(key_name, 0) + 1
+        elif self._held.get(key_name, 0) > 0:
+            self._held[key_name] -= 1
+        elif not self._group:
+            # Release without a press: nothing to collapse it with
+            self.emit(event, [tag])
+            return
+
+        if self._passthrough:
+            self.emit(event, [tag])
+        else:
+            self._group.append((event, tag))
+        if not any(self._held.values()):
+            self._held.clear()
+            self._passthrough = False
+            self.flush()
+
+    def interrupt(self) -> None:
+        """Another input happened: emit pending key events unchanged."""
+        if self._group:
+            self._emit_unchanged()
+            self._passthrough = True
+
+    def flush(self) -> None:
+        """Emit the pending group, collapsed if it is complete."""
+        if not self._group:
+            return
+        collapsed = None if any(self._held.values()) else _collapse_group([event for event, _ in self._group])
+        if collapsed is None:
+            self._emit_unchanged()
+            return
+        tags = [tag for _, tag in self._group]
+        self._group = []
+        self.emit(collapsed, tags)
+
+    def _emit_unchanged(self) -> None:
+        group, self._group = self._group, []
+        for event, tag in group:
+            self.emit(event, [tag])
+
+
+def collapse_taps(timeline: list[dict]) -> tuple[list[dict], list[int | None]]:
+    """
+    Rewrite key press/release groups of a timeline as tap/chord events.
+
+    Returns:
+        (new timeline in time order, index_map) where index_map[i] is the new index
+        of the event made from old event i (None for releases merged into a tap)
+    """
+    order = sorted(range(len(timeline)), key=lambda i: float(timeline[i].get("time", 0)))
+    result: list[dict] = []
+    index_map: list[int | None] = [None] * len(timeline)
+
+    def emit(event: dict, tags: list) -> None:
+        index_map[tags[0]] = len(result)
+        result.append(event)
+
+    collapser = KeyEventCollapser(emit)
+    for old_index in order:
+        event = timeline[old_index]
+        if event.get("type") in ("key_press", "key_release"):
+            collapser.add(dict(event), old_index)
+        else:
+            collapser.interrupt()
+            emit(event, [old_index])
+    collapser.flush()
+    return result, index_map
@@ -0,0 +1,188 @@
+"""
+Keyframes - small screen thumbnails captured while recording.
+
+With keyframe capture enabled, the recorder grabs the game screen at every click
+and key press and keeps a grayscale thumbnail plus a 64-bit difference hash (dHash)
+of it. Keyframes are saved in a sidecar next to the config (<config>.keyframes):
+
+    b"EFKF1\\n"
+    JSON header line: {"version", "size": [w, h], "frames": [{"event", "time", "type", "hash"}]}
+    zlib-compressed thumbnails, each stored as its difference to the previous one
+
+Consecutive frames of a recording are mostly identical, so the deltas compress well.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+KEYFRAME_MAGIC = b"EFKF1\n"
+KEYFRAME_SUFFIX = ".keyframes"
+
+# Thumbnail size (width, height), 16:9 like the game
+THUMBNAIL_SIZE = (64, 36)
+
+# Hamming distance (out of 64 bits) at or below which two dHashes count as the same screen
+DEFAULT_HASH_THRESHOLD = 10
+
+logger = logging.getLogger("app")
+
+
+def dhash(image: Image.Image | np.ndarray) -> int:
+    """64-bit difference hash: sign of the horizontal gradient on a 9x8 grayscale image."""
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_distance(hash_a: int, hash_b: int) -> int:
+    """Hamming distance between two dHashes."""
+    return bin(hash_a ^ hash_b).count("1")
+
+
+def make_thumbnail(image: Image.Image) -> np.ndarray:
+    """Grayscale THUMBNAIL_SIZE thumbnail as a (height, width) uint8 array."""
+    return np.asarray(image.convert("L").resize(THUMBNAIL_SIZE, Image.BILINEAR), dtype=np.uint8)
+
+
+def make_keyframe(image: Image.Image) -> dict:
+    """Thumbnail and dHash of a captured screen."""
+    return {"thumbnail": make_thumbnail(image), "hash": dhash(image)}
+
+
+class KeyframeCapture:
+    """
+    Captures keyframes on a background thread.
+
+    Input listener callbacks must return quickly, so they only queue a keyframe dict;
+    the worker captures the screen region and fills in "thumbnail" and "hash".
+    """
+
+    def __init__(self, region: tuple[int, int, int, int] | None = None) -> None:
+        self.region = region
+        self._queue: queue.Queue[dict | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="keyframe-capture", daemon=True)
+        self._thread.start()
+
+    def request(self, keyframe: dict) -> None:
+        self._queue.put(keyframe)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Finish pending captures and stop the worker."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        from ocr import capture_screen
+
+        while True:
+            keyframe = self._queue.get()
+            if keyframe is None:
+                return
+            try:
+                keyframe.update(make_keyframe(capture_screen(self.region)))
+            except Exception as e:
+                logger.warning(f"Keyframe capture failed: {e}")
+
+
+def keyframe_path(config_path: Path | str) -> Path:
+    """Sidecar file holding the keyframes of a config."""
+    return Path(config_path).with_suffix(KEYFRAME_SUFFIX)
+
+
+def save_keyframes(config_path: Path | str, keyframes: list[dict], timeline: list[dict] | None = None) -> Path | None:
+    """
+    Write the keyframes of a recording next to its config.
+
+    Args:
+        config_path: Config the keyframes belong to
+        keyframes: [{event, time, thumbnail, hash}] where event is the timeline index;
+            keyframes without an event or a thumbnail are skipped
+        timeline: Recorded timeline, used to store each event's type for validation
+
+    Returns:
+        Path of the sidecar, or None if there was nothing to save
+    """
+    frames = [kf for kf in keyframes if kf.get("event") is not None and kf.get("thumbnail") is not None]
+    path = keyframe_path(config_path)
+    if not frames:
+        if path.exists():
+            path.unlink()
+        return None
+
+    header = {
+        "version": 1,
+        "size": list(THUMBNAIL_SIZE),
+        "frames": [
+            {
+                "event": kf["event"],
+                "time": kf["time"],
+                "type": timeline[kf["event"]].get("type") if timeline and kf["event"] < len(timeline) else None,
+                "hash": f"{kf['hash']:016x}",
+            }
+            for kf in frames
+        ],
+    }
+    stack = np.stack([kf["thumbnail"] for kf in frames])
+    deltas = np.diff(stack, axis=0, prepend=np.zeros_like(stack[:1]))  # uint8, wraps mod 256
+
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(KEYFRAME_MAGIC)
+        f.write(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n")
+        f.write(zlib.compress(deltas.tobytes(), 9))
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_keyframes(config_path: Path | str, timeline: list[dict] | None = None) -> list[dict]:
+    """
+    Load the keyframes saved next to a config.
+
+    Args:
+        config_path: Config whose sidecar to read
+        timeline: If given, keyframes whose event no longer matches the timeline
+            (index out of range, different time or type after editing) are dropped
+
+    Returns:
+        [{event, time, type, hash, thumbnail}] (empty if there is no sidecar)
+    """
+    path = keyframe_path(config_path)
+    if not path.exists():
+        return []
+    with path.open("rb") as f:
+        if f.read(len(KEYFRAME_MAGIC)) != KEYFRAME_MAGIC:
+            raise ValueError(f"Not a keyframe file: {path}")
+        header = json.loads(f.readline().decode("utf-8"))
+        payload = f.read()
+
+    width, height = header["size"]
+    frames = header["frames"]
+    deltas = np.frombuffer(zlib.decompress(payload), dtype=np.uint8).reshape(len(frames), height, width)
+    thumbnails = np.cumsum(deltas, axis=0, dtype=np.uint8)
+
+    keyframes = []
+    for frame, thumbnail in zip(frames, thumbnails):
+        keyframe = {**frame, "hash": int(frame["hash"], 16), "thumbnail": thumbnail}
+        if timeline is not None:
+            index = keyframe["event"]
+            if index >= len(timeline):
+                continue
+            event = timeline[index]
+            if abs(float(event.get("time", 0)) - float(keyframe["time"])) > 1.0:
+                continue
+            if keyframe.get("type") and event.get("type") != keyframe["type"]:
+                continue
+        keyframes.append(keyframe)
+    return keyframes
@@ -0,0 +1,179 @@
+"""
+Metrics registry - in-process counters and latency histograms.
+
+Recognition, capture, OCR and scheduler code records into the registry as it runs;
+start_run() clears it before a run and finish_run() writes a JSON snapshot per run
+and appends a summary line to metrics/history.jsonl for tracking across runs.
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+METRICS_DIR = Path("metrics")
+HISTORY_FILE = METRICS_DIR / "history.jsonl"
+
+# Histogram bucket upper bounds (seconds for timings, plain units for counts)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 8, 10, 15, 20, 30, 50)
+
+logger = logging.getLogger("app")
+
+
+class Histogram:
+    """Bucketed distribution with count, sum, min and max."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min: float | None = None
+        self.max: float | None = None
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bucket bound containing the q-quantile (max for the overflow bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {
+                **{str(bound): count for bound, count in zip(self.buckets, self.counts)},
+                "+inf": self.counts[-1],
+            },
+        }
+
+
+_counters: dict[str, dict[str, float]] = {}
+_histograms: dict[str, dict[str, Histogram]] = {}
+_lock = threading.Lock()
+_run_started: float | None = None
+
+
+def increment(name: str, label: str = "", value: float = 1) -> None:
+    """Add value to the counter name (optionally split by label, e.g. a template name)."""
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[label] = series.get(label, 0) + value
+
+
+def observe(name: str, value: float, label: str = "", buckets: tuple = DEFAULT_BUCKETS) -> None:
+    """Record value in the histogram name (optionally split by label)."""
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        histogram = series.get(label)
+        if histogram is None:
+            histogram = series[label] = Histogram(buckets)
+        histogram.observe(value)
+
+
+@contextmanager
+def timed(name: str, label: str = "") -> Iterator[None]:
+    """Record the duration of the enclosed block in seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, label)
+
+
+def snapshot() -> dict:
+    """Return all counters and histogram summaries as plain data."""
+    with _lock:
+        return {
+            "counters": {name: dict(series) for name, series in _counters.items()},
+            "histograms": {
+                name: {label: histogram.snapshot() for label, histogram in series.items()}
+                for name, series in _histograms.items()
+            },
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def start_run() -> None:
+    """Clear the registry at the start of a run."""
+    global _run_started
+    reset()
+    _run_started = time.time()
+
+
+def finish_run(config_path: Path | str | None = None, status: str = "completed") -> Path | None:
+    """
+    Write the metrics of the current run.
+
+    Args:
+        config_path: Config that was run (recorded in the output)
+        status: Run outcome, e.g. "completed" / "stopped" / "failed"
+
+    Returns:
+        Path of the per-run JSON file, or None if it could not be written
+    """
+    started = _run_started if _run_started is not None else time.time()
+    data = {
+        "config": None if config_path is None else str(config_path),
+        "status": status,
+        "started": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+        "duration": time.time() - started,
+        **snapshot(),
+    }
+    path = METRICS_DIR / f"run_{datetime.fromtimestamp(started):%Y%m%d_%H%M%S}.json"
+    try:
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".json.tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+        summary = {
+            "started": data["started"],
+            "config": data["config"],
+            "status": status,
+            "duration": data["duration"],
+            "histograms": {
+                name: {label: {"count": h["count"], "mean": h["mean"], "p95": h["p95"]} for label, h in series.items()}
+                for name, series in data["histograms"].items()
+            },
+        }
+        with HISTORY_FILE.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.error(f"Failed to write metrics: {e}")
+        return None
+    logger.info(f"Metrics written: {path}")
+    return path
@@ -0,0 +1,92 @@
+"""
+Mouse paths - simplification and sampling of recorded cursor movement.
+
+The recorder collects (time, x, y) cursor samples and keeps only the points needed
+to stay within a pixel tolerance of the original path (Ramer-Douglas-Peucker),
+capped at a maximum point count. Playback re-samples the polyline at a fixed
+interval, interpolating linearly between the kept points.
+"""
+
+from __future__ import annotations
+
+import math
+
+# Maximum distance (pixels) of the simplified path from the recorded one
+DEFAULT_PATH_EPSILON = 2.0
+
+# Upper bound on points kept per path
+DEFAULT_PATH_MAX_POINTS = 64
+
+# Seconds between cursor positions injected during playback (125 Hz)
+MOUSE_PATH_SAMPLE_INTERVAL = 0.008
+
+# A pause in movement longer than this (seconds) starts a new path
+PATH_IDLE_SPLIT = 0.25
+
+
+def _point_line_distance(point: tuple, start: tuple, end: tuple) -> float:
+    (px, py), (sx, sy), (ex, ey) = point[1:3], start[1:3], end[1:3]
+    dx, dy = ex - sx, ey - sy
+    length = math.hypot(dx, dy)
+    if length == 0:
+        return math.hypot(px - sx, py - sy)
+    return abs(dy * px - dx * py + ex * sy - ey * sx) / length
+
+
+def rdp(points: list[tuple], epsilon: float) -> list[tuple]:
+    """
+    Ramer-Douglas-Peucker simplification of (t, x, y) samples on their x/y position.
+
+    Iterative, so paths with thousands of samples do not hit the recursion limit.
+    """
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_distance = 0.0
+        index = first
+        for i in range(first + 1, last):
+            distance = _point_line_distance(points[i], points[first], points[last])
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if max_distance > epsilon:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify_path(
+    points: list[tuple],
+    epsilon: float = DEFAULT_PATH_EPSILON,
+    max_points: int = DEFAULT_PATH_MAX_POINTS,
+) -> list[tuple]:
+    """Simplify (t, x, y) samples with rdp(), doubling epsilon until at most max_points remain."""
+    max_points = max(2, int(max_points))
+    simplified = rdp(points, epsilon)
+    while len(simplified) > max_points:
+        epsilon = max(epsilon * 2, 1.0)
+        simplified = rdp(points, epsilon)
+    return simplified
+
+
+def path_position(points: list, t: float, segment: int = 0) -> tuple[float, float, int]:
+    """
+    Position at time t on a [[t, x, y], ...] polyline, interpolated linearly.
+
+    Returns (x, y, segment); pass segment back in for the next, later t to avoid rescanning.
+    """
+    last = len(points) - 1
+    while segment < last - 1 and points[segment + 1][0] <= t:
+        segment += 1
+    if last == 0 or t <= points[0][0]:
+        return points[0][1], points[0][2], 0
+    if t >= points[last][0]:
+        return points[last][1], points[last][2], segment
+    t0, x0, y0 = points[segment]
+    t1, x1, y1 = points[segment + 1]
+    ratio = 0.0 if t1 <= t0 else (t - t0) / (t1 - t0)
+    return x0 + (x1 - x0) * ratio, y0 + (y1 - y0) * ratio, segment
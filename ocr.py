@@ -1,23 +1,119 @@
 from __future__ import annotations
 
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Callable, Iterator
 
 import cv2
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageGrab
+
+from metrics import COUNT_BUCKETS, increment, observe, timed
+from tracing import span
 
 TEMPLATE_DIR = Path("templates")
 
+logger = logging.getLogger("app")
+
+
+# Templates matched against each captured frame, reported when the frame is released
+_frame_templates: dict[int, int] = {}
+_frame_lock = threading.Lock()
+
+
+def _finish_frame(frame_id: int) -> None:
+    with _frame_lock:
+        count = _frame_templates.pop(frame_id, 0)
+    observe("templates_per_frame", count, buckets=COUNT_BUCKETS)
+
+
+def _count_frame_template(frame) -> None:
+    with _frame_lock:
+        if id(frame) in _frame_templates:
+            _frame_templates[id(frame)] += 1
+
+
+def capture_screen(region: tuple[int, int, int, int] | None = None) -> Image.Image:
+    """Capture the full screen, or only the (x1, y1, x2, y2) region in screen pixels."""
+    with span("capture", "recognition", region=region), timed("capture_seconds"):
+        frame = ImageGrab.grab(bbox=region)
+    with _frame_lock:
+        _frame_templates[id(frame)] = 0
+    weakref.finalize(frame, _finish_frame, id(frame))
+    return frame
+
 
 def pil_to_bgr(image: Image.Image) -> np.ndarray:
     return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
 
 
+# Template images and SIFT features cached by path, invalidated on mtime change
+_template_cache: dict[str, tuple[float, np.ndarray]] = {}
+_feature_cache: dict[str, tuple[float, tuple]] = {}
+_cache_lock = threading.Lock()
+_thread_local = threading.local()
+
+
+def _get_sift():
+    """Return a per-thread SIFT detector (detectors are not shared across threads)."""
+    sift = getattr(_thread_local, "sift", None)
+    if sift is None:
+        sift = cv2.SIFT_create()
+        _thread_local.sift = sift
+    return sift
+
+
 def load_template_bgr(template_path: Path | str) -> np.ndarray | None:
+    """Load a template image (cached; the returned array must not be modified)."""
     path = Path(template_path)
     if not path.exists():
         return None
-    return cv2.imread(str(path))
+    key = str(path.resolve())
+    mtime = path.stat().st_mtime
+    with _cache_lock:
+        cached = _template_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    image = cv2.imread(str(path))
+    if image is not None:
+        with _cache_lock:
+            _template_cache[key] = (mtime, image)
+    return image
+
+
+def get_template_features(template_path: Path | str) -> tuple[np.ndarray, list, np.ndarray | None] | None:
+    """
+    Return (template_bgr, keypoints, descriptors) of a template, computing SIFT features once.
+
+    Returns None if the template cannot be loaded.
+    """
+    path = Path(template_path)
+    template_bgr = load_template_bgr(path)
+    if template_bgr is None:
+        return None
+    key = str(path.resolve())
+    mtime = path.stat().st_mtime
+    with _cache_lock:
+        cached = _feature_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with span("template_features", "recognition", template=path.name), timed("sift_extract_seconds", "template"):
+        template_gray = cv2.cvtColor(template_bgr, cv2.COLOR_BGR2GRAY)
+        keypoints, descriptors = _get_sift().detectAndCompute(template_gray, None)
+    features = (template_bgr, keypoints, descriptors)
+    with _cache_lock:
+        _feature_cache[key] = (mtime, features)
+    return features
+
+
+def prefetch_templates(template_paths: list[Path | str]) -> None:
+    """Warm the template image and SIFT feature caches."""
+    for template_path in template_paths:
+        get_template_features(template_path)
 
 
 def crop_right_fraction(image: Image.Image, fraction: float = 0.2) -> tuple[Image.Image, int, int]:
@@ -27,6 +123,128 @@ def crop_right_fraction(image: Image.Image, fraction: float = 0.2) -> tuple[Imag
     return image.crop((left, 0, width, height)), left, 0
 
 
+def _downscale_gray(image: Image.Image, size: int) -> np.ndarray:
+    gray = cv2.cvtColor(pil_to_bgr(image), cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape[:2]
+    scale = min(1.0, size / max(width, height))
+    target = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(gray, target, interpolation=cv2.INTER_AREA)
+
+
+def frame_difference(
+    image_a: Image.Image | np.ndarray,
+    image_b: Image.Image | np.ndarray,
+    size: int = 160,
+    metric: str = "mad",
+) -> float:
+    """
+    Difference between two frames after downscaling to grayscale.
+
+    metric "mad" returns the mean absolute pixel difference (0-255); "histogram"
+    returns 255 * (1 - correlation) of the grayscale histograms, on the same scale.
+    Pre-downscaled grayscale arrays are accepted as-is.
+    """
+    small_a = image_a if isinstance(image_a, np.ndarray) else _downscale_gray(image_a, size)
+    small_b = image_b if isinstance(image_b, np.ndarray) else _downscale_gray(image_b, size)
+    if metric == "histogram":
+        hist_a = cv2.calcHist([small_a], [0], None, [32], [0, 256])
+        hist_b = cv2.calcHist([small_b], [0], None, [32], [0, 256])
+        correlation = cv2.compareHist(hist_a, hist_b, cv2.HISTCMP_CORREL)
+        return float(max(0.0, 1.0 - correlation) * 255)
+    if small_a.shape != small_b.shape:
+        small_b = cv2.resize(small_b, (small_a.shape[1], small_a.shape[0]), interpolation=cv2.INTER_AREA)
+    return float(cv2.absdiff(small_a, small_b).mean())
+
+
+def wait_until_stable(
+    region: tuple[int, int, int, int] | None = None,
+    threshold: float = 2.0,
+    max_wait: float = 1.0,
+    poll_interval: float = 0.05,
+    settle_time: float = 0.1,
+    min_wait: float = 0.0,
+    metric: str = "mad",
+    stop_check: Callable[[], bool] | None = None,
+) -> dict:
+    """
+    Wait until the screen (or region) stops changing, instead of sleeping blindly.
+
+    Successive downscaled grayscale captures are compared with frame_difference();
+    the screen counts as stable once the difference stays <= threshold for
+    settle_time seconds (and at least min_wait has passed). Returns early when
+    stable, or after max_wait at the latest. Time is measured on the playback
+    clock (see automation.set_clock), so dry runs do not wait in real time.
+
+    Returns:
+        Dict with:
+        {
+            "stable": bool,
+            "stopped": bool (stop_check fired),
+            "elapsed": float (seconds actually waited),
+            "frames": int,
+            "difference": float (last measured difference)
+        }
+    """
+    from automation import StopExecution, get_clock
+
+    clock = get_clock()
+    start = clock.monotonic()
+    deadline = start + max_wait
+    previous = None
+    stable_since = None
+    frames = 0
+    difference = float("inf")
+    stable = False
+    stopped = False
+
+    while True:
+        if stop_check and stop_check():
+            stopped = True
+            break
+
+        current = _downscale_gray(capture_screen(region), 160)
+        frames += 1
+        now = clock.monotonic()
+        if previous is not None:
+            difference = frame_difference(previous, current, metric=metric)
+            if difference <= threshold:
+                if stable_since is None:
+                    stable_since = now
+                if now - stable_since >= settle_time and now - start >= min_wait:
+                    stable = True
+                    break
+            else:
+                stable_since = None
+        previous = current
+
+        if now >= deadline:
+            break
+        delay = max(0.0, min(poll_interval, deadline - now))
+        try:
+            # Cancellation tokens wake the sleep immediately on stop
+            clock.sleep(delay, stop_check)
+        except StopExecution:
+            stopped = True
+            break
+
+    elapsed = clock.monotonic() - start
+    logger.info(
+        "wait_until_stable: %s after %.3fs/%.3fs (%d frames, diff=%.2f)",
+        "stable" if stable else ("stopped" if stopped else "timeout"),
+        elapsed,
+        max_wait,
+        frames,
+        difference,
+    )
+    return {
+        "stable": stable,
+        "stopped": stopped,
+        "elapsed": elapsed,
+        "frames": frames,
+        "difference": difference,
+    }
+
+
 def match_template(
     roi_bgr: np.ndarray,
     template_bgr: np.ndarray,
@@ -34,11 +252,46 @@ def match_template(
 ) -> tuple[float, tuple[int, int]]:
     if roi_bgr.shape[0] < template_bgr.shape[0] or roi_bgr.shape[1] < template_bgr.shape[1]:
         return 0.0, (0, 0)
-    result = cv2.matchTemplate(roi_bgr, template_bgr, method)
-    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    with span("match_template", "recognition"), timed("match_template_seconds"):
+        result = cv2.matchTemplate(roi_bgr, template_bgr, method)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
     return float(max_val), (int(max_loc[0]), int(max_loc[1]))
 
 
+def match_template_all(
+    roi_bgr: np.ndarray,
+    template_bgr: np.ndarray,
+    threshold: float,
+    max_results: int = 20,
+    overlap: float = 0.5,
+    method: int = cv2.TM_CCOEFF_NORMED,
+) -> list[tuple[float, tuple[int, int]]]:
+    """
+    All matches of a template scoring at least threshold, best first.
+
+    Non-maximum suppression: after each peak, scores within overlap * template
+    size of it are cleared, so one on-screen object gives one match.
+
+    Returns:
+        [(score, (x, y))] with (x, y) the top-left corner in the ROI
+    """
+    if roi_bgr.shape[0] < template_bgr.shape[0] or roi_bgr.shape[1] < template_bgr.shape[1]:
+        return []
+    h, w = template_bgr.shape[:2]
+    suppress_w = max(1, int(w * overlap))
+    suppress_h = max(1, int(h * overlap))
+    matches = []
+    with span("match_template", "recognition"), timed("match_template_seconds"):
+        result = cv2.matchTemplate(roi_bgr, template_bgr, method)
+        while len(matches) < max_results:
+            _, max_val, _, (x, y) = cv2.minMaxLoc(result)
+            if max_val < threshold:
+                break
+            matches.append((float(max_val), (int(x), int(y))))
+            result[max(0, y - suppress_h):y + suppress_h + 1, max(0, x - suppress_w):x + suppress_w + 1] = -1.0
+    return matches
+
+
 def _ssim_gray(image_a: np.ndarray, image_b: np.ndarray) -> float:
     image_a = image_a.astype(np.float64)
     image_b = image_b.astype(np.float64)
@@ -70,9 +323,211 @@ def ssim_color(image_a_bgr: np.ndarray, image_b_bgr: np.ndarray) -> float:
 
 
 def compare_similarity(candidate_bgr: np.ndarray, template_bgr: np.ndarray) -> float:
-    if candidate_bgr.shape[:2] != template_bgr.shape[:2]:
-        candidate_bgr = cv2.resize(candidate_bgr, (template_bgr.shape[1], template_bgr.shape[0]))
-    return ssim_color(candidate_bgr, template_bgr)
+    with span("ssim", "recognition"), timed("ssim_seconds"):
+        if candidate_bgr.shape[:2] != template_bgr.shape[:2]:
+            candidate_bgr = cv2.resize(candidate_bgr, (template_bgr.shape[1], template_bgr.shape[0]))
+        return ssim_color(candidate_bgr, template_bgr)
+
+
+def compare_similarity_batch(candidates_bgr: list[np.ndarray], template_bgr: np.ndarray) -> list[float]:
+    """compare_similarity() of several candidates against one template, vectorized."""
+    if not candidates_bgr:
+        return []
+    with span("ssim", "recognition", candidates=len(candidates_bgr)), timed("ssim_seconds"):
+        h, w = template_bgr.shape[:2]
+        resized = [
+            candidate if candidate.shape[:2] == (h, w) else cv2.resize(candidate, (w, h))
+            for candidate in candidates_bgr
+        ]
+        # One color conversion for all candidates stacked vertically
+        stack = cv2.cvtColor(np.vstack(resized), cv2.COLOR_BGR2HSV).astype(np.float64).reshape(len(resized), h, w, 3)
+        template = cv2.cvtColor(template_bgr, cv2.COLOR_BGR2HSV).astype(np.float64)
+
+        c1 = (0.01 * 255) ** 2
+        c2 = (0.03 * 255) ** 2
+        mu_a = stack.mean(axis=(1, 2))
+        mu_b = template.mean(axis=(0, 1))
+        sigma_a = stack.var(axis=(1, 2))
+        sigma_b = template.var(axis=(0, 1))
+        covariance = ((stack - mu_a[:, None, None, :]) * (template - mu_b)).mean(axis=(1, 2))
+
+        numerator = (2 * mu_a * mu_b + c1) * (2 * covariance + c2)
+        denominator = (mu_a ** 2 + mu_b ** 2 + c1) * (sigma_a + sigma_b + c2)
+        scores = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+        return [float(score) for score in scores.mean(axis=1)]
+
+
+def extract_screen_features(
+    screen_image: Image.Image | np.ndarray,
+    screen_gray: np.ndarray | None = None,
+) -> tuple[list, np.ndarray | None]:
+    """Return SIFT (keypoints, descriptors) of a screen image (PIL or BGR array)."""
+    with span("screen_features", "recognition"), timed("sift_extract_seconds", "screen"):
+        if screen_gray is None:
+            screen_cv = pil_to_bgr(screen_image) if isinstance(screen_image, Image.Image) else screen_image
+            screen_gray = cv2.cvtColor(screen_cv, cv2.COLOR_BGR2GRAY)
+        return _get_sift().detectAndCompute(screen_gray, None)
+
+
+class FrameAnalysis:
+    """
+    One captured frame shared by several recognitions.
+
+    The frame is captured on first use; SIFT features of each region and the
+    result of each template lookup are computed once per frame.
+    """
+
+    def __init__(self, frame: Image.Image | None = None) -> None:
+        self._frame = frame
+        self._features: dict[tuple | None, tuple] = {}
+        self._results: dict[tuple, dict | None] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def frame(self) -> Image.Image:
+        with self._lock:
+            if self._frame is None:
+                self._frame = capture_screen()
+            return self._frame
+
+    def region_image(self, region: tuple[int, int, int, int] | None = None) -> Image.Image:
+        """The frame, or its (x1, y1, x2, y2) crop in screen pixels."""
+        frame = self.frame
+        return frame if region is None else frame.crop(region)
+
+    def features(self, region: tuple[int, int, int, int] | None = None) -> tuple:
+        """SIFT (keypoints, descriptors) of a region, extracted once per frame."""
+        key = None if region is None else tuple(region)
+        features = self._features.get(key)
+        if features is None:
+            features = self._features[key] = extract_screen_features(self.region_image(region))
+        return features
+
+    def find_template(
+        self,
+        template_path: Path | str,
+        region: tuple[int, int, int, int] | None = None,
+        min_matches: int = 10,
+        ratio_threshold: float = 0.7,
+    ) -> dict | None:
+        """
+        find_template_sift() on the frame (or a region of it), cached per frame.
+
+        Coordinates in the result are in screen pixels even when a region is given.
+        """
+        key = (str(template_path), None if region is None else tuple(region), min_matches, ratio_threshold)
+        if key in self._results:
+            return self._results[key]
+        result = find_template_sift(
+            self.region_image(region),
+            template_path,
+            min_matches=min_matches,
+            ratio_threshold=ratio_threshold,
+            screen_features=self.features(region),
+            source_frame=self.frame,
+        )
+        if result is not None and region is not None:
+            dx, dy = region[0], region[1]
+            x1, y1, x2, y2 = result["bbox"]
+            result = {
+                **result,
+                "center_x": result["center_x"] + dx,
+                "center_y": result["center_y"] + dy,
+                "bbox": [x1 + dx, y1 + dy, x2 + dx, y2 + dy],
+            }
+        self._results[key] = result
+        return result
+
+
+class FrameSource:
+    """
+    Captures frames continuously on a background thread.
+
+    Consumers wait for a frame captured after a given moment (next_frame) instead
+    of capturing themselves, so the next capture overlaps recognition of the
+    current one. Each frame comes wrapped in a FrameAnalysis. Capturing can be
+    suspended with paused() while nothing consumes frames.
+
+    Args:
+        region: Optional (x1, y1, x2, y2) capture region in screen pixels
+        interval: Seconds between the starts of two captures
+    """
+
+    def __init__(self, region: tuple[int, int, int, int] | None = None, interval: float = 0.05) -> None:
+        self.region = region
+        self.interval = interval
+        self._latest: tuple[float, FrameAnalysis] | None = None
+        self._condition = threading.Condition()
+        self._closed = threading.Event()
+        self._paused = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> "FrameSource":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="frame-source", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """Stop capturing inside the with block; later frames are captured after it."""
+        self._paused.set()
+        try:
+            yield
+        finally:
+            self._paused.clear()
+
+    def __enter__(self) -> "FrameSource":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            if self._paused.is_set():
+                self._closed.wait(self.interval)
+                continue
+            # Stamp with the capture start: the frame shows the screen at or after it
+            captured_at = time.monotonic()
+            try:
+                frame = capture_screen(self.region)
+            except Exception as e:
+                logger.warning(f"Frame capture failed: {e}")
+            else:
+                with self._condition:
+                    self._latest = (captured_at, FrameAnalysis(frame))
+                    self._condition.notify_all()
+            self._closed.wait(max(0.0, captured_at + self.interval - time.monotonic()))
+
+    def next_frame(
+        self,
+        after: float,
+        timeout: float,
+        stop_check: Callable[[], bool] | None = None,
+    ) -> tuple[float, FrameAnalysis] | None:
+        """
+        Wait for a frame captured at or after the monotonic time ``after``.
+
+        Returns:
+            (capture time, FrameAnalysis), or None on timeout or when stop_check fires
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._latest is None or self._latest[0] < after:
+                if stop_check and stop_check():
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(min(remaining, self.interval))
+            return self._latest
 
 
 def find_template_sift(
@@ -81,6 +536,8 @@ def find_template_sift(
     min_matches: int = 4,
     screen_gray: np.ndarray | None = None,
     ratio_threshold: float = 0.7,
+    screen_features: tuple | None = None,
+    source_frame: Image.Image | None = None,
 ) -> dict | None:
     """
     Find a template in the screen image using SIFT feature matching.
@@ -91,6 +548,9 @@ def find_template_sift(
         min_matches: Minimum number of good feature matches required
         screen_gray: Optional pre-computed grayscale screen image
         ratio_threshold: Lowe's ratio test threshold (default 0.7, higher = more lenient)
+        screen_features: Optional pre-computed (keypoints, descriptors) of the screen image
+        source_frame: Captured frame screen_image was derived from (a crop or conversion),
+            counted in templates_per_frame; defaults to screen_image itself
     
     Returns:
         Dict with:
@@ -103,50 +563,61 @@ def find_template_sift(
         }
         or None if not found
     """
+    _count_frame_template(screen_image if source_frame is None else source_frame)
+    result = _find_template_sift(
+        screen_image, template_path, min_matches, screen_gray, ratio_threshold, screen_features
+    )
+    increment("recognition_hit" if result is not None else "recognition_miss", Path(template_path).name)
+    return result
+
+
+def _find_template_sift(
+    screen_image: Image.Image | np.ndarray,
+    template_path: Path | str,
+    min_matches: int,
+    screen_gray: np.ndarray | None,
+    ratio_threshold: float,
+    screen_features: tuple | None,
+) -> dict | None:
     template_path = Path(template_path)
     if not template_path.exists():
         print(f"Template not found: {template_path}")
         return None
     
-    # Convert screen image to BGR numpy array if needed
+    # Only the size is needed here; extract_screen_features converts when features are missing
     if isinstance(screen_image, Image.Image):
-        screen_cv = pil_to_bgr(screen_image)
+        screen_w, screen_h = screen_image.size
     else:
-        screen_cv = screen_image
+        screen_h, screen_w = screen_image.shape[:2]
     
-    # Load template
-    template_bgr = load_template_bgr(template_path)
-    if template_bgr is None:
+    # Load template with cached keypoints and descriptors
+    template_features = get_template_features(template_path)
+    if template_features is None:
         print(f"Failed to load template: {template_path}")
         return None
+    template_bgr, kp_template, des_template = template_features
     
-    # Convert to grayscale
-    if screen_gray is None:
-        screen_gray = cv2.cvtColor(screen_cv, cv2.COLOR_BGR2GRAY)
-    template_gray = cv2.cvtColor(template_bgr, cv2.COLOR_BGR2GRAY)
-    
-    # Initialize SIFT detector
-    sift = cv2.SIFT_create()
-    
-    # Detect keypoints and descriptors
-    kp_screen, des_screen = sift.detectAndCompute(screen_gray, None)
-    kp_template, des_template = sift.detectAndCompute(template_gray, None)
+    if screen_features is not None:
+        kp_screen, des_screen = screen_features
+    else:
+        kp_screen, des_screen = extract_screen_features(screen_image, screen_gray)
     
     if des_screen is None or des_template is None:
         print("SIFT: Not enough features found")
         return None
     
-    # Create matcher and perform KNN matching
-    matcher = cv2.BFMatcher(cv2.NORM_L2, crossCheck=False)
-    matches = matcher.knnMatch(des_template, des_screen, k=2)
-    
-    # Apply Lowe's ratio test to filter good matches
-    good_matches = []
-    for match_pair in matches:
-        if len(match_pair) == 2:
-            m, n = match_pair
-            if m.distance < ratio_threshold * n.distance:
-                good_matches.append(m)
+    with span("match", "recognition", template=template_path.name), timed("sift_match_seconds"):
+        # Create matcher and perform KNN matching
+        matcher = cv2.BFMatcher(cv2.NORM_L2, crossCheck=False)
+        matches = matcher.knnMatch(des_template, des_screen, k=2)
+        
+        # Apply Lowe's ratio test to filter good matches
+        good_matches = []
+        for match_pair in matches:
+            if len(match_pair) == 2:
+                m, n = match_pair
+                if m.distance < ratio_threshold * n.distance:
+                    good_matches.append(m)
     
     if len(good_matches) < min_matches:
         print(f"SIFT: Only {len(good_matches)} good matches found (need {min_matches})")
@@ -157,7 +628,8 @@ def find_template_sift(
     dst_pts = np.float32([kp_screen[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
     
     # Find homography matrix using RANSAC
-    H, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
+    with span("homography", "recognition", matches=len(good_matches)), timed("homography_seconds"):
+        H, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
     
     if H is None:
         print("SIFT: Failed to compute homography")
@@ -186,8 +658,8 @@ def find_template_sift(
     # Clamp to image bounds
     x1 = max(0, x1)
     y1 = max(0, y1)
-    x2 = min(screen_cv.shape[1], x2)
-    y2 = min(screen_cv.shape[0], y2)
+    x2 = min(screen_w, x2)
+    y2 = min(screen_h, y2)
     
     # Calculate center and confidence
     center_x = int((x1 + x2) / 2)
@@ -3,10 +3,28 @@ Processors module - contains all automation event processors.
 
 Exported functions:
 - from .plants_processor import run_plants_harvest_loop
-- from .clues_processor import process_clues_placement
+- from .clues_processor import process_clues_placement, plan_clue_placement
 - from .home_assistance_processor import process_home_assistance
 - from .npc_finder import find_npc_by_walking
-- from .qingbao_processor import run_qingbao_loop, find_qingbao_target
+- from .qingbao_processor import run_qingbao_loop, find_qingbao_target, find_qingbao_targets
 - from .backpack_processor import process_item_drag
 - from .goods_processor import process_goods_image, analyze_goods_data
+- from .template_choice_processor import (receive_clue_ocr, gift_choice_ocr, collection_max_ocr handlers)
+
+Timeline event handlers are registered with processors.registry.event_handler.
+To add a processor event, declare its handler in the module and list the event
+type below; the module is imported the first time the type is needed.
 """
+
+EVENT_HANDLER_MODULES = {
+    "goods_ocr": "processors.goods_processor",
+    "home_assist_ocr": "processors.home_assistance_processor",
+    "item_drag": "processors.backpack_processor",
+    "qingbao_loop": "processors.qingbao_processor",
+    "plants_loop": "processors.plants_processor",
+    "clues_ocr": "processors.clues_processor",
+    "receive_clue_ocr": "processors.template_choice_processor",
+    "gift_choice_ocr": "processors.template_choice_processor",
+    "collection_max_ocr": "processors.template_choice_processor",
+    "find_npc_ocr": "processors.npc_finder",
+}
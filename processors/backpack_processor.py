@@ -4,9 +4,10 @@ import time
 from pathlib import Path
 
 import pyautogui
-from PIL import Image, ImageGrab
+from PIL import Image
 
-from ocr import pil_to_bgr, find_template_sift
+from ocr import capture_screen, pil_to_bgr, find_template_sift, prefetch_templates
+from processors.registry import EventContext, event_handler
 
 
 ITEMS_DIR = Path("templates") / "items"
@@ -43,7 +44,7 @@ def find_item_with_sift(
     full_screen_cv = pil_to_bgr(full_screen_image)
     
     # Use unified SIFT function
-    result = find_template_sift(full_screen_cv, template_path, min_matches)
+    result = find_template_sift(full_screen_cv, template_path, min_matches, source_frame=full_screen_image)
     
     return result
 
@@ -70,7 +71,7 @@ def process_item_drag(item_id: str) -> dict:
         }
     
     # Take screenshot
-    full_screen = ImageGrab.grab()
+    full_screen = capture_screen()
     screen_width, screen_height = full_screen.size
     
     # Find item
@@ -102,3 +103,28 @@ def process_item_drag(item_id: str) -> dict:
         "end": (end_x, end_y),
         "confidence": result["confidence"],
     }
+
+
+def _prefetch_item_drag(event: dict) -> None:
+    item_id = event.get("item_id")
+    if item_id:
+        prefetch_templates([ITEMS_DIR / f"{item_id}.png"])
+
+
+@event_handler("item_drag", prefetch=_prefetch_item_drag)
+def handle_item_drag(event: dict, context: EventContext) -> None:
+    item_id = event.get("item_id")
+    if not item_id:
+        print("item_drag: Missing item_id")
+        return
+
+    result = process_item_drag(item_id)
+
+    if result.get("success"):
+        start = result["start"]
+        end = result["end"]
+        confidence = result.get("confidence", 0)
+        print(f"item_drag: {item_id} dragged from {start} to {end}, confidence={confidence:.2%}")
+    else:
+        error = result.get("error", "Unknown error")
+        print(f"item_drag: Failed - {error}")
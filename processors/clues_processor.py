@@ -1,19 +1,101 @@
 from __future__ import annotations
 
-import time
 from pathlib import Path
 from typing import Callable
 
 import pyautogui
 from PIL import Image
 
-from ocr import find_template_sift
-from automation import load_steps, run_timeline
+from ocr import FrameAnalysis, frame_difference, prefetch_templates, wait_until_stable
+from automation import StopExecution, load_steps, run_timeline
+from metrics import increment
+from tracing import span, trace_iterations
+from processors.registry import EventContext, event_handler
 
 
 CLUES_TEMPLATE_DIR = Path("templates") / "clues"
 PLACE_CLUE_CONFIG = Path("configs") / "帝江号收菜" / "放置线索.json"
 
+CLUE_NAMES = [f"clue{num}" for num in range(1, 8)]
+
+# Mean pixel difference (0-255, see frame_difference) over the clue board above which a placement changed it
+BOARD_CHANGE_THRESHOLD = 2.0
+
+
+def plan_clue_placement(
+    analysis: FrameAnalysis,
+    confidence_threshold: float = 0.5,
+    min_matches: int = 10,
+    exclude: list[str] | tuple = (),
+) -> list[dict]:
+    """
+    Score every clue template against one frame and list the clues to place.
+
+    The frame's SIFT features are extracted once and shared by all templates. A
+    clue is placeable when clue{num}.png is found with at least confidence_threshold
+    and with a higher confidence than clue{num}full.png.
+
+    Args:
+        analysis: Frame to analyze
+        confidence_threshold: Minimum confidence (0-1) of clue{num}.png
+        min_matches: Minimum number of SIFT matches required
+        exclude: Clue names to leave out (already placed)
+
+    Returns:
+        [{name, center_x, center_y, bbox, confidence, confidence_full, matches}] in
+        clue1..clue7 order
+    """
+    plan = []
+    with span("clue_analysis", "recognition"):
+        for clue_name in CLUE_NAMES:
+            if clue_name in exclude:
+                continue
+            clue_template = CLUES_TEMPLATE_DIR / f"{clue_name}.png"
+            clue_full_template = CLUES_TEMPLATE_DIR / f"{clue_name}full.png"
+            if not clue_template.exists() or not clue_full_template.exists():
+                missing = clue_template if not clue_template.exists() else clue_full_template
+                print(f"Warning: Template not found: {missing}")
+                continue
+
+            result = analysis.find_template(clue_template, min_matches=min_matches, ratio_threshold=0.7)
+            result_full = analysis.find_template(clue_full_template, min_matches=min_matches, ratio_threshold=0.7)
+            if result is None:
+                print(f"{clue_name}: Not found")
+                continue
+            confidence = result.get("confidence", 0.0)
+            confidence_full = result_full.get("confidence", 0.0) if result_full else 0.0
+            if confidence < confidence_threshold:
+                print(f"{clue_name}: Found but confidence too low: {confidence:.2%}")
+                continue
+            if confidence <= confidence_full:
+                print(f"{clue_name}: Skipped (confidence comparison failed: "
+                      f"{confidence:.2%} <= {confidence_full:.2%})")
+                continue
+            plan.append({
+                "name": clue_name,
+                "center_x": result["center_x"],
+                "center_y": result["center_y"],
+                "bbox": result["bbox"],
+                "confidence": confidence,
+                "confidence_full": confidence_full,
+                "matches": result.get("matches", 0),
+            })
+    return plan
+
+
+def _board_region(analysis: FrameAnalysis, plan: list[dict]) -> tuple[int, int, int, int] | None:
+    """Bounding box of the planned clues in screen pixels, or None for the whole frame."""
+    if not plan:
+        return None
+    width, height = analysis.frame.size
+    x1 = max(0, min(int(clue["bbox"][0]) for clue in plan))
+    y1 = max(0, min(int(clue["bbox"][1]) for clue in plan))
+    x2 = min(width, max(int(clue["bbox"][2]) for clue in plan))
+    y2 = min(height, max(int(clue["bbox"][3]) for clue in plan))
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return (x1, y1, x2, y2)
+
 
 def process_clues_placement(
     confidence_threshold: float = 0.5,
@@ -23,15 +105,15 @@ def process_clues_placement(
     """
     Process clues recognition and placement.
     
-    1. Take full screen screenshot
-    2. For each clue (clue1-clue8), detect in two steps:
-       a. Detect clue{num}.png
-       b. Detect clue{num}full.png
-       c. Compare confidence: if clue{num}.png > clue{num}full.png:
-          - Click at the clue position
-          - Execute the place_clue config file
-       d. Otherwise skip to next clue
-    3. Continue until all clues are processed
+    1. Capture the screen once and score all clue templates against it
+       (plan_clue_placement), giving the clues to place in clue1..clue7 order
+    2. For each planned clue:
+       a. Click at the clue position
+       b. Execute the place_clue config file
+       c. Compare the clue board of the settled screen with the analyzed frame;
+          only if the placement changed it, re-analyze the new frame for the
+          remaining clues
+    3. Continue until the plan is empty
     
     Args:
         confidence_threshold: Minimum confidence (0-1) to trigger click
@@ -44,6 +126,7 @@ def process_clues_placement(
             "success": bool,
             "processed_clues": list of clue names that were found and placed,
             "total_found": int,
+            "analyses": int (frames analyzed),
             "message": str
         }
     """
@@ -55,6 +138,7 @@ def process_clues_placement(
             "success": False,
             "processed_clues": [],
             "total_found": 0,
+            "analyses": 0,
             "message": f"Config file not found: {PLACE_CLUE_CONFIG}"
         }
     
@@ -66,91 +150,42 @@ def process_clues_placement(
             "success": False,
             "processed_clues": [],
             "total_found": 0,
+            "analyses": 0,
             "message": f"Failed to load config: {e}"
         }
     
-    # Process each clue from clue1 to clue7
-    for clue_num in range(1, 8):
-        clue_name = f"clue{clue_num}"
-        clue_template = CLUES_TEMPLATE_DIR / f"{clue_name}.png"
-        clue_full_template = CLUES_TEMPLATE_DIR / f"{clue_name}full.png"
-        
-        # Check if we should stop
-        if stop_check and stop_check():
-            return {
-                "success": False,
-                "processed_clues": processed_clues,
-                "total_found": len(processed_clues),
-                "message": "Operation stopped by user"
-            }
-        
-        # Check if templates exist
-        if not clue_template.exists():
-            print(f"Warning: Template not found: {clue_template}")
-            continue
-        
-        if not clue_full_template.exists():
-            print(f"Warning: Template not found: {clue_full_template}")
-            continue
-        
-        # Take screenshot for this clue
-        screenshot = pyautogui.screenshot()
-        
-        # Step 1: Try to find the clue using SIFT (clue{num}.png)
-        result = find_template_sift(
-            screenshot,
-            clue_template,
-            min_matches=min_matches,
-            ratio_threshold=0.7
-        )
-        
-        if result is None:
-            print(f"{clue_name}: Not found")
-            continue
-        
-        confidence = result.get("confidence", 0.0)
-        
-        if confidence < confidence_threshold:
-            print(f"{clue_name}: Found but confidence too low: {confidence:.2%}")
-            continue
-        
-        # Step 2: Try to find the full clue (clue{num}full.png)
-        result_full = find_template_sift(
-            screenshot,
-            clue_full_template,
-            min_matches=min_matches,
-            ratio_threshold=0.7
-        )
-        
-        confidence_full = result_full.get("confidence", 0.0) if result_full else 0.0
-        
-        # Compare confidence
-        if confidence <= confidence_full:
-            print(f"{clue_name}: Skipped (confidence comparison failed: "
-                  f"{confidence:.2%} <= {confidence_full:.2%})")
-            continue
-        
-        # Clue found with confidence > full clue confidence
-        center_x = result["center_x"]
-        center_y = result["center_y"]
-        matches = result.get("matches", 0)
+    analysis = FrameAnalysis()
+    plan = plan_clue_placement(analysis, confidence_threshold, min_matches)
+    board = _board_region(analysis, plan)
+    analyses = 1
+    attempted: list[str] = []
+    
+    for _ in trace_iterations("clues_ocr clue"):
+        if not plan:
+            break
+        clue = plan.pop(0)
+        clue_name = clue["name"]
+        attempted.append(clue_name)
         
-        print(f"{clue_name}: Found at ({center_x}, {center_y}), "
-              f"confidence={confidence:.2%} > {confidence_full:.2%}, matches={matches}")
+        print(f"{clue_name}: Found at ({clue['center_x']}, {clue['center_y']}), "
+              f"confidence={clue['confidence']:.2%} > {clue['confidence_full']:.2%}, matches={clue['matches']}")
         
-        # Check stop again before clicking
+        # Check stop before clicking
         if stop_check and stop_check():
             return {
                 "success": False,
                 "processed_clues": processed_clues,
                 "total_found": len(processed_clues),
+                "analyses": analyses,
                 "message": "Operation stopped by user"
             }
         
         try:
             # Click the clue position
-            pyautogui.click(center_x, center_y)
-            time.sleep(0.5)  # Wait a bit after clicking
+            pyautogui.click(clue["center_x"], clue["center_y"])
+            # Wait for the placement panel to settle after clicking
+            if wait_until_stable(max_wait=0.5, min_wait=0.1, stop_check=stop_check)["stopped"]:
+                raise StopExecution("Stopped")
             
             # Execute the place_clue config
             run_timeline(
@@ -163,13 +198,35 @@ def process_clues_placement(
             processed_clues.append(clue_name)
             print(f"{clue_name}: Placed successfully")
             
-            # Wait a bit before processing next clue
-            time.sleep(0.5)
+            # Wait for the clue board to settle before processing next clue
+            if wait_until_stable(max_wait=0.5, min_wait=0.1, stop_check=stop_check)["stopped"]:
+                raise StopExecution("Stopped")
             
+        except StopExecution:
+            return {
+                "success": False,
+                "processed_clues": processed_clues,
+                "total_found": len(processed_clues),
+                "analyses": analyses,
+                "message": "Operation stopped by user"
+            }
         except Exception as e:
             print(f"{clue_name}: Error during placement: {e}")
             # Continue to next clue even if this one failed
             continue
+        
+        if not plan:
+            break
+        # Positions in the plan stay valid unless the placement changed the board
+        settled = FrameAnalysis()
+        if frame_difference(analysis.region_image(board), settled.region_image(board)) > BOARD_CHANGE_THRESHOLD:
+            analysis = settled
+            plan = plan_clue_placement(analysis, confidence_threshold, min_matches, exclude=attempted)
+            board = _board_region(analysis, plan)
+            analyses += 1
+            increment("clue_reanalysis", "changed")
+        else:
+            increment("clue_reanalysis", "unchanged")
     
     # Return summary
     total_found = len(processed_clues)
@@ -179,6 +236,7 @@ def process_clues_placement(
             "success": True,
             "processed_clues": processed_clues,
             "total_found": total_found,
+            "analyses": analyses,
             "message": f"Successfully processed {total_found} clue(s): {', '.join(processed_clues)}"
         }
     else:
@@ -186,5 +244,24 @@ def process_clues_placement(
             "success": False,
             "processed_clues": [],
             "total_found": 0,
+            "analyses": analyses,
             "message": "No clues found"
         }
+
+
+def _prefetch_clues_ocr(event: dict) -> None:
+    prefetch_templates(sorted(CLUES_TEMPLATE_DIR.glob("clue*.png")))
+
+
+@event_handler("clues_ocr", prefetch=_prefetch_clues_ocr)
+def handle_clues_ocr(event: dict, context: EventContext) -> None:
+    confidence_threshold = float(event.get("confidence_threshold", 0.5))
+    min_matches = int(event.get("min_matches", 10))
+
+    result = process_clues_placement(
+        confidence_threshold=confidence_threshold,
+        min_matches=min_matches,
+        stop_check=context.stop_check,
+    )
+
+    print(f"clues_ocr result: {result['message']}")
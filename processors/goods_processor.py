@@ -1,18 +1,36 @@
 from __future__ import annotations
 
+import logging
 import re
+import threading
 from pathlib import Path
 
 import cv2
 import easyocr
 import numpy as np
-from PIL import Image, ImageGrab
+import pyautogui
+from PIL import Image
 
-from ocr import find_template_sift
+from automation import StopExecution
+from metrics import timed
+from ocr import capture_screen, find_template_sift, prefetch_templates, wait_until_stable
+from processors.registry import EventContext, event_handler
 
 
 GOODS_TEMPLATE_DIR = Path("templates") / "goods"
 
+_ocr_reader: easyocr.Reader | None = None
+_ocr_reader_lock = threading.Lock()
+
+
+def get_ocr_reader() -> easyocr.Reader:
+    """Return the shared easyocr reader, creating it on first use."""
+    global _ocr_reader
+    with _ocr_reader_lock:
+        if _ocr_reader is None:
+            _ocr_reader = easyocr.Reader(["en"], gpu=False)
+        return _ocr_reader
+
 
 def find_template_region(
     full_screen_image: Image.Image | None,
@@ -44,7 +62,9 @@ def find_template_region(
         full_screen_cv = cv2.cvtColor(np.array(full_screen_image), cv2.COLOR_RGB2BGR)
     
     # Use unified SIFT function
-    result = find_template_sift(full_screen_cv, template_path, min_matches, screen_gray)
+    result = find_template_sift(
+        full_screen_cv, template_path, min_matches, screen_gray, source_frame=full_screen_image
+    )
     
     if result is None:
         return None
@@ -143,7 +163,8 @@ def ocr_percent_and_bbox(
     _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
 
     rgb = cv2.cvtColor(thresh, cv2.COLOR_GRAY2RGB)
-    ocr_results = reader.readtext(rgb, detail=1, allowlist="0123456789.%")
+    with timed("ocr_tile_seconds"):
+        ocr_results = reader.readtext(rgb, detail=1, allowlist="0123456789.%")
     tokens = _extract_tokens(ocr_results)
     return _pick_percent_token(tokens)
 
@@ -217,7 +238,7 @@ def process_goods_image(template_path: Path | str | None = None) -> dict:
         raise ValueError("goods_ocr requires template group: gudi or wuling")
 
     # Take full screen screenshot
-    full_screen = ImageGrab.grab()
+    full_screen = capture_screen()
 
     template_paths = _load_goods_item_templates(template_group)
     if not template_paths:
@@ -225,7 +246,7 @@ def process_goods_image(template_path: Path | str | None = None) -> dict:
 
     full_screen_cv = cv2.cvtColor(np.array(full_screen), cv2.COLOR_RGB2BGR)
     screen_gray = cv2.cvtColor(full_screen_cv, cv2.COLOR_BGR2GRAY)
-    reader = easyocr.Reader(["en"], gpu=False)
+    reader = get_ocr_reader()
     results = []
 
     for template_img in template_paths:
@@ -361,3 +382,37 @@ def format_goods_ocr_items(ocr_result: dict) -> list[str]:
             )
 
     return formatted
+
+
+def _prefetch_goods_ocr(event: dict) -> None:
+    group = _resolve_goods_group(event.get("template"))
+    if group is not None:
+        prefetch_templates(_load_goods_item_templates(group))
+    get_ocr_reader()
+
+
+@event_handler("goods_ocr", prefetch=_prefetch_goods_ocr)
+def handle_goods_ocr(event: dict, context: EventContext) -> None:
+    """Process goods image and auto-click the cheapest item."""
+    # Prioritize event-level template over global template
+    template_path = None
+    template_key = event.get("template") or context.data.get("goods_template")
+    if template_key:
+        if template_key in {"gudi", "wuling"}:
+            template_path = template_key
+        else:
+            template_path = Path("templates") / template_key
+    result = process_goods_image(template_path=template_path)
+    logger = logging.getLogger("app")
+    logger.info(
+        "goods_ocr result: template=%s",
+        result.get("template"),
+    )
+    for item_line in format_goods_ocr_items(result):
+        logger.info("goods_ocr item: %s", item_line)
+    analysis = analyze_goods_data(result)
+    if analysis:
+        if wait_until_stable(max_wait=0.3, stop_check=context.stop_check)["stopped"]:
+            raise StopExecution("Stopped")
+        # Auto-click the cheapest item
+        pyautogui.click(analysis["center_x"], analysis["center_y"])
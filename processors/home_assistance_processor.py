@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-import time
 from pathlib import Path
 from typing import Callable
 
 import pyautogui
 
-from ocr import recognize_template
+from automation import StopExecution, sleep_or_stop
+from ocr import capture_screen, prefetch_templates, recognize_template
+from processors.registry import EventContext, event_handler
+from tracing import trace_iterations
 
 
 TEMPLATE_DIR = Path("templates")
@@ -49,7 +51,7 @@ def process_home_assistance(
     total_clicks = 0
     iteration = 0
     
-    for iteration in range(1, max_iterations + 1):
+    for iteration in trace_iterations("home_assist_ocr iteration", range(1, max_iterations + 1)):
         # Check if we should stop
         if stop_check and stop_check():
             return {
@@ -62,7 +64,7 @@ def process_home_assistance(
         print(f"Home assistance loop: Iteration {iteration}/{max_iterations}")
         
         # Take full screenshot
-        screenshot = pyautogui.screenshot()
+        screenshot = capture_screen()
         
         # Recognize template using SIFT
         result = recognize_template(screenshot, HOME_ASSISTANCE_TEMPLATE.name)
@@ -82,13 +84,21 @@ def process_home_assistance(
         y = result["y"]
         
         print(f"Home assistance loop [#{iteration}]: Clicking at ({x}, {y}), confidence={confidence:.1f}%")
-        pyautogui.click(x, y)
-        time.sleep(click_interval)
-        pyautogui.click(x, y)
-        total_clicks += 1
-        
-        # Sleep at the end of each iteration
-        time.sleep(0.5)
+        try:
+            pyautogui.click(x, y)
+            sleep_or_stop(click_interval, stop_check)
+            pyautogui.click(x, y)
+            total_clicks += 1
+            
+            # Sleep at the end of each iteration
+            sleep_or_stop(0.5, stop_check)
+        except StopExecution:
+            return {
+                "success": False,
+                "total_iterations": iteration,
+                "total_clicks": total_clicks,
+                "message": "Operation stopped by user"
+            }
     
     if total_clicks > 0:
         return {
@@ -104,3 +114,14 @@ def process_home_assistance(
             "total_clicks": 0,
             "message": f"No assistance found in {iteration} iteration(s)"
         }
+
+
+def _prefetch_home_assist_ocr(event: dict) -> None:
+    prefetch_templates([HOME_ASSISTANCE_TEMPLATE])
+
+
+@event_handler("home_assist_ocr", prefetch=_prefetch_home_assist_ocr)
+def handle_home_assist_ocr(event: dict, context: EventContext) -> None:
+    """Recognize the use-assistance template and click it while confidence > 90%."""
+    result = process_home_assistance(stop_check=context.stop_check)
+    print(f"home_assist_ocr: {result['message']}")
@@ -5,10 +5,11 @@ from pathlib import Path
 from typing import Callable
 
 import pyautogui
-from PIL import ImageGrab
 
-from ocr import recognize_compare_two_templates
+from ocr import TEMPLATE_DIR, capture_screen, prefetch_templates, recognize_compare_two_templates
 from automation import StopExecution
+from processors.registry import EventContext, event_handler
+from tracing import trace_iterations
 
 
 TEMPLATES_DIR = Path("templates")
@@ -62,14 +63,14 @@ def find_npc_by_walking(
     }
     
     try:
-        for step_idx in range(max_steps):
+        for step_idx in trace_iterations("find_npc_ocr step", range(max_steps)):
             if stop_check and stop_check():
                 raise StopExecution("Stopped by user")
             
             print(f"Find NPC: Step {step_idx + 1}/{max_steps}")
             
             # Take screenshot and recognize both templates
-            screenshot = ImageGrab.grab()
+            screenshot = capture_screen()
             result = recognize_compare_two_templates(
                 screenshot,
                 TALK_TEMPLATE,
@@ -125,3 +126,22 @@ def find_npc_by_walking(
         stats["message"] = f"Error: {e}"
         print(f"Find NPC: {stats['message']}")
         return stats
+
+
+def _prefetch_find_npc_ocr(event: dict) -> None:
+    prefetch_templates([TEMPLATE_DIR / TALK_TEMPLATE, TEMPLATE_DIR / CALL_TEMPLATE])
+
+
+@event_handler("find_npc_ocr", prefetch=_prefetch_find_npc_ocr)
+def handle_find_npc_ocr(event: dict, context: EventContext) -> None:
+    confidence_threshold = float(event.get("confidence_threshold", 0.5))
+    min_matches = int(event.get("min_matches", 10))
+
+    result = find_npc_by_walking(
+        confidence_threshold=confidence_threshold,
+        min_matches=min_matches,
+        max_steps=9,
+        stop_check=context.stop_check,
+    )
+
+    print(f"find_npc_ocr result: {result['message']}")
@@ -1,73 +1,290 @@
 """
 Plants harvest loop processor - OCR-based plant harvesting automation.
 
-Workflow (all within main loop):
-1. Detect empty plants using SIFT
-2. If not found, exit loop
-3. If found, click on empty plant
-4. Check for extractable cores (plants_extract)
-   - If found, click and execute extract config
-5. Check for harvestable plants (plants_confirm) - always required
-   - If found, click and continue to next iteration
-   - If not found, exit loop
+The loop is a state machine fed by a continuous FrameSource. Each state looks
+for its templates only in its own region of the newest frame and moves on as
+soon as the expected UI shows up in two consecutive frames, instead of sleeping
+for a fixed time and taking a fresh screenshot. After a click, the next state
+first waits for the clicked UI to go away (the button no longer matching, or
+the screen changing for the empty plant), so stale frames are never clicked twice:
+
+    find_empty  empty plant (full screen) -> click -> sort (first time) / panel
+                not found within the frame budget -> done
+    sort        run the sort config once -> panel
+    panel       plants_extract (bottom-right, optional) -> click -> extract
+                plants_confirm (bottom-right) -> click -> find_empty
+                neither -> done
+    extract     run the extract core config -> confirm
+    confirm     plants_confirm (bottom-right) -> click -> find_empty, else done
+
+Time spent in each state is recorded in the result and the
+"plants_state_seconds" metric.
 """
 
 import logging
+import math
 import time
 from pathlib import Path
 from typing import Callable
 
 import pyautogui
-from PIL import ImageGrab
 
 from automation import load_steps, run_timeline, StopExecution
-from ocr import recognize_template
+from metrics import observe
+from ocr import TEMPLATE_DIR, FrameAnalysis, FrameSource, frame_difference, prefetch_templates
+from processors.registry import EventContext, event_handler
+from tracing import trace_iterations
 
 logger = logging.getLogger("app")
 
+EMPTY_TEMPLATE = TEMPLATE_DIR / "plants" / "plants_empty1.png"
+EXTRACT_TEMPLATE = TEMPLATE_DIR / "plants" / "plants_extract.png"
+CONFIRM_TEMPLATE = TEMPLATE_DIR / "plants" / "plants_confirm.png"
 
-def get_bottom_right_region(screen_image):
-    """
-    Get the bottom-right quarter of the screen (from 1/2, 1/2 to 1.0, 1.0).
-    
-    Returns:
-        tuple: (cropped_image, x_offset, y_offset)
-        - cropped_image: PIL Image of the bottom-right region
-        - x_offset: x coordinate offset to convert back to full screen
-        - y_offset: y coordinate offset to convert back to full screen
-    """
-    width, height = screen_image.size
-    x_offset = width // 2
-    y_offset = height // 2
-    
-    # Crop to bottom-right quarter
-    cropped = screen_image.crop((x_offset, y_offset, width, height))
-    
-    return cropped, x_offset, y_offset
+SORT_CONFIG = Path("configs/帝江号收菜/切换拥有数量升序.json")
+EXTRACT_CONFIG = Path("configs/帝江号收菜/提取基核.json")
+
+# Minimum SIFT confidence (0-1) of the bottom-right panel buttons
+PANEL_CONFIDENCE = 0.9
+
+# Per waiting state: (seconds after entering before frames count, frames analysed before giving up)
+# The limit counts frames rather than seconds, so slow SIFT matching does not shorten it
+STATE_TIMINGS = {
+    "find_empty": (0.1, 20),
+    "panel": (0.1, 30),
+    "confirm": (0.1, 40),
+}
+
+# Seconds between captures of the frame source
+FRAME_INTERVAL = 0.05
+
+# Seconds to wait for the frame source to deliver a single new frame
+FRAME_TIMEOUT = 2.0
+
+# A detection counts once it repeats in the next frame within this many pixels
+STABLE_DISTANCE = 8
+
+# Mean pixel difference (0-255, see frame_difference) from the click frame that counts as a UI change
+UI_CHANGE_THRESHOLD = 3.0
+
+
+def full_screen_region(analysis: FrameAnalysis) -> None:
+    return None
 
 
-def recognize_in_bottom_right(screen_image, template_name, min_matches=4):
+def bottom_right_region(analysis: FrameAnalysis) -> tuple[int, int, int, int]:
+    """Bottom-right quarter of the frame (from 1/2, 1/2 to 1.0, 1.0)."""
+    width, height = analysis.frame.size
+    return (width // 2, height // 2, width, height)
+
+
+class PlantsHarvester:
     """
-    Recognize a template in the bottom-right quarter of the screen.
-    
-    Returns dict with coordinates adjusted to full screen, or None if not found.
+    Harvest state machine; run() returns the loop statistics.
+
+    Args:
+        frames: Started FrameSource supplying full-screen frames
+        stop_check: Optional callback to check if execution should stop
+        max_iterations: Maximum number of empty plants to handle
     """
-    cropped, x_offset, y_offset = get_bottom_right_region(screen_image)
-    
-    result = recognize_template(cropped, template_name, min_matches)
-    
-    if result is None:
-        return None
-    
-    # Adjust coordinates to full screen
-    result["x"] += x_offset
-    result["y"] += y_offset
-    result["x1"] += x_offset
-    result["y1"] += y_offset
-    result["x2"] += x_offset
-    result["y2"] += y_offset
-    
-    return result
+
+    def __init__(
+        self,
+        frames: FrameSource,
+        stop_check: Callable[[], bool] | None = None,
+        max_iterations: int = 100,
+    ) -> None:
+        self.frames = frames
+        self.stop_check = stop_check
+        self.max_iterations = max_iterations
+        self.iteration = 0
+        self.sort_executed = False  # Sort config runs once, at the first empty plant
+        self._iteration_spans = trace_iterations("plants_loop iteration")
+        # (template or None, region_fn, min_confidence, click frame) of the last click
+        self._clicked_ui: tuple | None = None
+        self.stats = {
+            "success": False,
+            "message": "",
+            "total_iterations": 0,
+            "confirm_clicks": 0,
+            "extract_clicks": 0,
+            "states": {},
+            "error": None,
+        }
+
+    def run(self) -> dict:
+        state = "find_empty"
+        while state != "done":
+            if self.stop_check and self.stop_check():
+                raise StopExecution("Stopped by user")
+            started = time.monotonic()
+            next_state = getattr(self, f"_state_{state}")()
+            self._record_state(state, time.monotonic() - started)
+            state = next_state
+        self.stats["total_iterations"] = self.iteration
+        return self.stats
+
+    def _record_state(self, state: str, elapsed: float) -> None:
+        timing = self.stats["states"].setdefault(state, {"count": 0, "total": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["total"] += elapsed
+        timing["max"] = max(timing["max"], elapsed)
+        observe("plants_state_seconds", elapsed, state)
+
+    def _clicked_ui_gone(self, analysis: FrameAnalysis) -> bool:
+        """True once the UI clicked last is no longer on screen."""
+        template, region_fn, min_confidence, click_frame = self._clicked_ui
+        if template is None:
+            return frame_difference(click_frame.frame, analysis.frame) > UI_CHANGE_THRESHOLD
+        result = analysis.find_template(template, region=region_fn(analysis), min_matches=4)
+        return result is None or result["confidence"] < min_confidence
+
+    def _wait_for(self, state: str, checks: list[tuple]) -> tuple[str, dict, FrameAnalysis] | None:
+        """
+        Wait for the first of checks [(name, template, region_fn, min_confidence)] to appear.
+
+        Frames are only matched once the UI clicked last has gone away.
+
+        Returns (name, result, frame) once the same check matches at about the
+        same position in two consecutive frames, or None when the state's frame
+        budget runs out. A match in the last budgeted frame still gets the next
+        frame to confirm it.
+        """
+        min_wait, max_frames = STATE_TIMINGS[state]
+        after = time.monotonic() + min_wait
+        frames = 0
+        previous = None
+        while True:
+            frame = self.frames.next_frame(after, FRAME_TIMEOUT, self.stop_check)
+            if frame is None:
+                if self.stop_check and self.stop_check():
+                    raise StopExecution("Stopped by user")
+                return None
+            captured_at, analysis = frame
+            after = captured_at + 1e-6
+            frames += 1
+            if self._clicked_ui is not None:
+                if not self._clicked_ui_gone(analysis):
+                    if frames >= max_frames:
+                        logger.info(f"Plants harvest loop [#{self.iteration}]: {state}: clicked UI did not go away")
+                        return None
+                    continue
+                self._clicked_ui = None
+            hit = None
+            for name, template, region_fn, min_confidence in checks:
+                result = analysis.find_template(template, region=region_fn(analysis), min_matches=4)
+                if result is not None and result["confidence"] >= min_confidence:
+                    hit = (name, result, analysis)
+                    break
+            if (
+                hit is not None
+                and previous is not None
+                and hit[0] == previous[0]
+                and math.dist(
+                    (hit[1]["center_x"], hit[1]["center_y"]),
+                    (previous[1]["center_x"], previous[1]["center_y"]),
+                ) <= STABLE_DISTANCE
+            ):
+                return hit
+            if frames >= max_frames and (hit is None or frames > max_frames):
+                return None
+            previous = hit
+
+    def _run_config(self, config_path: Path) -> None:
+        # No state reads frames while a config plays; stop capturing meanwhile
+        with self.frames.paused():
+            run_timeline(
+                load_steps(config_path),
+                stop_check=self.stop_check,
+                event_callback=None,
+                wait_for_events=True,
+            )
+
+    def _click(
+        self,
+        name: str,
+        result: dict,
+        analysis: FrameAnalysis,
+        template: Path | None = None,
+        region_fn: Callable = full_screen_region,
+        min_confidence: float = 0.0,
+    ) -> None:
+        """
+        Click a detection and remember what has to disappear before the next match.
+
+        Without a template, the frame has to change compared to the click frame.
+        """
+        logger.info(
+            f"Plants harvest loop [#{self.iteration}]: "
+            f"Clicked {name} at ({result['center_x']}, {result['center_y']}), "
+            f"confidence={result['confidence'] * 100:.1f}%"
+        )
+        pyautogui.click(result["center_x"], result["center_y"])
+        self._clicked_ui = (template, region_fn, min_confidence, analysis)
+
+    def _state_find_empty(self) -> str:
+        if self.iteration >= self.max_iterations:
+            return "done"
+        next(self._iteration_spans)
+        hit = self._wait_for("find_empty", [("empty", EMPTY_TEMPLATE, full_screen_region, 0.0)])
+        if hit is None:
+            logger.info(f"Plants harvest loop [#{self.iteration}]: No empty plants found, exiting loop")
+            return "done"
+        self.iteration += 1
+        logger.info(f"Plants harvest loop: Iteration {self.iteration}")
+        # The plant may still look empty; wait for the panel to change the screen
+        self._click("empty plant", hit[1], hit[2])
+        return "panel" if self.sort_executed else "sort"
+
+    def _state_sort(self) -> str:
+        logger.info(f"Plants harvest loop [#{self.iteration}]: Executing sort config (first time)...")
+        if not SORT_CONFIG.exists():
+            logger.warning(f"Sort config not found: {SORT_CONFIG}, skipping")
+            return "panel"
+        try:
+            self._run_config(SORT_CONFIG)
+            logger.info(f"Plants harvest loop [#{self.iteration}]: Sort config executed successfully")
+            self.sort_executed = True
+        except StopExecution:
+            raise
+        except Exception as e:
+            logger.error(f"Plants harvest loop [#{self.iteration}]: Error executing sort config: {e}")
+            # Continue even if sort config fails
+        return "panel"
+
+    def _state_panel(self) -> str:
+        hit = self._wait_for("panel", [
+            ("extract", EXTRACT_TEMPLATE, bottom_right_region, PANEL_CONFIDENCE),
+            ("confirm", CONFIRM_TEMPLATE, bottom_right_region, PANEL_CONFIDENCE),
+        ])
+        if hit is None:
+            logger.info(f"Plants harvest loop [#{self.iteration}]: No confirm template found, exiting loop")
+            return "done"
+        name, result, analysis = hit
+        template = EXTRACT_TEMPLATE if name == "extract" else CONFIRM_TEMPLATE
+        self._click(name, result, analysis, template, bottom_right_region, PANEL_CONFIDENCE)
+        if name == "extract":
+            self.stats["extract_clicks"] += 1
+            return "extract"
+        self.stats["confirm_clicks"] += 1
+        return "find_empty"
+
+    def _state_extract(self) -> str:
+        logger.info(f"Plants harvest loop [#{self.iteration}]: Executing extract core config...")
+        if not EXTRACT_CONFIG.exists():
+            raise FileNotFoundError(f"Config not found: {EXTRACT_CONFIG}")
+        self._run_config(EXTRACT_CONFIG)
+        logger.info(f"Plants harvest loop [#{self.iteration}]: Extract core config completed")
+        return "confirm"
+
+    def _state_confirm(self) -> str:
+        hit = self._wait_for("confirm", [("confirm", CONFIRM_TEMPLATE, bottom_right_region, PANEL_CONFIDENCE)])
+        if hit is None:
+            logger.info(f"Plants harvest loop [#{self.iteration}]: No confirm template found, exiting loop")
+            return "done"
+        self._click("confirm", hit[1], hit[2], CONFIRM_TEMPLATE, bottom_right_region, PANEL_CONFIDENCE)
+        self.stats["confirm_clicks"] += 1
+        return "find_empty"
 
 
 def run_plants_harvest_loop(
@@ -76,11 +293,11 @@ def run_plants_harvest_loop(
 ) -> dict:
     """
     Run the plants harvest loop using SIFT-based template recognition.
-    
+
     Args:
         stop_check: Optional callback to check if execution should stop
         max_iterations: Maximum number of loop iterations to prevent infinite loops
-    
+
     Returns:
         Dict with loop statistics:
         {
@@ -89,169 +306,62 @@ def run_plants_harvest_loop(
             "total_iterations": int,
             "confirm_clicks": int,
             "extract_clicks": int,
+            "states": {state: {"count", "total", "max"}} (seconds spent per state),
             "error": str (if any)
         }
     """
-    
-    stats = {
-        "success": False,
-        "message": "",
-        "total_iterations": 0,
-        "confirm_clicks": 0,
-        "extract_clicks": 0,
-        "error": None,
-    }
-    
-    try:
-        # Main harvest loop with integrated initialization
-        iteration = 0
-        sort_executed = False  # Flag to track if sort config has been executed once
-        
-        while iteration < max_iterations:
-            if stop_check and stop_check():
-                raise StopExecution("Stopped by user")
-            
-            iteration += 1
-            logger.info(f"Plants harvest loop: Iteration {iteration}")
-            
-            # Take a fresh screenshot for each iteration
-            screen = ImageGrab.grab()
-            
-            # Step 1: Check for empty plants
-            result_empty = recognize_template(screen, "plants/plants_empty1.png", min_matches=4)
-            
-            if result_empty is None:
-                logger.info(f"Plants harvest loop [#{iteration}]: No empty plants found, exiting loop")
-                break
-            
-            # Click on empty plant
-            click_x = result_empty["x"]
-            click_y = result_empty["y"]
-            logger.info(f"Plants harvest loop [#{iteration}]: Clicking empty plant at ({click_x}, {click_y})")
-            pyautogui.click(click_x, click_y)
-            time.sleep(0.3)
-            
-            # Step 1.5: Execute sort config once (only on first empty plant detected)
-            if not sort_executed:
-                logger.info(f"Plants harvest loop [#{iteration}]: Executing sort config (first time)...")
-                sort_config_path = Path("configs/帝江号收菜/切换拥有数量升序.json")
-                
-                if not sort_config_path.exists():
-                    logger.warning(f"Sort config not found: {sort_config_path}, skipping")
-                else:
-                    try:
-                        sort_steps = load_steps(sort_config_path)
-                        
-                        # Execute config timeline
-                        run_timeline(
-                            sort_steps,
-                            stop_check=stop_check,
-                            event_callback=None,
-                            wait_for_events=True,
-                        )
-                        
-                        logger.info(f"Plants harvest loop [#{iteration}]: Sort config executed successfully")
-                        sort_executed = True
-                        time.sleep(0.5)
-                    except Exception as e:
-                        logger.error(f"Plants harvest loop [#{iteration}]: Error executing sort config: {e}")
-                        # Continue even if sort config fails
-            
-            # Step 2: Check for extractable cores (plants_extract) - optional, in bottom-right corner
-            screen = ImageGrab.grab()
-            result_extract = recognize_in_bottom_right(screen, "plants/plants_extract.png", min_matches=4)
-            
-            # Apply confidence threshold
-            if result_extract is not None and result_extract["confidence"] < 90.0:
-                logger.info(f"Plants harvest loop [#{iteration}]: Extract detection confidence {result_extract['confidence']:.1f}% below threshold 90%, rejecting")
-                result_extract = None
-            
-            if result_extract is not None:
-                # Extractable core found, click it
-                click_x = result_extract["x"]
-                click_y = result_extract["y"]
-                logger.info(
-                    f"Plants harvest loop [#{iteration}]: "
-                    f"Clicked extract at ({click_x}, {click_y}), "
-                    f"confidence={result_extract['confidence']:.1f}%"
-                )
-                pyautogui.click(click_x, click_y)
-                stats["extract_clicks"] += 1
-                time.sleep(0.3)
-                
-                # Execute extract core config
-                logger.info(f"Plants harvest loop [#{iteration}]: Executing extract core config...")
-                config_path = Path("configs/帝江号收菜/提取基核.json")
-                
-                if not config_path.exists():
-                    raise FileNotFoundError(f"Config not found: {config_path}")
-                
-                steps = load_steps(config_path)
-                
-                # Execute config timeline
-                run_timeline(
-                    steps,
-                    stop_check=stop_check,
-                    event_callback=None,
-                    wait_for_events=True,
-                )
-                
-                logger.info(f"Plants harvest loop [#{iteration}]: Extract core config completed")
-                time.sleep(1.0)
-            
-            # Step 3: Check for harvestable plants (plants_confirm) - always required, in bottom-right corner
-            screen = ImageGrab.grab()
-            result_confirm = recognize_in_bottom_right(screen, "plants/plants_confirm.png", min_matches=4)
-            
-            # Apply confidence threshold
-            if result_confirm is not None and result_confirm["confidence"] < 90.0:
-                logger.info(f"Plants harvest loop [#{iteration}]: Confirm detection confidence {result_confirm['confidence']:.1f}% below threshold 90%, rejecting")
-                result_confirm = None
-            
-            if result_confirm is not None:
-                # Harvestable plant found, click it
-                click_x = result_confirm["x"]
-                click_y = result_confirm["y"]
+    with FrameSource(interval=FRAME_INTERVAL) as frames:
+        harvester = PlantsHarvester(frames, stop_check=stop_check, max_iterations=max_iterations)
+        stats = harvester.stats
+        try:
+            harvester.run()
+            stats["message"] = (
+                f"Loop completed: {stats['confirm_clicks']} confirm clicks, "
+                f"{stats['extract_clicks']} extract clicks, "
+                f"{stats['total_iterations']} total iterations"
+            )
+            stats["success"] = True
+
+            logger.info(f"Plants harvest loop: {stats['message']}")
+            for state, timing in stats["states"].items():
                 logger.info(
-                    f"Plants harvest loop [#{iteration}]: "
-                    f"Clicked confirm at ({click_x}, {click_y}), "
-                    f"confidence={result_confirm['confidence']:.1f}%"
+                    f"Plants harvest loop: {state} x{timing['count']}, "
+                    f"total {timing['total']:.2f}s, max {timing['max']:.2f}s"
                 )
-                pyautogui.click(click_x, click_y)
-                stats["confirm_clicks"] += 1
-                time.sleep(0.5)
-                continue
-            
-            # Step 4: confirm not found, exit loop
-            logger.info(f"Plants harvest loop [#{iteration}]: No confirm template found, exiting loop")
-            break
-        
-        stats["total_iterations"] = iteration
-        stats["message"] = (
-            f"Loop completed: {stats['confirm_clicks']} confirm clicks, "
-            f"{stats['extract_clicks']} extract clicks, "
-            f"{iteration} total iterations"
-        )
-        stats["success"] = True
-        
-        logger.info(f"Plants harvest loop: {stats['message']}")
-        
-        return stats
-    
-    except StopExecution as e:
-        stats["error"] = str(e)
-        stats["message"] = f"Stopped by user: {e}"
-        logger.warning(f"Plants harvest loop: {stats['message']}")
-        return stats
-    
-    except FileNotFoundError as e:
-        stats["error"] = str(e)
-        stats["message"] = f"File not found: {e}"
-        logger.error(f"Plants harvest loop: {stats['message']}")
-        return stats
-    
-    except Exception as e:
-        stats["error"] = str(e)
-        stats["message"] = f"Error: {e}"
-        logger.error(f"Plants harvest loop: {stats['message']}", exc_info=True)
-        return stats
+
+            return stats
+
+        except StopExecution as e:
+            stats["total_iterations"] = harvester.iteration
+            stats["error"] = str(e)
+            stats["message"] = f"Stopped by user: {e}"
+            logger.warning(f"Plants harvest loop: {stats['message']}")
+            return stats
+
+        except FileNotFoundError as e:
+            stats["total_iterations"] = harvester.iteration
+            stats["error"] = str(e)
+            stats["message"] = f"File not found: {e}"
+            logger.error(f"Plants harvest loop: {stats['message']}")
+            return stats
+
+        except Exception as e:
+            stats["total_iterations"] = harvester.iteration
+            stats["error"] = str(e)
+            stats["message"] = f"Error: {e}"
+            logger.error(f"Plants harvest loop: {stats['message']}", exc_info=True)
+            return stats
+
+
+def _prefetch_plants_loop(event: dict) -> None:
+    prefetch_templates(sorted((TEMPLATE_DIR / "plants").glob("*.png")))
+
+
+@event_handler("plants_loop", prefetch=_prefetch_plants_loop)
+def handle_plants_loop(event: dict, context: EventContext) -> None:
+    max_iterations = int(event.get("max_iterations", 8))
+    result = run_plants_harvest_loop(
+        stop_check=context.stop_check,
+        max_iterations=max_iterations,
+    )
+    print(f"plants_loop result: {result['message']}")
@@ -5,100 +5,114 @@ from pathlib import Path
 from typing import Callable
 
 import pyautogui
-from PIL import Image, ImageGrab
-
-from ocr import compare_similarity, crop_right_fraction, load_template_bgr, pil_to_bgr, match_template
+from PIL import Image
+
+from ocr import (
+    capture_screen,
+    compare_similarity_batch,
+    crop_right_fraction,
+    frame_difference,
+    load_template_bgr,
+    match_template_all,
+    pil_to_bgr,
+    wait_until_stable,
+)
+from processors.registry import EventContext, event_handler
+from workspace import resolve_config_path
+from tracing import trace_iterations
 
 TEMPLATE_DIR = Path("templates")
 QINGBAO_TEMPLATE = TEMPLATE_DIR / "qingbao.png"
 QINGBAO_INVALID_TEMPLATE = TEMPLATE_DIR / "qingbao_invalid.png"
 
+# Fraction of the screen width (from the right) holding the friends list buttons
+QINGBAO_ROI_FRACTION = 0.2
 
-def _resolve_config_path(config_path: Path | str) -> Path:
-    path = Path(config_path)
-    if path.exists():
-        return path
-    return Path(__file__).parent / path
+# Mean pixel difference (0-255) of the list before and after a scroll below which the list has ended
+LIST_END_THRESHOLD = 1.0
 
 
-def find_qingbao_target(
+def find_qingbao_targets(
     screenshot: Image.Image,
     match_threshold: float = 0.7,
-) -> dict | None:
+) -> list[dict]:
     """
-    Find qingbao target in screenshot using template matching.
+    Find all valid qingbao targets in a screenshot.
+    
+    Every template match above match_threshold is kept (with non-maximum
+    suppression), then all candidates are compared with the valid and invalid
+    templates in one SSIM batch each.
     
     Args:
         screenshot: Full screen PIL Image
         match_threshold: Minimum confidence threshold for template matching
     
     Returns:
-        Dict with center_x, center_y, and scores, or None if not found
+        List of dicts with center_x, center_y, and scores, ordered top to bottom
     """
     # Use ROI (right 20% of screen) for efficiency
-    roi_image, offset_x, offset_y = crop_right_fraction(screenshot, 0.2)
+    roi_image, offset_x, offset_y = crop_right_fraction(screenshot, QINGBAO_ROI_FRACTION)
     roi_bgr = pil_to_bgr(roi_image)
 
-    invalid_bgr = load_template_bgr(QINGBAO_INVALID_TEMPLATE)
-    if invalid_bgr is None:
-        return None
-
     valid_bgr = load_template_bgr(QINGBAO_TEMPLATE)
-    if valid_bgr is None:
-        return None
-
-    confidence, (x, y) = match_template(roi_bgr, valid_bgr)
-
-    if confidence < match_threshold:
-        return None
+    invalid_bgr = load_template_bgr(QINGBAO_INVALID_TEMPLATE)
+    if valid_bgr is None or invalid_bgr is None:
+        return []
 
     h, w = valid_bgr.shape[:2]
-    result = {
-        "center_x": x + w // 2,
-        "center_y": y + h // 2,
-        "confidence": confidence,
-        "bbox": [x, y, x + w, y + h],
-    }
-    print(f"Template matching: confidence={confidence:.2%}")
+    matches = match_template_all(roi_bgr, valid_bgr, match_threshold)
+    if not matches:
+        return []
+    print(f"Template matching: {len(matches)} candidates, best confidence={matches[0][0]:.2%}")
+
+    # Compare each candidate region with the valid/invalid templates
+    candidates = [roi_bgr[y:y + h, x:x + w] for _, (x, y) in matches]
+    valid_scores = compare_similarity_batch(candidates, valid_bgr)
+    invalid_scores = compare_similarity_batch(candidates, invalid_bgr)
+
+    targets = []
+    for (confidence, (x, y)), valid_score, invalid_score in zip(matches, valid_scores, invalid_scores):
+        if valid_score < invalid_score:
+            continue
+        # Calculate center in full screen coordinates
+        targets.append({
+            "center_x": offset_x + x + w // 2,
+            "center_y": offset_y + y + h // 2,
+            "score": float(confidence),
+            "valid_score": valid_score,
+            "invalid_score": invalid_score,
+        })
+    targets.sort(key=lambda target: target["center_y"])
+    return targets
 
-    # Extract candidate region and compare with valid/invalid templates
-    x1, y1, x2, y2 = result["bbox"]
-    candidate = roi_bgr[y1:y2, x1:x2]
-    if candidate.size == 0:
-        return None
 
-    # Load valid template for comparison
-    valid_bgr = load_template_bgr(QINGBAO_TEMPLATE)
-    if valid_bgr is None:
-        return None
+def find_qingbao_target(
+    screenshot: Image.Image,
+    match_threshold: float = 0.7,
+) -> dict | None:
+    """
+    Find the best-matching valid qingbao target in a screenshot.
     
-    valid_score = compare_similarity(candidate, valid_bgr)
-    invalid_score = compare_similarity(candidate, invalid_bgr)
-
-    if valid_score < invalid_score:
-        return None
-
-    # Calculate center in full screen coordinates
-    center_x = offset_x + result["center_x"]
-    center_y = offset_y + result["center_y"]
+    Returns:
+        Dict with center_x, center_y, and scores, or None if not found
+    """
+    targets = find_qingbao_targets(screenshot, match_threshold)
+    return max(targets, key=lambda target: target["score"]) if targets else None
 
-    confidence = result["confidence"]
 
-    return {
-        "center_x": center_x,
-        "center_y": center_y,
-        "score": float(confidence),
-        "valid_score": valid_score,
-        "invalid_score": invalid_score,
-    }
+def _list_unchanged(before: Image.Image, after: Image.Image) -> bool:
+    """True if the friends list looks the same in both screenshots."""
+    before_roi = crop_right_fraction(before, QINGBAO_ROI_FRACTION)[0]
+    after_roi = crop_right_fraction(after, QINGBAO_ROI_FRACTION)[0]
+    return frame_difference(before_roi, after_roi) <= LIST_END_THRESHOLD
 
 
 def _run_config(config_path: Path | str, stop_check: Callable[[], bool] | None) -> None:
     from automation import load_steps, run_timeline
 
-    resolved_path = _resolve_config_path(config_path)
-    if not resolved_path.exists():
-        raise FileNotFoundError(f"Config not found: {resolved_path}")
+    resolved_path = resolve_config_path(config_path)
+    if resolved_path is None:
+        raise FileNotFoundError(f"Config not found: {config_path}")
 
     data = load_steps(resolved_path)
     run_timeline(
@@ -117,17 +131,36 @@ def run_qingbao_loop(
     match_threshold: float = 0.7,
     stop_check: Callable[[], bool] | None = None,
 ) -> dict:
+    """
+    Visit valid qingbao targets on the friends list until the list ends.
+    
+    Every recognition works on a fresh screenshot and handles one target:
+    config_found leaves the list, so coordinates from an older screenshot are
+    no longer valid after it ran. Without a target, config_not_found scrolls
+    the page that was just recognized; when the list looks the same after the
+    scroll, its end has been reached and the loop stops.
+    
+    Returns:
+        Dict with click_count, recognition_count, list_end (the end of the list
+        was reached) and stopped (a limit was reached)
+    """
+    from automation import StopExecution
+
     logger = logging.getLogger("app")
     click_count = 0
     recognition_count = 0
+    list_end = False
+    iteration_spans = trace_iterations("qingbao_loop iteration")
 
-    while recognition_count < max_recognitions:
+    # The screenshot taken after a scroll is reused for the next recognition
+    screenshot = None
+    while recognition_count < max_recognitions and click_count < max_clicks:
+        next(iteration_spans)
         if stop_check and stop_check():
-            from automation import StopExecution
-
             raise StopExecution("Stopped")
 
-        screenshot = ImageGrab.grab()
+        if screenshot is None:
+            screenshot = capture_screen()
         target = find_qingbao_target(screenshot, match_threshold=match_threshold)
         recognition_count += 1
 
@@ -141,15 +174,50 @@ def run_qingbao_loop(
             pyautogui.click(target["center_x"], target["center_y"])
             click_count += 1
             _run_config(config_found, stop_check)
-
-            if click_count >= max_clicks:
-                break
-        else:
-            logger.info("qingbao: no valid target found")
-            _run_config(config_not_found, stop_check)
+            screenshot = None
+            continue
+
+        # Scroll the page just recognized; an unchanged list means there is no next page
+        logger.info("qingbao: no valid target found")
+        before = screenshot
+        _run_config(config_not_found, stop_check)
+        if wait_until_stable(max_wait=0.5, min_wait=0.1, stop_check=stop_check)["stopped"]:
+            raise StopExecution("Stopped")
+        screenshot = capture_screen()
+        if _list_unchanged(before, screenshot):
+            logger.info("qingbao: end of the friends list reached")
+            list_end = True
+            break
 
     return {
         "click_count": click_count,
         "recognition_count": recognition_count,
+        "list_end": list_end,
         "stopped": click_count >= max_clicks or recognition_count >= max_recognitions,
     }
+
+
+def _prefetch_qingbao_loop(event: dict) -> None:
+    load_template_bgr(QINGBAO_TEMPLATE)
+    load_template_bgr(QINGBAO_INVALID_TEMPLATE)
+
+
+@event_handler("qingbao_loop", prefetch=_prefetch_qingbao_loop)
+def handle_qingbao_loop(event: dict, context: EventContext) -> None:
+    config_found = event.get("config_found")
+    config_not_found = event.get("config_not_found")
+    max_clicks = int(event.get("max_clicks", 5))
+    max_recognitions = int(event.get("max_recognitions", 20))
+    match_threshold = float(event.get("match_threshold", 0.7))
+
+    if not config_found or not config_not_found:
+        raise ValueError("qingbao_loop requires config_found and config_not_found")
+
+    run_qingbao_loop(
+        config_found=config_found,
+        config_not_found=config_not_found,
+        max_clicks=max_clicks,
+        max_recognitions=max_recognitions,
+        match_threshold=match_threshold,
+        stop_check=context.stop_check,
+    )
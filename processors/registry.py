@@ -0,0 +1,149 @@
+"""
+Timeline event registry - maps processor event types to their handlers.
+
+Processor modules declare handlers with the @event_handler decorator. The module
+that owns an event type is listed in processors.EVENT_HANDLER_MODULES and is only
+imported the first time that type is dispatched or prefetched.
+"""
+
+from __future__ import annotations
+
+import importlib
+import json
+import logging
+import queue
+import threading
+from typing import Callable
+
+from processors import EVENT_HANDLER_MODULES
+
+
+class EventContext:
+    """Execution context passed to processor event handlers."""
+
+    def __init__(
+        self,
+        data: dict,
+        stop_check: Callable[[], bool] | None = None,
+        event_callback: Callable[[dict], None] | None = None,
+        wait_for_events: bool = False,
+    ) -> None:
+        self.data = data
+        self.stop_check = stop_check
+        self.event_callback = event_callback
+        self.wait_for_events = wait_for_events
+
+
+EventHandler = Callable[[dict, EventContext], None]
+
+_handlers: dict[str, EventHandler] = {}
+_prefetchers: dict[str, Callable[[dict], None]] = {}
+_handler_override: EventHandler | None = None
+_load_lock = threading.Lock()
+
+_prefetch_queue: queue.Queue = queue.Queue()
+_prefetch_worker: threading.Thread | None = None
+_prefetch_lock = threading.Lock()
+_prefetched: set[str] = set()
+
+logger = logging.getLogger("app")
+
+
+def event_handler(event_type: str, prefetch: Callable[[dict], None] | None = None):
+    """
+    Register the decorated function as the handler for a timeline event type.
+
+    Args:
+        event_type: Timeline event "type" value
+        prefetch: Optional callback that warms heavy resources (models, templates)
+            for an upcoming event of this type
+    """
+    def decorator(func: EventHandler) -> EventHandler:
+        _handlers[event_type] = func
+        if prefetch is not None:
+            _prefetchers[event_type] = prefetch
+        return func
+
+    return decorator
+
+
+def _ensure_loaded(event_type: str) -> None:
+    if event_type in _handlers:
+        return
+    module_name = EVENT_HANDLER_MODULES.get(event_type)
+    if module_name is None:
+        return
+    with _load_lock:
+        if event_type not in _handlers:
+            importlib.import_module(module_name)
+
+
+def set_handler_override(handler: EventHandler | None) -> None:
+    """
+    Route every processor event (and visual_wait) to one handler, e.g. a dry-run stub.
+
+    Args:
+        handler: Replacement handler, or None to restore the registered handlers
+    """
+    global _handler_override
+    _handler_override = handler
+
+
+def get_handler_override() -> EventHandler | None:
+    return _handler_override
+
+
+def get_event_handler(event_type: str) -> EventHandler | None:
+    """Return the handler for an event type, importing its module on first use."""
+    if _handler_override is not None and event_type in EVENT_HANDLER_MODULES:
+        return _handler_override
+    _ensure_loaded(event_type)
+    return _handlers.get(event_type)
+
+
+def prefetch_event(event: dict) -> None:
+    """Load the handler module of an event and warm its resources."""
+    event_type = event.get("type")
+    if not event_type:
+        return
+    _ensure_loaded(event_type)
+    prefetch = _prefetchers.get(event_type)
+    if prefetch is not None:
+        prefetch(event)
+
+
+def _prefetch_loop() -> None:
+    while True:
+        func, args = _prefetch_queue.get()
+        try:
+            func(*args)
+        except Exception as e:
+            logger.warning("Prefetch failed (%s): %s", getattr(func, "__name__", func), e)
+
+
+def submit_prefetch(func: Callable, *args) -> None:
+    """Run func(*args) on the background prefetch worker."""
+    global _prefetch_worker
+    with _prefetch_lock:
+        if _prefetch_worker is None or not _prefetch_worker.is_alive():
+            _prefetch_worker = threading.Thread(target=_prefetch_loop, daemon=True)
+            _prefetch_worker.start()
+    _prefetch_queue.put((func, args))
+
+
+def prefetch_timeline(timeline: list[dict]) -> None:
+    """
+    Queue every processor event of a timeline for background prefetch.
+
+    Each distinct event is only prefetched once per process; the caches it warms
+    are shared by later runs.
+    """
+    for event in timeline:
+        if event.get("type") not in EVENT_HANDLER_MODULES:
+            continue
+        key = json.dumps(event, sort_keys=True, ensure_ascii=False, default=str)
+        with _prefetch_lock:
+            if key in _prefetched:
+                continue
+            _prefetched.add(key)
+        submit_prefetch(prefetch_event, event)
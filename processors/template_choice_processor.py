@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import time
+
+import pyautogui
+
+from automation import load_steps, request_composite_break, run_timeline
+from ocr import TEMPLATE_DIR, capture_screen, prefetch_templates, recognize_compare_two_templates
+from processors.registry import EventContext, event_handler
+from workspace import get_workspace
+
+
+def _template_prefetcher(first_key: str, first_default: str, second_key: str, second_default: str):
+    def prefetch(event: dict) -> None:
+        prefetch_templates([
+            TEMPLATE_DIR / event.get(first_key, first_default),
+            TEMPLATE_DIR / event.get(second_key, second_default),
+        ])
+    return prefetch
+
+
+@event_handler(
+    "receive_clue_ocr",
+    prefetch=_template_prefetcher("template1", "clues/receive_all.png", "template2", "clues/invite.png"),
+)
+def handle_receive_clue_ocr(event: dict, context: EventContext) -> None:
+    """Click "receive all" when it beats the invite template."""
+    template1 = event.get("template1", "clues/receive_all.png")
+    template2 = event.get("template2", "clues/invite.png")
+    min_matches = int(event.get("min_matches", 10))
+
+    screenshot = capture_screen()
+    result = recognize_compare_two_templates(
+        screenshot,
+        template1,
+        template2,
+        min_matches=min_matches,
+    )
+
+    if result and result["success"] and result["winner"] == "template1":
+        # Click at the recognized position
+        center_x = result["center_x"]
+        center_y = result["center_y"]
+        print(f"receive_clue_ocr: Clicking at ({center_x}, {center_y})")
+        pyautogui.click(center_x, center_y)
+    else:
+        print(f"receive_clue_ocr: {result['message'] if result else 'No match found'}")
+
+
+def _run_branch_config(config_path_str: str | None, context: EventContext) -> None:
+    if not config_path_str:
+        return
+    config_path = get_workspace().resolve(config_path_str)
+    if config_path is None:
+        print(f"gift_choice_ocr: Config not found: {config_path_str}")
+        return
+    steps = load_steps(config_path)
+    run_timeline(
+        steps,
+        stop_check=context.stop_check,
+        event_callback=context.event_callback,
+        wait_for_events=context.wait_for_events,
+    )
+
+
+@event_handler(
+    "gift_choice_ocr",
+    prefetch=_template_prefetcher("template1", "gifts/receive_gift.png", "template2", "gifts/send_gift.png"),
+)
+def handle_gift_choice_ocr(event: dict, context: EventContext) -> None:
+    """Run config_if_template1 (receive gift) or config_if_template2 (send gift)."""
+    template1 = event.get("template1", "gifts/receive_gift.png")
+    template2 = event.get("template2", "gifts/send_gift.png")
+    min_matches = int(event.get("min_matches", 10))
+    config_if_template1 = event.get("config_if_template1")
+    config_if_template2 = event.get("config_if_template2")
+
+    screenshot = capture_screen()
+    result = recognize_compare_two_templates(
+        screenshot,
+        template1,
+        template2,
+        min_matches=min_matches,
+    )
+
+    if result and result["winner"] == "template1":
+        # Template1 (receive_gift) wins, execute config_if_template1
+        print(f"gift_choice_ocr: {result['message']}, executing {config_if_template1}")
+        _run_branch_config(config_if_template1, context)
+    elif result and result["winner"] == "template2":
+        # Template2 (send_gift) wins, execute config_if_template2
+        print(f"gift_choice_ocr: {result['message']}, executing {config_if_template2}")
+        _run_branch_config(config_if_template2, context)
+    else:
+        print(f"gift_choice_ocr: No match found or comparison failed")
+
+
+def _press_esc() -> None:
+    pyautogui.keyDown("esc")
+    time.sleep(0.05)
+    pyautogui.keyUp("esc")
+
+
+@event_handler(
+    "collection_max_ocr",
+    prefetch=_template_prefetcher(
+        "template_full", "collection_max.png", "template_not_full", "collection_notmax.png"
+    ),
+)
+def handle_collection_max_ocr(event: dict, context: EventContext) -> None:
+    """Close the collection panel and break the composite when collection is not full."""
+    template_full = event.get("template_full", "collection_max.png")
+    template_not_full = event.get("template_not_full", "collection_notmax.png")
+    min_matches = int(event.get("min_matches", 10))
+
+    screenshot = capture_screen()
+    result = recognize_compare_two_templates(
+        screenshot,
+        template_full,
+        template_not_full,
+        min_matches=min_matches,
+    )
+
+    is_full = False
+    if result is not None:
+        full_conf = float(result.get("confidence1", 0.0))
+        not_full_conf = float(result.get("confidence2", 0.0))
+        is_full = full_conf > not_full_conf
+        print(
+            f"collection_max_ocr: full={full_conf:.1f}%, "
+            f"not_full={not_full_conf:.1f}%"
+        )
+    else:
+        print("collection_max_ocr: Comparison failed")
+
+    _press_esc()
+
+    if not is_full:
+        _press_esc()
+        request_composite_break()
+        print("collection_max_ocr: Not full, requested composite stop")
+    else:
+        print("collection_max_ocr: Full, continuing")
@@ -0,0 +1,285 @@
+"""
+Recording journal - compact, crash-safe storage for events being recorded.
+
+The recorder appends events to an EventBuffer: one typed array per field instead
+of one dict per event. Each event is also streamed to a journal file next to the
+config (<config>.journal) as a fixed-size binary record, so an interrupted
+recording can be recovered. Saving converts the buffer to the usual JSON
+timeline and removes the journal.
+
+Journal layout: b"EFRJ1\\n" followed by records, each starting with a tag byte:
+    b"K" key id (uint16), length (uint16), UTF-8 key name - defines a key id
+    b"P" point count (uint16), count * (t, x, y) doubles - mouse path of the next event
+    b"E" EVENT_RECORD - one event
+
+A chord stores its modifier count in the button field and "+"-joins its modifiers
+and key into one key name.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from pathlib import Path
+
+JOURNAL_MAGIC = b"EFRJ1\n"
+JOURNAL_SUFFIX = ".journal"
+
+# Type and button codes are indexes into these tuples
+EVENT_TYPE_CODES = ("key_press", "key_release", "click", "hold", "drag", "mouse_path", "tap", "chord")
+BUTTON_CODES = ("left", "right", "middle", "x1", "x2")
+
+# time, type code, button code, key id, x / start_x, y / start_y, end_x, end_y, duration
+EVENT_RECORD = struct.Struct("<dBBHddddd")
+KEY_HEADER = struct.Struct("<HH")
+POINT_COUNT = struct.Struct("<H")
+
+# Seconds between fsyncs of the journal (records are flushed to the OS immediately)
+JOURNAL_SYNC_INTERVAL = 1.0
+
+NO_KEY = 0xFFFF
+
+logger = logging.getLogger("app")
+
+
+def journal_path(config_path: Path | str) -> Path:
+    """Journal file of a recording into config_path."""
+    return Path(config_path).with_suffix(JOURNAL_SUFFIX)
+
+
+class EventBuffer:
+    """
+    Columnar buffer of recorded input events (safe to append from several listener threads).
+
+    Args:
+        journal: Optional journal file to stream events to (created/truncated)
+    """
+
+    def __init__(self, journal: Path | str | None = None) -> None:
+        self.times = array("d")
+        self.types = array("B")
+        self.buttons = array("B")
+        self.key_ids = array("H")
+        self.xs = array("d")
+        self.ys = array("d")
+        self.end_xs = array("d")
+        self.end_ys = array("d")
+        self.durations = array("d")
+        # Mouse paths: event i owns points[path_starts[i] * 3 : (path_starts[i] + path_counts[i]) * 3]
+        self.path_starts = array("I")
+        self.path_counts = array("H")
+        self.points = array("d")
+        self.keys: list[str] = []
+        self._key_ids: dict[str, int] = {}
+        self._journal = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+        if journal is not None:
+            path = Path(journal)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._journal = path.open("wb")
+            self._journal.write(JOURNAL_MAGIC)
+            self._journal.flush()
+        self.journal_path = None if journal is None else Path(journal)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _key_id(self, key_name: str) -> int:
+        key_id = self._key_ids.get(key_name)
+        if key_id is None:
+            key_id = self._key_ids[key_name] = len(self.keys)
+            self.keys.append(key_name)
+            if self._journal is not None:
+                encoded = key_name.encode("utf-8")
+                self._journal.write(b"K" + KEY_HEADER.pack(key_id, len(encoded)) + encoded)
+        return key_id
+
+    def append(self, event: dict) -> None:
+        """Append a recorded event dict (see Recorder._add_event)."""
+        with self._lock:
+            self._append_event(event)
+
+    def _append_event(self, event: dict) -> None:
+        event_type = event["type"]
+        button = event.get("button")
+        key_name = event.get("key")
+        button_code = BUTTON_CODES.index(button) if button in BUTTON_CODES else 0
+        if event_type == "chord":
+            modifiers = list(event.get("modifiers", []))
+            key_name = "+".join([*modifiers, key_name])
+            button_code = len(modifiers)
+        path = event.get("points") if event_type == "mouse_path" else event.get("path")
+        flat_points = [float(value) for point in path or () for value in point[:3]]
+        if event_type == "drag":
+            x, y = event["start_x"], event["start_y"]
+            end_x, end_y = event["end_x"], event["end_y"]
+        else:
+            x, y = event.get("x", 0.0), event.get("y", 0.0)
+            end_x = end_y = 0.0
+        values = (
+            float(event["time"]),
+            EVENT_TYPE_CODES.index(event_type),
+            button_code,
+            NO_KEY if key_name is None else self._key_id(key_name),
+            float(x),
+            float(y),
+            float(end_x),
+            float(end_y),
+            float(event.get("duration", 0.0)),
+        )
+        self._append_values(values, flat_points)
+        if self._journal is not None:
+            if flat_points:
+                count = len(flat_points) // 3
+                self._journal.write(b"P" + POINT_COUNT.pack(count) + struct.pack(f"<{len(flat_points)}d", *flat_points))
+            self._journal.write(b"E" + EVENT_RECORD.pack(*values))
+            self._journal.flush()
+            now = time.monotonic()
+            if now - self._last_sync >= JOURNAL_SYNC_INTERVAL:
+                os.fsync(self._journal.fileno())
+                self._last_sync = now
+
+    def _append_values(self, values: tuple, flat_points: list[float] | tuple = ()) -> None:
+        event_time, type_code, button_code, key_id, x, y, end_x, end_y, duration = values
+        self.path_starts.append(len(self.points) // 3)
+        self.path_counts.append(len(flat_points) // 3)
+        self.points.extend(flat_points)
+        self.times.append(event_time)
+        self.types.append(type_code)
+        self.buttons.append(button_code)
+        self.key_ids.append(key_id)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.end_xs.append(end_x)
+        self.end_ys.append(end_y)
+        self.durations.append(duration)
+
+    def _path(self, index: int) -> list[list[float]]:
+        start = self.path_starts[index] * 3
+        flat = self.points[start:start + self.path_counts[index] * 3]
+        return [list(flat[i:i + 3]) for i in range(0, len(flat), 3)]
+
+    def event(self, index: int) -> dict:
+        """Rebuild one event dict in the timeline JSON format."""
+        event_type = EVENT_TYPE_CODES[self.types[index]]
+        event: dict = {"time": self.times[index], "type": event_type}
+        if event_type in ("key_press", "key_release"):
+            event["key"] = self.keys[self.key_ids[index]]
+            return event
+        if event_type == "tap":
+            event.update(key=self.keys[self.key_ids[index]], duration=self.durations[index])
+            return event
+        if event_type == "chord":
+            # Modifier names contain no "+", so the first button-count parts are the modifiers
+            count = self.buttons[index]
+            *modifiers, key_name = self.keys[self.key_ids[index]].split("+", count)
+            event.update(modifiers=modifiers, key=key_name, duration=self.durations[index])
+            return event
+        if event_type == "mouse_path":
+            event.update(duration=self.durations[index], points=self._path(index))
+            return event
+        button = BUTTON_CODES[self.buttons[index]]
+        if event_type == "drag":
+            event.update(
+                start_x=self.xs[index],
+                start_y=self.ys[index],
+                end_x=self.end_xs[index],
+                end_y=self.end_ys[index],
+                button=button,
+                duration=self.durations[index],
+            )
+            if self.path_counts[index]:
+                event["path"] = self._path(index)
+        else:
+            event.update(x=self.xs[index], y=self.ys[index], button=button)
+            if event_type == "hold":
+                event["duration"] = self.durations[index]
+        return event
+
+    def time_order(self) -> list[int]:
+        """
+        Event indexes sorted by time (stable).
+
+        Events are appended when they are complete, not when they started, so a
+        mouse_path or a collapsed tap can land after later events.
+        """
+        return sorted(range(len(self)), key=self.times.__getitem__)
+
+    def to_timeline(self, order: list[int] | None = None) -> list[dict]:
+        """Events as timeline dicts, in append order or in the given index order."""
+        return [self.event(index) for index in (range(len(self)) if order is None else order)]
+
+    def close(self, discard: bool = False) -> None:
+        """Close the journal; discard=True deletes it (after the recording was saved)."""
+        with self._lock:
+            self._close_journal()
+        if discard and self.journal_path is not None and self.journal_path.exists():
+            self.journal_path.unlink()
+
+    def _close_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            self._journal = None
+
+    @classmethod
+    def from_journal(cls, path: Path | str) -> "EventBuffer":
+        """Read a journal back; a record cut off by a crash ends the recovery."""
+        buffer = cls()
+        with Path(path).open("rb") as f:
+            if f.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+                raise ValueError(f"Not a recording journal: {path}")
+            keys: dict[int, str] = {}
+            pending_points: tuple = ()
+            while True:
+                tag = f.read(1)
+                if tag == b"K":
+                    header = f.read(KEY_HEADER.size)
+                    if len(header) < KEY_HEADER.size:
+                        break
+                    key_id, length = KEY_HEADER.unpack(header)
+                    encoded = f.read(length)
+                    if len(encoded) < length:
+                        break
+                    keys[key_id] = encoded.decode("utf-8", errors="replace")
+                elif tag == b"P":
+                    header = f.read(POINT_COUNT.size)
+                    if len(header) < POINT_COUNT.size:
+                        break
+                    (count,) = POINT_COUNT.unpack(header)
+                    data = f.read(count * 3 * 8)
+                    if len(data) < count * 3 * 8:
+                        break
+                    pending_points = struct.unpack(f"<{count * 3}d", data)
+                elif tag == b"E":
+                    record = f.read(EVENT_RECORD.size)
+                    if len(record) < EVENT_RECORD.size:
+                        break
+                    buffer._append_values(EVENT_RECORD.unpack(record), pending_points)
+                    pending_points = ()
+                else:
+                    break
+        buffer.keys = [keys.get(key_id, "?") for key_id in range(max(keys, default=-1) + 1)]
+        buffer._key_ids = {key_name: key_id for key_id, key_name in enumerate(buffer.keys)}
+        return buffer
+
+
+def recover_journal(config_path: Path | str) -> dict | None:
+    """
+    Recover the timeline of an interrupted recording into config_path.
+
+    Returns:
+        {"timeline": [...]} or None if there is no journal
+    """
+    path = journal_path(config_path)
+    if not path.exists():
+        return None
+    buffer = EventBuffer.from_journal(path)
+    logger.info(f"Recovered {len(buffer)} events from {path}")
+    return {"timeline": buffer.to_timeline(buffer.time_order())}
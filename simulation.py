@@ -0,0 +1,213 @@
+"""
+Dry-run simulation - plays timeline and composite configs on a virtual clock.
+
+Sleeps advance a VirtualClock instead of waiting, input goes to a recording
+backend and processor events are replaced by stubs that take a configurable
+simulated duration. A full composite finishes in milliseconds and reports the
+projected wall time per step, the longest-running events and the input count.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from automation import (
+    CompositeState,
+    VirtualClock,
+    clear_composite_break,
+    consume_composite_break,
+    describe_composite_item,
+    get_speed_profile,
+    load_steps,
+    run_composite_item,
+    set_clock,
+    set_input_backend,
+    set_speed_profile,
+    sleep_or_stop,
+)
+from processors.registry import EventContext, set_handler_override
+from workspace import composite_item_paths, refresh_workspace
+
+
+# Simulated seconds per processor event (override per event with "simulated_duration")
+DEFAULT_PROCESSOR_DURATIONS = {
+    "goods_ocr": 3.0,
+    "home_assist_ocr": 5.0,
+    "item_drag": 8.0,
+    "qingbao_loop": 60.0,
+    "plants_loop": 30.0,
+    "clues_ocr": 10.0,
+    "receive_clue_ocr": 0.5,
+    "gift_choice_ocr": 0.5,
+    "collection_max_ocr": 0.5,
+    "find_npc_ocr": 5.0,
+    "visual_wait": 1.0,
+}
+
+# Leading delay of a top-level run_config() call
+TOP_LEVEL_DELAY = 0.5
+
+
+class RecordingInputBackend:
+    """Input backend that records injected events instead of sending them."""
+
+    def __init__(self, clock: VirtualClock) -> None:
+        self.clock = clock
+        self.events: list[tuple[float, dict]] = []
+        self.batches = 0
+
+    def __call__(self, events: list[dict]) -> None:
+        self.batches += 1
+        for event in events:
+            self.events.append((self.clock.monotonic(), event))
+
+
+def load_processor_durations(path: Path | str) -> dict[str, float]:
+    """Load {event_type: seconds} overrides from a JSON file."""
+    with Path(path).open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {str(key): float(value) for key, value in data.items()}
+
+
+def _describe_branch(branch: dict) -> str:
+    events = branch["events"]
+    if len(events) > 1:
+        return f"batch of {len(events)} inputs"
+    event = events[0]
+    detail = event.get("key") or event.get("config") or event.get("template") or ""
+    return f"{event.get('type')} {detail}".strip()
+
+
+def simulate_config(
+    config_path: Path | str,
+    speed_profile: dict | None = None,
+    processor_durations: dict[str, float] | None = None,
+) -> dict:
+    """
+    Simulate a timeline or composite config without touching the game.
+
+    Args:
+        config_path: Timeline or composite config file
+        speed_profile: Speed profile to simulate (defaults to the active profile)
+        processor_durations: Simulated seconds per processor event type, merged over
+            DEFAULT_PROCESSOR_DURATIONS
+
+    Returns:
+        dict with keys:
+        - total_time: Projected wall time in seconds
+        - steps: [{name, path, start, duration, longest_event, error}] per top-level step
+        - longest_events: The longest single worker (event branch) of each step,
+          longest first, [{step, event, start, duration}]
+        - input_count / input_batches: Injected input events and backend calls
+        - processor_time: Simulated seconds per processor event type
+    """
+    durations = dict(DEFAULT_PROCESSOR_DURATIONS)
+    durations.update(processor_durations or {})
+    processor_time: dict[str, float] = {}
+
+    clock = VirtualClock()
+    backend = RecordingInputBackend(clock)
+
+    def simulated_handler(event: dict, context: EventContext) -> None:
+        event_type = event.get("type")
+        duration = float(event.get("simulated_duration", durations.get(event_type, 1.0)))
+        processor_time[event_type] = processor_time.get(event_type, 0.0) + duration
+        sleep_or_stop(duration, context.stop_check)
+
+    config_path = Path(config_path)
+    data = load_steps(config_path)
+    if isinstance(data, dict) and data.get("type") == "composite":
+        items = data.get("configs", [])
+    else:
+        items = [{"config": str(config_path)}]
+
+    previous_profile = get_speed_profile()
+    steps: list[dict] = []
+    longest_events: list[dict] = []
+    state = CompositeState()
+    workspace = refresh_workspace()
+    set_clock(clock)
+    set_input_backend(backend)
+    set_handler_override(simulated_handler)
+    try:
+        if speed_profile is not None:
+            set_speed_profile(**speed_profile)
+        clear_composite_break()
+        clock.sleep(TOP_LEVEL_DELAY)
+
+        for item in items:
+            item_paths = composite_item_paths(item)
+            if not item_paths:
+                continue
+            step = {
+                "name": describe_composite_item(item),
+                "path": item_paths[0],
+                "start": clock.monotonic(),
+                "duration": 0.0,
+                "longest_event": None,
+                "error": None,
+            }
+            first_branch = len(clock.branches)
+            try:
+                missing = [path for path in item_paths if workspace.resolve(path) is None]
+                if missing:
+                    raise FileNotFoundError(f"Config not found: {missing[0]}")
+                run_composite_item(item, log_callback=lambda line: None, depth=1, state=state)
+            except Exception as e:
+                step["error"] = str(e)
+            step["duration"] = clock.monotonic() - step["start"]
+
+            branches = [
+                branch for branch in clock.branches[first_branch:]
+                if branch["end"] > branch["start"]
+            ]
+            if branches:
+                longest = max(branches, key=lambda branch: branch["end"] - branch["start"])
+                step["longest_event"] = _describe_branch(longest)
+                longest_events.append({
+                    "step": step["name"],
+                    "event": step["longest_event"],
+                    "start": longest["start"],
+                    "duration": longest["end"] - longest["start"],
+                })
+            steps.append(step)
+
+            # A collection check may end the composite early; stubs never request it
+            if consume_composite_break():
+                break
+    finally:
+        set_handler_override(None)
+        set_input_backend(None)
+        set_clock(None)
+        set_speed_profile(**previous_profile)
+
+    longest_events.sort(key=lambda item: item["duration"], reverse=True)
+    return {
+        "total_time": clock.monotonic(),
+        "steps": steps,
+        "longest_events": longest_events,
+        "input_count": len(backend.events),
+        "input_batches": backend.batches,
+        "processor_time": processor_time,
+    }
+
+
+def format_report(result: dict, limit: int = 10) -> str:
+    """Render a simulate_config() result as plain text."""
+    lines = [f"Projected total: {result['total_time']:.1f}s"]
+    for step in result["steps"]:
+        line = f"  {step['start']:8.1f}s  {step['duration']:7.1f}s  {step['name']}"
+        if step["error"]:
+            line += f"  [error: {step['error']}]"
+        lines.append(line)
+    lines.append(f"Inputs: {result['input_count']} in {result['input_batches']} batches")
+    if result["processor_time"]:
+        lines.append("Processor time:")
+        for event_type, seconds in sorted(result["processor_time"].items(), key=lambda item: -item[1]):
+            lines.append(f"  {seconds:8.1f}s  {event_type}")
+    if result["longest_events"]:
+        lines.append("Longest events:")
+        for item in result["longest_events"][:limit]:
+            lines.append(f"  {item['duration']:8.1f}s  {item['step']}: {item['event']}")
+    return "\n".join(lines)
@@ -0,0 +1,566 @@
+"""
+Timeline tools - offline analysis and rewriting of recorded configs.
+
+Usage:
+    python timeline_tools.py analyze configs --sort idle
+    python timeline_tools.py analyze configs/倒货 --format csv > report.csv
+    python timeline_tools.py keyframe-waits configs/基建快递/谷地派单.json
+    python timeline_tools.py keyframe-checkpoints configs/倒货/武陵倒货.json
+    python timeline_tools.py collapse-taps configs --in-place
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import statistics
+import sys
+from pathlib import Path
+
+from automation import (
+    INPUT_EVENT_TYPES,
+    _schedule_end,
+    compute_schedule,
+    load_steps,
+)
+from key_taps import collapse_taps
+from keyframes import DEFAULT_HASH_THRESHOLD, dhash, load_keyframes, save_keyframes
+from simulation import DEFAULT_PROCESSOR_DURATIONS
+from workspace import CONFIGS_DIR, composite_item_paths, get_workspace
+
+# Gaps shorter than this are not reported as idle
+DEFAULT_IDLE_THRESHOLD = 0.5
+
+# Same key pressed again within this many seconds of its release counts as a double tap
+DOUBLE_TAP_WINDOW = 0.1
+
+# Bounds of the suggested max_gap
+SUGGESTED_MAX_GAP_RANGE = (0.3, 1.5)
+
+# Keyframe-wait conversion: minimum gap converted, timeout margin and delay kept after the previous event
+KEYFRAME_WAIT_MIN_GAP = 1.0
+KEYFRAME_WAIT_MARGIN = 0.5
+KEYFRAME_WAIT_SETTLE = 0.05
+
+# --sort choices and the report field each sorts by
+SORT_KEYS = {
+    "name": "name",
+    "duration": "duration",
+    "idle": "idle",
+    "savings": "savings",
+    "processor": "processor_time",
+    "redundant": "redundant_count",
+    "inputs": "inputs",
+}
+
+
+def _compressible_gaps(timeline: list[dict]) -> list[tuple[float, dict]]:
+    """(gap, following event) for every gap compute_schedule() is allowed to compress."""
+    recorded = compute_schedule(timeline, {"scale": 1.0})
+    compressed = compute_schedule(timeline, {"scale": 0.0})
+    gaps = []
+    prev_recorded = prev_compressed = 0.0
+    for (recorded_time, event), (compressed_time, _) in zip(recorded, compressed):
+        gap = (recorded_time - prev_recorded) - (compressed_time - prev_compressed)
+        if gap > 1e-9:
+            gaps.append((gap, event))
+        prev_recorded, prev_compressed = recorded_time, compressed_time
+    return gaps
+
+
+def _processor_time(timeline: list[dict]) -> tuple[int, float]:
+    """
+    Count of processor/config events and the time reserved for them.
+
+    The reserved time is the recorded gap to the next event; a trailing processor
+    event (the usual case) is counted with its simulated default duration.
+    """
+    events = sorted(timeline, key=lambda e: float(e.get("time", 0)))
+    count = 0
+    reserved = 0.0
+    for index, event in enumerate(events):
+        if event.get("type") in INPUT_EVENT_TYPES:
+            continue
+        count += 1
+        if index + 1 < len(events):
+            reserved += float(events[index + 1].get("time", 0)) - float(event.get("time", 0))
+        else:
+            reserved += float(event.get("simulated_duration", DEFAULT_PROCESSOR_DURATIONS.get(event.get("type"), 0.0)))
+    return count, reserved
+
+
+def find_redundant_inputs(timeline: list[dict]) -> list[dict]:
+    """
+    Key events that add nothing to playback.
+
+    Reports releases of keys that are not held, presses of keys that are already
+    held (auto-repeat) and press/release pairs repeating the previous pair of the
+    same key within DOUBLE_TAP_WINDOW.
+    """
+    events = sorted(timeline, key=lambda e: float(e.get("time", 0)))
+    held: dict[str, int] = {}
+    last_release: dict[str, float] = {}
+    redundant = []
+    for event in events:
+        event_type = event.get("type")
+        key_name = event.get("key")
+        event_time = float(event.get("time", 0))
+        if event_type == "key_press":
+            if held.get(key_name, 0) > 0:
+                redundant.append({"time": event_time, "key": key_name, "reason": "press while held"})
+            elif event_time - last_release.get(key_name, float("-inf")) <= DOUBLE_TAP_WINDOW:
+                redundant.append({"time": event_time, "key": key_name, "reason": "double tap"})
+            held[key_name] = held.get(key_name, 0) + 1
+        elif event_type == "key_release":
+            if held.get(key_name, 0) <= 0:
+                redundant.append({"time": event_time, "key": key_name, "reason": "release without press"})
+                continue
+            held[key_name] -= 1
+            last_release[key_name] = event_time
+    return redundant
+
+
+def suggest_speed_profile(gaps: list[float]) -> dict:
+    """Cap idle gaps at their median, within SUGGESTED_MAX_GAP_RANGE."""
+    low, high = SUGGESTED_MAX_GAP_RANGE
+    meaningful = [gap for gap in gaps if gap >= 0.1]
+    if not meaningful:
+        return {"scale": 1.0, "max_gap": None, "min_gap": 0.0}
+    return {"scale": 1.0, "max_gap": round(min(high, max(low, statistics.median(meaningful))), 2), "min_gap": 0.0}
+
+
+def analyze_timeline(data: dict, idle_threshold: float = DEFAULT_IDLE_THRESHOLD) -> dict:
+    """
+    Analyze one timeline config.
+
+    Returns:
+        dict with duration, events, inputs, idle (compressible seconds), idle_gaps
+        (gaps >= idle_threshold), max_gap, processor_events, processor_time,
+        redundant (list) and redundant_count, suggested_profile, projected and savings (under the suggestion)
+    """
+    timeline = data.get("timeline", [])
+    gaps = _compressible_gaps(timeline)
+    gap_lengths = [gap for gap, _ in gaps]
+    processor_events, processor_time = _processor_time(timeline)
+    profile = suggest_speed_profile(gap_lengths)
+    duration = _schedule_end(compute_schedule(timeline, {"scale": 1.0}))
+    projected = _schedule_end(compute_schedule(timeline, profile))
+    redundant = find_redundant_inputs(timeline)
+    return {
+        "duration": duration,
+        "events": len(timeline),
+        "inputs": sum(1 for event in timeline if event.get("type") in INPUT_EVENT_TYPES),
+        "idle": sum(gap_lengths),
+        "idle_gaps": [
+            {"time": float(event.get("time", 0)), "gap": gap, "before": event.get("type")}
+            for gap, event in gaps if gap >= idle_threshold
+        ],
+        "max_gap": max(gap_lengths, default=0.0),
+        "processor_events": processor_events,
+        "processor_time": processor_time,
+        "redundant": redundant,
+        "redundant_count": len(redundant),
+        "suggested_profile": profile,
+        "projected": projected,
+        "savings": duration - projected,
+    }
+
+
+# Report fields summed over the steps of a composite
+SUMMED_FIELDS = ("duration", "events", "inputs", "idle", "processor_events", "processor_time", "redundant_count")
+
+
+class TimelineAnalyzer:
+    """
+    Analyzes configs, caching one report per file.
+
+    Composite reports sum their steps: repeat blocks are multiplied, repeat_while
+    and if blocks count each referenced config once. Their suggested profile is
+    derived from the gaps of all steps and projected over every step.
+    """
+
+    def __init__(self, idle_threshold: float = DEFAULT_IDLE_THRESHOLD) -> None:
+        self.idle_threshold = idle_threshold
+        self.reports: dict[Path, dict] = {}
+        self._timelines: dict[Path, list[dict]] = {}
+        self._gaps: dict[Path, list[float]] = {}
+
+    def analyze(self, config_path: Path | str, _stack: tuple = ()) -> dict:
+        """
+        Analyze a timeline or composite config.
+
+        Returns:
+            Report dict with name and kind ("timeline" / "composite" / "other" / "error");
+            see analyze_timeline() for the fields (composites omit the per-event lists
+            and add unresolved, the count of references that could not be followed)
+        """
+        path = Path(config_path)
+        if path in self.reports:
+            return self.reports[path]
+
+        try:
+            data = load_steps(path)
+        except (OSError, ValueError) as e:
+            report = {"name": str(path), "kind": "error", "error": str(e)}
+        else:
+            if isinstance(data, dict) and data.get("type") == "composite":
+                report = self._analyze_composite(path, data.get("configs", []), _stack + (path,))
+            elif isinstance(data, dict) and "timeline" in data:
+                timeline = data.get("timeline", [])
+                self._timelines[path] = timeline
+                self._gaps[path] = [gap for gap, _ in _compressible_gaps(timeline)]
+                report = {"name": str(path), "kind": "timeline", **analyze_timeline(data, self.idle_threshold)}
+            else:
+                report = {"name": str(path), "kind": "other"}
+        self.reports[path] = report
+        return report
+
+    def _leaves(self, items: list, stack: tuple, multiplier: int = 1) -> tuple[list[tuple[Path, int]], int]:
+        """Timeline files reachable from composite items with their repeat counts, and the unresolved count."""
+        leaves: list[tuple[Path, int]] = []
+        unresolved = 0
+        for item in items:
+            item_multiplier = multiplier
+            if isinstance(item, dict) and "repeat" in item:
+                item_multiplier *= max(0, int(item["repeat"]))
+            for reference in composite_item_paths(item):
+                path = get_workspace().resolve(reference)
+                if path is None or path in stack:
+                    unresolved += 1
+                    continue
+                report = self.analyze(path, stack)
+                if report["kind"] == "timeline":
+                    leaves.append((path, item_multiplier))
+                elif report["kind"] == "composite":
+                    child_leaves, child_unresolved = self._leaves(
+                        load_steps(path).get("configs", []), stack + (path,), item_multiplier
+                    )
+                    leaves.extend(child_leaves)
+                    unresolved += child_unresolved
+                else:
+                    unresolved += 1
+        return leaves, unresolved
+
+    def _analyze_composite(self, path: Path, items: list, stack: tuple) -> dict:
+        leaves, unresolved = self._leaves(items, stack)
+        report = {"name": str(path), "kind": "composite", **{field: 0 for field in SUMMED_FIELDS}}
+        report["max_gap"] = 0.0
+        gaps: list[float] = []
+        for leaf, multiplier in leaves:
+            leaf_report = self.reports[leaf]
+            for field in SUMMED_FIELDS:
+                report[field] += leaf_report[field] * multiplier
+            report["max_gap"] = max(report["max_gap"], leaf_report["max_gap"])
+            gaps.extend(self._gaps[leaf] * multiplier)
+
+        profile = suggest_speed_profile(gaps)
+        projected = sum(
+            _schedule_end(compute_schedule(self._timelines[leaf], profile)) * multiplier
+            for leaf, multiplier in leaves
+        )
+        report.update({
+            "unresolved": unresolved,
+            "suggested_profile": profile,
+            "projected": projected,
+            "savings": report["duration"] - projected,
+        })
+        return report
+
+
+def _config_files(paths: list[Path | str]) -> list[Path]:
+    """Config files under the given files/directories (skipping user_settings.json)."""
+    config_files: list[Path] = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            config_files.extend(sorted(p for p in path.rglob("*.json") if p.name != "user_settings.json"))
+        else:
+            config_files.append(path)
+    return config_files
+
+
+def analyze_tree(paths: list[Path | str], idle_threshold: float = DEFAULT_IDLE_THRESHOLD) -> list[dict]:
+    """Analyze every config under the given files/directories (skipping user_settings.json)."""
+    analyzer = TimelineAnalyzer(idle_threshold)
+    return [analyzer.analyze(path) for path in _config_files(paths)]
+
+
+def _keyframe_hash(keyframe: dict, region: list[float] | None) -> int:
+    """dHash of a keyframe, or of the part of its thumbnail inside a relative region."""
+    if not region:
+        return keyframe["hash"]
+    thumbnail = keyframe["thumbnail"]
+    height, width = thumbnail.shape[:2]
+    x1, x2 = int(region[0] * width), max(int(region[0] * width) + 1, int(round(region[2] * width)))
+    y1, y2 = int(region[1] * height), max(int(region[1] * height) + 1, int(round(region[3] * height)))
+    return dhash(thumbnail[y1:y2, x1:x2])
+
+
+def convert_to_keyframe_waits(
+    data: dict,
+    keyframes: list[dict],
+    min_gap: float = KEYFRAME_WAIT_MIN_GAP,
+    margin: float = KEYFRAME_WAIT_MARGIN,
+    settle: float = KEYFRAME_WAIT_SETTLE,
+    max_distance: int = DEFAULT_HASH_THRESHOLD,
+    region: list[float] | None = None,
+) -> tuple[dict, dict]:
+    """
+    Replace recorded delays before inputs with waits for the recorded screen.
+
+    Every compressible gap (see compute_schedule) of at least min_gap before an
+    input that has a keyframe becomes a visual_wait with until="keyframe", placed
+    settle seconds after the previous event with a timeout of gap * (1 + margin).
+    The input and all later events move earlier by the removed delay; run_timeline
+    shifts them back by however long each wait actually takes.
+
+    Args:
+        data: Timeline config
+        keyframes: load_keyframes() result for the config
+        region: Optional relative [x1, y1, x2, y2] region the waits compare
+
+    Returns:
+        (converted config, {"waits": count, "removed": seconds of fixed delay removed})
+    """
+    timeline = data.get("timeline", [])
+    keyframe_by_event = {
+        id(timeline[keyframe["event"]]): keyframe for keyframe in keyframes if keyframe["event"] < len(timeline)
+    }
+    compressible = {id(event): gap for gap, event in _compressible_gaps(timeline)}
+
+    converted: list[dict] = []
+    shift = 0.0
+    prev_time = 0.0
+    waits = 0
+    for event in sorted(timeline, key=lambda e: float(e.get("time", 0))):
+        event_time = float(event.get("time", 0))
+        keyframe = keyframe_by_event.get(id(event))
+        gap = event_time - prev_time
+        if keyframe is not None and compressible.get(id(event), 0.0) >= min_gap and gap > settle:
+            wait = {
+                "time": round(prev_time + shift + settle, 3),
+                "type": "visual_wait",
+                "until": "keyframe",
+                "hash": f"{_keyframe_hash(keyframe, region):016x}",
+                "max_distance": max_distance,
+                "timeout": round(gap * (1 + margin), 3),
+            }
+            if region:
+                wait["region"] = list(region)
+            converted.append(wait)
+            shift -= gap - settle
+            waits += 1
+        converted.append({**event, "time": round(event_time + shift, 3)})
+        prev_time = event_time
+
+    return {**data, "timeline": converted}, {"waits": waits, "removed": -shift}
+
+
+def add_keyframe_checkpoints(
+    data: dict,
+    keyframes: list[dict],
+    min_gap: float = KEYFRAME_WAIT_MIN_GAP,
+    max_distance: int = DEFAULT_HASH_THRESHOLD,
+    retries: int = 2,
+    region: list[float] | None = None,
+) -> tuple[dict, int]:
+    """
+    Turn inputs after long gaps into checkpoint events.
+
+    Every input with a keyframe that follows a compressible gap of at least
+    min_gap gets an "expect" condition on its keyframe, so run_timeline aborts
+    with a DesyncError instead of clicking into a screen that is still loading.
+
+    Returns:
+        (config with checkpoints, number of checkpoints added)
+    """
+    timeline = data.get("timeline", [])
+    compressible = {id(event): gap for gap, event in _compressible_gaps(timeline)}
+    expectations: dict[int, dict] = {}
+    for keyframe in keyframes:
+        if keyframe["event"] >= len(timeline):
+            continue
+        event = timeline[keyframe["event"]]
+        if compressible.get(id(event), 0.0) < min_gap:
+            continue
+        expect = {
+            "hash": f"{_keyframe_hash(keyframe, region):016x}",
+            "max_distance": max_distance,
+            "retries": retries,
+        }
+        if region:
+            expect["region"] = list(region)
+        expectations[id(event)] = expect
+
+    converted = [{**event, "expect": expectations[id(event)]} if id(event) in expectations else event for event in timeline]
+    return {**data, "timeline": converted}, len(expectations)
+
+
+def convert_to_taps(data: dict) -> tuple[dict, dict]:
+    """
+    Replace key press/release groups with tap and chord events (see key_taps.py).
+
+    Returns:
+        (converted config, {"taps", "chords", "removed": events removed, "index_map": old -> new event index})
+    """
+    timeline = data.get("timeline", [])
+    converted, index_map = collapse_taps(timeline)
+    stats = {
+        "taps": sum(1 for event in converted if event.get("type") == "tap"),
+        "chords": sum(1 for event in converted if event.get("type") == "chord"),
+        "removed": len(timeline) - len(converted),
+        "index_map": index_map,
+    }
+    return {**data, "timeline": converted}, stats
+
+
+def _sort_value(report: dict, key: str):
+    if key == "name":
+        return report["name"]
+    return report.get(SORT_KEYS[key], 0) or 0
+
+
+def format_table(reports: list[dict]) -> str:
+    header = f"{'duration':>9} {'idle':>8} {'max gap':>8} {'proc':>8} {'savings':>8} {'inputs':>6} {'redund':>6} {'max_gap*':>8}  config"
+    lines = [header]
+    for report in reports:
+        if report.get("kind") not in ("timeline", "composite"):
+            continue
+        suggested = report.get("suggested_profile", {}).get("max_gap")
+        lines.append(
+            f"{report['duration']:9.1f} {report['idle']:8.1f} {report['max_gap']:8.1f} "
+            f"{report['processor_time']:8.1f} {report['savings']:8.1f} {report['inputs']:6d} "
+            f"{report['redundant_count']:6d} {'-' if suggested is None else f'{suggested:.2f}':>8}  "
+            f"{report['name']}{' (composite)' if report['kind'] == 'composite' else ''}"
+        )
+    lines.append("* suggested max_gap; savings are projected under the suggested profile")
+    return "\n".join(lines)
+
+
+CSV_FIELDS = (
+    "name", "kind", "duration", "idle", "max_gap", "processor_events", "processor_time",
+    "inputs", "redundant_count", "projected", "savings", "unresolved",
+)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline tools for recorded timeline configs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    analyze_parser = subparsers.add_parser("analyze", help="Report duration, idle gaps and compression opportunities")
+    analyze_parser.add_argument("paths", nargs="*", default=[str(CONFIGS_DIR)], help="Config files or directories")
+    analyze_parser.add_argument("--sort", choices=list(SORT_KEYS), default="idle", help="Sort column (descending except name)")
+    analyze_parser.add_argument("--limit", type=int, help="Only show the first N rows")
+    analyze_parser.add_argument("--idle-threshold", type=float, default=DEFAULT_IDLE_THRESHOLD)
+    analyze_parser.add_argument("--format", choices=("table", "csv", "json"), default="table")
+
+    waits_parser = subparsers.add_parser(
+        "keyframe-waits", help="Rewrite recorded delays as waits for the recorded keyframes"
+    )
+    waits_parser.add_argument("config", help="Timeline config with a .keyframes sidecar")
+    waits_parser.add_argument("-o", "--output", help="Output config (default: <name>_waits.json)")
+    waits_parser.add_argument("--min-gap", type=float, default=KEYFRAME_WAIT_MIN_GAP, help="Shortest gap to convert")
+    waits_parser.add_argument("--margin", type=float, default=KEYFRAME_WAIT_MARGIN, help="Timeout = gap * (1 + margin)")
+    waits_parser.add_argument("--settle", type=float, default=KEYFRAME_WAIT_SETTLE, help="Delay kept before each wait")
+    waits_parser.add_argument("--max-distance", type=int, default=DEFAULT_HASH_THRESHOLD, help="Accepted dHash distance")
+    waits_parser.add_argument("--region", type=float, nargs=4, metavar=("X1", "Y1", "X2", "Y2"),
+                              help="Relative region to compare instead of the whole screen")
+
+    checkpoints_parser = subparsers.add_parser(
+        "keyframe-checkpoints", help="Check the recorded keyframe before inputs that follow long gaps"
+    )
+    checkpoints_parser.add_argument("config", help="Timeline config with a .keyframes sidecar")
+    checkpoints_parser.add_argument("-o", "--output", help="Output config (default: <name>_checked.json)")
+    checkpoints_parser.add_argument("--min-gap", type=float, default=KEYFRAME_WAIT_MIN_GAP, help="Shortest preceding gap")
+    checkpoints_parser.add_argument("--max-distance", type=int, default=DEFAULT_HASH_THRESHOLD, help="Accepted dHash distance")
+    checkpoints_parser.add_argument("--retries", type=int, default=2, help="Extra captures before aborting")
+    checkpoints_parser.add_argument("--region", type=float, nargs=4, metavar=("X1", "Y1", "X2", "Y2"),
+                                    help="Relative region to compare instead of the whole screen")
+
+    taps_parser = subparsers.add_parser(
+        "collapse-taps", help="Rewrite key press/release pairs as tap and chord events"
+    )
+    taps_parser.add_argument("paths", nargs="+", help="Timeline config files or directories")
+    taps_parser.add_argument("-o", "--output", help="Output config for a single input (default: <name>_taps.json)")
+    taps_parser.add_argument("--in-place", action="store_true", help="Overwrite the configs")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "collapse-taps":
+        config_files = _config_files(args.paths)
+        if args.output and (len(config_files) != 1 or args.in_place):
+            print("--output needs a single config and no --in-place", file=sys.stderr)
+            return 2
+        for config_path in config_files:
+            data = load_steps(config_path)
+            if not isinstance(data, dict) or "timeline" not in data:
+                print(f"Skipped (not a timeline config): {config_path}")
+                continue
+            converted, stats = convert_to_taps(data)
+            if not stats["removed"]:
+                print(f"No key pairs to collapse: {config_path}")
+                continue
+            if args.in_place:
+                output = config_path
+            else:
+                output = Path(args.output) if args.output else config_path.with_name(f"{config_path.stem}_taps.json")
+            # Keyframes refer to events by index; move them to the collapsed events
+            keyframes = load_keyframes(config_path, data["timeline"])
+            for keyframe in keyframes:
+                keyframe["event"] = stats["index_map"][keyframe["event"]]
+            with output.open("w", encoding="utf-8") as f:
+                json.dump(converted, f, ensure_ascii=False, indent=2)
+            if keyframes:
+                save_keyframes(output, keyframes, converted["timeline"])
+            print(
+                f"{stats['taps']} taps, {stats['chords']} chords, "
+                f"{len(data['timeline'])} -> {len(converted['timeline'])} events -> {output}"
+            )
+        return 0
+
+    if args.command in ("keyframe-waits", "keyframe-checkpoints"):
+        config_path = Path(args.config)
+        data = load_steps(config_path)
+        if not isinstance(data, dict) or "timeline" not in data:
+            print(f"Not a timeline config: {config_path}", file=sys.stderr)
+            return 2
+        keyframes = load_keyframes(config_path, data["timeline"])
+        if not keyframes:
+            print(f"No keyframes recorded for {config_path}", file=sys.stderr)
+            return 2
+        if args.command == "keyframe-waits":
+            converted, stats = convert_to_keyframe_waits(
+                data, keyframes, args.min_gap, args.margin, args.settle, args.max_distance, args.region
+            )
+            output = Path(args.output) if args.output else config_path.with_name(f"{config_path.stem}_waits.json")
+            summary = f"{stats['waits']} waits replace {stats['removed']:.1f}s of fixed delay"
+        else:
+            converted, count = add_keyframe_checkpoints(
+                data, keyframes, args.min_gap, args.max_distance, args.retries, args.region
+            )
+            output = Path(args.output) if args.output else config_path.with_name(f"{config_path.stem}_checked.json")
+            summary = f"{count} checkpoints added"
+        with output.open("w", encoding="utf-8") as f:
+            json.dump(converted, f, ensure_ascii=False, indent=2)
+        print(f"{summary} -> {output}")
+        return 0
+
+    if args.command == "analyze":
+        reports = analyze_tree(args.paths, args.idle_threshold)
+        reports.sort(key=lambda report: _sort_value(report, args.sort), reverse=args.sort != "name")
+        if args.limit is not None:
+            reports = reports[:args.limit]
+        if args.format == "json":
+            json.dump(reports, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+        elif args.format == "csv":
+            writer = csv.DictWriter(sys.stdout, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(reports)
+        else:
+            print(format_table(reports))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
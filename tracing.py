@@ -0,0 +1,158 @@
+"""
+Execution tracing - records spans of a run in Chrome trace event format.
+
+Start a trace with start_trace() before a run and write it with stop_trace(); the
+resulting JSON opens in chrome://tracing or https://ui.perfetto.dev. While no trace
+is active, span() and add_span() cost a single global lookup.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from metrics import increment
+
+TRACE_DIR = Path("traces")
+
+logger = logging.getLogger("app")
+
+
+class TraceRecorder:
+    """Collects trace events of one run."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.events: list[dict] = []
+        self._named_threads: set[int] = set()
+        self._lock = threading.Lock()
+
+    def add_complete(self, name: str, category: str, start: float, end: float, args: dict) -> None:
+        thread = threading.current_thread()
+        tid = thread.ident or 0
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": max(0.0, end - start) * 1e6,
+            "pid": self.pid,
+            "tid": tid,
+        }
+        if args:
+            event["args"] = {key: _json_safe(value) for key, value in args.items()}
+        with self._lock:
+            if tid not in self._named_threads:
+                self._named_threads.add(tid)
+                self.events.append({
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self.pid,
+                    "tid": tid,
+                    "args": {"name": thread.name},
+                })
+            self.events.append(event)
+
+    def write(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            payload = {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+_TRACE: TraceRecorder | None = None
+
+
+def _json_safe(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def start_trace(path: Path | str | None = None) -> Path:
+    """
+    Start recording spans for a run.
+
+    Args:
+        path: Output file (defaults to traces/run_<timestamp>.json)
+
+    Returns:
+        Path the trace will be written to
+    """
+    global _TRACE
+    if path is None:
+        path = TRACE_DIR / f"run_{datetime.now():%Y%m%d_%H%M%S}.json"
+    _TRACE = TraceRecorder(Path(path))
+    return _TRACE.path
+
+
+def stop_trace() -> Path | None:
+    """Stop recording and write the trace file; returns its path (None if not tracing)."""
+    global _TRACE
+    trace, _TRACE = _TRACE, None
+    if trace is None:
+        return None
+    try:
+        trace.write()
+    except OSError as e:
+        logger.error(f"Failed to write trace {trace.path}: {e}")
+        return None
+    logger.info(f"Trace written: {trace.path} ({len(trace.events)} events)")
+    return trace.path
+
+
+def is_tracing() -> bool:
+    return _TRACE is not None
+
+
+def now() -> float:
+    """Timestamp for add_span()."""
+    return time.perf_counter()
+
+
+def add_span(name: str, category: str, start: float, end: float | None = None, **args) -> None:
+    """Record a span that started at start (from now()) and ends at end (default: now)."""
+    trace = _TRACE
+    if trace is None:
+        return
+    trace.add_complete(name, category, start, time.perf_counter() if end is None else end, args)
+
+
+@contextmanager
+def span(name: str, category: str = "run", **args) -> Iterator[None]:
+    """Record the enclosed block as a span on the current thread."""
+    trace = _TRACE
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_complete(name, category, start, time.perf_counter(), args)
+
+
+def trace_iterations(name: str, iterable: Iterable | None = None, category: str = "processor") -> Iterator:
+    """
+    Yield from iterable (default: 1, 2, 3, ...), recording one span per iteration.
+
+    Each span ends when the next item is requested or the loop exits. Iterations
+    are also counted in the "processor_iterations" metric under name.
+    """
+    for index, item in enumerate(itertools.count(1) if iterable is None else iterable, 1):
+        increment("processor_iterations", name)
+        with span(name, category, iteration=index):
+            yield item
@@ -0,0 +1,201 @@
+"""
+Workspace index - resolves config references used inside other configs.
+
+Composite steps, config_action events and processor events refer to configs by
+absolute Windows paths (D:\\Projects\\endfieldhelper\\configs\\...), by paths
+relative to the project or to configs/, or just by file name. The index scans
+configs/ once and resolves any of these forms with dictionary lookups.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+CONFIGS_DIR = Path("configs")
+
+# Event fields that reference other configs, per event type
+CONFIG_REFERENCE_FIELDS = {
+    "config_action": ("config",),
+    "qingbao_loop": ("config_found", "config_not_found"),
+    "gift_choice_ocr": ("config_if_template1", "config_if_template2"),
+}
+
+logger = logging.getLogger("app")
+
+
+def composite_item_paths(item) -> list[str]:
+    """Config paths referenced by a composite step, including those inside blocks, in order."""
+    if isinstance(item, str):
+        return [item]
+    if not isinstance(item, dict):
+        return []
+    if item.get("config"):
+        return [item["config"]]
+    paths: list[str] = []
+    for key in ("configs", "then", "else"):
+        for sub_item in item.get(key) or []:
+            paths.extend(composite_item_paths(sub_item))
+    return paths
+
+
+def _normalize(reference: str) -> str:
+    """Forward slashes, no leading "./", case-folded (Windows paths are case-insensitive)."""
+    normalized = str(reference).strip().replace("\\", "/")
+    while normalized.startswith("./"):
+        normalized = normalized[2:]
+    return normalized.casefold()
+
+
+class WorkspaceIndex:
+    """
+    Index of the config files under a configs/ directory.
+
+    Configs are keyed by their path relative to configs/ and by file name. A
+    reference resolves, in order, by:
+    1. its part after the last "configs/" (absolute paths from another checkout)
+    2. its path relative to configs/
+    3. the file itself, when it exists outside the workspace
+    4. its file name, when that name is unique in the workspace
+    """
+
+    def __init__(self, configs_dir: Path | str = CONFIGS_DIR) -> None:
+        self.configs_dir = Path(configs_dir)
+        self._by_relative: dict[str, Path] = {}
+        self._by_name: dict[str, list[Path]] = {}
+        self._resolved: dict[str, Path | None] = {}
+        self._lock = threading.Lock()
+        self._scan()
+
+    def _scan(self) -> None:
+        if not self.configs_dir.is_dir():
+            return
+        for root, _dirs, files in os.walk(self.configs_dir):
+            for file_name in files:
+                if not file_name.lower().endswith(".json"):
+                    continue
+                path = Path(root) / file_name
+                relative = path.relative_to(self.configs_dir).as_posix()
+                self._by_relative[_normalize(relative)] = path
+                self._by_name.setdefault(file_name.casefold(), []).append(path)
+
+    def __len__(self) -> int:
+        return len(self._by_relative)
+
+    def resolve(self, reference: Path | str | None) -> Path | None:
+        """Return the config file a reference points to, or None if it cannot be found."""
+        if not reference:
+            return None
+        key = str(reference)
+        with self._lock:
+            if key in self._resolved:
+                return self._resolved[key]
+        resolved = self._resolve_uncached(key)
+        with self._lock:
+            self._resolved[key] = resolved
+        return resolved
+
+    def _resolve_uncached(self, reference: str) -> Path | None:
+        normalized = _normalize(reference)
+
+        marker = "configs/"
+        position = normalized.rfind(marker)
+        if position != -1 and (position == 0 or normalized[position - 1] == "/"):
+            path = self._by_relative.get(normalized[position + len(marker):])
+            if path is not None:
+                return path
+
+        path = self._by_relative.get(normalized)
+        if path is not None:
+            return path
+
+        # Files outside the workspace (one stat per distinct reference)
+        candidate = Path(reference)
+        if candidate.is_file():
+            return candidate
+
+        matches = self._by_name.get(normalized.rsplit("/", 1)[-1], [])
+        if len(matches) == 1:
+            return matches[0]
+        if len(matches) > 1:
+            logger.warning(f"Ambiguous config reference {reference!r}: {len(matches)} files named {matches[0].name}")
+        return None
+
+    def references(self, config_path: Path | str) -> list[tuple[Path, str]]:
+        """
+        Every config reference reachable from a config, as (referencing file, reference).
+
+        Referenced configs that resolve are followed recursively.
+        """
+        found: list[tuple[Path, str]] = []
+        visited: set[Path] = set()
+        pending = [Path(config_path)]
+        while pending:
+            path = pending.pop()
+            if path in visited:
+                continue
+            visited.add(path)
+            try:
+                with path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not isinstance(data, dict):
+                continue
+
+            refs: list[str] = []
+            for item in data.get("configs", []) if data.get("type") == "composite" else []:
+                refs.extend(composite_item_paths(item))
+            for event in data.get("timeline", []):
+                for field in CONFIG_REFERENCE_FIELDS.get(event.get("type"), ()):
+                    if event.get(field):
+                        refs.append(event[field])
+
+            for ref in refs:
+                found.append((path, ref))
+                resolved = self.resolve(ref)
+                if resolved is not None:
+                    pending.append(resolved)
+        return found
+
+    def unresolved_references(self, config_path: Path | str) -> list[tuple[Path, str]]:
+        """References reachable from a config that do not resolve to a file."""
+        return [(source, ref) for source, ref in self.references(config_path) if self.resolve(ref) is None]
+
+
+_WORKSPACE: WorkspaceIndex | None = None
+_workspace_lock = threading.Lock()
+
+
+def get_workspace() -> WorkspaceIndex:
+    """Return the current workspace index, building it on first use."""
+    global _WORKSPACE
+    with _workspace_lock:
+        if _WORKSPACE is None:
+            _WORKSPACE = WorkspaceIndex()
+        return _WORKSPACE
+
+
+def refresh_workspace() -> WorkspaceIndex:
+    """Rebuild the workspace index (called once at the start of each run)."""
+    global _WORKSPACE
+    index = WorkspaceIndex()
+    with _workspace_lock:
+        _WORKSPACE = index
+    return index
+
+
+def resolve_config_path(reference: Path | str) -> Path | None:
+    """Resolve a config reference through the workspace index; None if it does not resolve."""
+    return get_workspace().resolve(reference)
+
+
+def format_unresolved(unresolved: list[tuple[Path, str]], limit: int = 10) -> str:
+    """One line per unresolved reference, for logs and dialogs."""
+    lines = [f"{source.name}: {ref}" for source, ref in unresolved[:limit]]
+    if len(unresolved) > limit:
+        lines.append(f"... and {len(unresolved) - limit} more")
+    return "\n".join(lines)